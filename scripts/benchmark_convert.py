@@ -0,0 +1,376 @@
+"""Benchmark convert_psd.py on synthetic banners.
+
+Builds PSDs that follow the layer naming the converter keys on (bg, logoArea,
+logo, contentArea, shape 1..6, hero/imageWrap, mainHeading, subHeading,
+offer, cta, contactWrap) and converts each one through the converter's own
+command line, in a fresh process, so cache lookups, the process pool and the
+zip write are measured as in production. Reports wall time, per-stage timings
+(where the converter writes a --timings report), peak RSS and output bytes.
+The PSDs are generated from a fixed seed, so result files from different
+commits can be compared:
+
+    python scripts/benchmark_convert.py -o before.json
+    git checkout my-branch
+    python scripts/benchmark_convert.py --compare before.json
+
+or, without switching branches, against an older converter:
+
+    git show HEAD~5:scripts/convert_psd.py > /tmp/convert_psd_old.py
+    python scripts/benchmark_convert.py --converter /tmp/convert_psd_old.py -o before.json
+
+The conversion and layer caches are disabled while benchmarking.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image, ImageDraw
+import psd_tools
+from psd_tools import PSDImage
+from psd_tools.api.layers import Group, PixelLayer
+from psd_tools.constants import Tag
+from psd_tools.psd.descriptor import DescriptorBlock, RawData, String
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("benchmark_convert")
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONVERTER = os.path.join(SCRIPTS_DIR, "convert_psd.py")
+DEFAULT_SIZES = "300x250,300x600,728x90,160x600"
+STAGES = ("spool", "parse", "render", "zip")
+# Stages faster than this are too noisy to flag as regressions.
+MIN_COMPARABLE_SECONDS = 0.005
+
+
+def _engine_string(text):
+    data = ("\ufeff" + text).encode("utf-16-be")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _engine_data(text, font, size, color):
+    """Minimal type-tool EngineData with one style run and one paragraph run."""
+    run_length = len(text) + 1
+    red, green, blue = (channel / 255 for channel in color)
+    style = (b"<< /StyleSheet << /StyleSheetData << /Font 0 /FontSize %.1f /Leading %.1f /FontCaps 0"
+             b" /FillColor << /Type 1 /Values [ 1.0 %.4f %.4f %.4f ] >> >> >> >>"
+             % (size, size * 1.2, red, green, blue))
+    paragraph = b"<< /ParagraphSheet << /Properties << /Justification 0 >> >> >>"
+    font_set = b"/FontSet [ << /Name " + _engine_string(font) + b" /Type 1 >> ]"
+    return (b"\n\n<< /EngineDict << /Editor << /Text " + _engine_string(text + "\r") + b" >>"
+            + b" /ParagraphRun << /RunArray [ " + paragraph + b" ] /RunLengthArray [ %d ] >>" % run_length
+            + b" /StyleRun << /RunArray [ " + style + b" ] /RunLengthArray [ %d ] >> >>" % run_length
+            + b" /ResourceDict << " + font_set + b" >> /DocumentResources << " + font_set + b" >> >>")
+
+
+def type_layer(parent, name, text, box, font="Lato-Bold", size=24, color=(255, 255, 255)):
+    """A type layer; psd_tools can't create these, so the TySh block is written by hand.
+
+    The pixels are a flat box in the text colour, which is all the converter
+    reads from them.
+    """
+    left, top, right, bottom = box
+    layer = PixelLayer.frompil(Image.new("RGBA", (right - left, bottom - top), color + (255,)),
+                               parent, name, top=top, left=left)
+    text_data = DescriptorBlock(classID=b"TxLr")
+    text_data[b"Txt "] = String(text)
+    text_data[b"EngineData"] = RawData(_engine_data(text, font, size, color))
+    layer._record.tagged_blocks.set_data(
+        Tag.TYPE_TOOL_OBJECT_SETTING, 1, (1.0, 0.0, 0.0, 1.0, float(left), float(top)), 50,
+        text_data, 1, DescriptorBlock(classID=b"warp"), 0, 0, right - left, bottom - top)
+    return layer
+
+
+def photo(rng, width, height):
+    """Smooth gradient plus noise, which compresses roughly like a photograph."""
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    base = rng.uniform(0, 255, 3).astype(np.float32)
+    pixels = base * (1 - x) * (1 - y) + (255 - base) * x * y + rng.normal(0, 12, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGBA")
+
+
+def build_banner_psd(path, width, height, shapes=6, hero_images=2, subheadings=2, hero_scale=3, seed=0):
+    """Write a synthetic banner PSD laid out the way the converter expects."""
+    rng = np.random.default_rng(seed)
+    psd = PSDImage.new("RGB", (width, height))
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (width, height), (18, 42, 120, 255)), psd, "bg"))
+
+    logo_box = (10, 10, width // 2, 10 + height // 8)
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (logo_box[2] - 10, logo_box[3] - 10), (255, 255, 255, 255)),
+                                  psd, "logoArea", top=10, left=10))
+    logo = Image.new("RGBA", (logo_box[2] - 14, logo_box[3] - 14), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse((0, 0, logo.width - 1, logo.height - 1), fill=(230, 30, 40, 255))
+    psd.append(PixelLayer.frompil(logo, psd, "logo", top=12, left=12))
+
+    content_top = height // 4
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (width - 20, height // 2), (0, 0, 0, 255)),
+                                  psd, "contentArea", top=content_top, left=10))
+
+    for index in range(1, shapes + 1):
+        shape_width, shape_height = max(8, width // 3), max(8, height // 6)
+        shape = Image.new("RGBA", (shape_width, shape_height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(shape)
+        fill = tuple(int(channel) for channel in rng.integers(0, 255, 3)) + (255,)
+        if index % 2:
+            draw.ellipse((0, 0, shape_width - 1, shape_height - 1), fill=fill)
+        else:
+            draw.polygon([(0, shape_height - 1), (shape_width // 2, 0), (shape_width - 1, shape_height - 1)], fill=fill)
+        psd.append(PixelLayer.frompil(shape, psd, f"shape {index}",
+                                      top=int(rng.integers(0, max(1, height - shape_height))),
+                                      left=int(rng.integers(0, max(1, width - shape_width)))))
+
+    # Hero photos are placed oversized and cut down to the imageWrap box.
+    hero = Group.new(psd, "hero")
+    wrap_box = (width // 8, height // 2, width - width // 8, height - height // 16)
+    for index in range(1, hero_images + 1):
+        image = photo(rng, (wrap_box[2] - wrap_box[0]) * hero_scale, (wrap_box[3] - wrap_box[1]) * hero_scale)
+        PixelLayer.frompil(image, hero, f"image{index}", top=wrap_box[1] - image.height // 3,
+                           left=wrap_box[0] - image.width // 3)
+    PixelLayer.frompil(Image.new("RGBA", (wrap_box[2] - wrap_box[0], wrap_box[3] - wrap_box[1]), (0, 255, 0, 255)),
+                       hero, "imageWrap", top=wrap_box[1], left=wrap_box[0])
+
+    line = max(12, height // 20)
+    text_roles = [("mainHeading", "Big seasonal sale")]
+    text_roles += [("subHeading", f"Sub heading number {index}") for index in range(1, subheadings + 1)]
+    text_roles += [("offer", "Up to 50% off"), ("cta", "Shop now")]
+    for index, (role, text) in enumerate(text_roles):
+        top = content_top + 4 + index * (line + 4)
+        type_layer(Group.new(psd, role), role, text, (20, top, width - 20, top + line), size=line * 0.8)
+
+    contact = Group.new(psd, "contactWrap")
+    PixelLayer.frompil(Image.new("RGBA", (width - 20, line + 8), (40, 40, 40, 255)),
+                       contact, "contactBackground", top=height - line - 18, left=10)
+    PixelLayer.frompil(Image.new("RGBA", (width - 28, line + 2), (60, 60, 60, 255)),
+                       contact, "contactArea", top=height - line - 15, left=14)
+    # Phone and email lines above the contactArea, the phone on top (the converter's "tel").
+    contact_line = max(6, line // 2)
+    for index, text in reversed(list(enumerate(("+1 555 0100", "hello@example.com")))):
+        top = height - line - 14 + index * contact_line
+        type_layer(contact, f"contact {index + 1}", text, (16, top, width - 16, top + contact_line),
+                   size=contact_line * 0.8)
+
+    psd.save(path)
+    return sum(1 for _ in psd.descendants())
+
+
+def _peak_child_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def converter_writes_timings(converter):
+    """Whether ``converter`` takes -o/--timings; older ones only write the zip to stdout."""
+    try:
+        help_text = subprocess.run([sys.executable, converter, "--help"], capture_output=True, text=True,
+                                   timeout=60).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return "--timings" in help_text
+
+
+def _stage_seconds(report):
+    """Per-stage seconds of the single banner in a converter timing report."""
+    banner_totals = report["banners"][0].get("totals", {}) if report.get("banners") else {}
+    return {stage: report.get("totals", {}).get(stage) if stage == "zip" else banner_totals.get(stage)
+            for stage in STAGES}
+
+
+def _run_case(converter, zip_path, workdir, with_timings):
+    """Convert ``zip_path`` with the converter's CLI from this (fresh) process.
+
+    The converter runs in a child process, so the peak RSS of its children
+    is that of this one conversion.
+    """
+    env = dict(os.environ, PSD_CACHE_MAX_BYTES="0", PSD_LAYER_CACHE_MAX_BYTES="0")
+    output_path = os.path.join(workdir, "converted.zip")
+    timings_path = os.path.join(workdir, "timings.json")
+    command = [sys.executable, converter, zip_path]
+    if with_timings:
+        command += ["-o", output_path, "--timings", timings_path]
+    start = time.perf_counter()
+    with open(output_path if not with_timings else os.devnull, "wb") as stdout:
+        subprocess.run(command, cwd=workdir, env=env, stdout=stdout, stderr=subprocess.DEVNULL, check=True)
+    total = time.perf_counter() - start
+
+    stages, render_spans = dict.fromkeys(STAGES), {}
+    if with_timings:
+        with open(timings_path) as f:
+            report = json.load(f)
+        stages = _stage_seconds(report)
+        if report.get("banners"):
+            render_spans = report["banners"][0].get("totals", {})
+    output_root = os.path.join(workdir, "output")
+    output_bytes = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, files in os.walk(output_root) for name in files)
+    return {"stages": stages, "total": total, "render_spans": render_spans,
+            "peak_rss_bytes": _peak_child_rss_bytes(),
+            "output_bytes": output_bytes, "zip_bytes": os.path.getsize(output_path)}
+
+
+def _median(values):
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def benchmark_case(zip_path, repeat, converter=CONVERTER, with_timings=True):
+    """Run a case ``repeat`` times, each from a new process so peak RSS is per run."""
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir, \
+                ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            runs.append(executor.submit(_run_case, converter, zip_path, workdir, with_timings).result())
+    rss = [run["peak_rss_bytes"] for run in runs if run["peak_rss_bytes"] is not None]
+    return {
+        "stages": {stage: _median(run["stages"][stage] for run in runs) for stage in STAGES},
+        # Wall time of the whole CLI run, interpreter start-up included.
+        "total": statistics.median(run["total"] for run in runs),
+        # Where the time went (render, composite, encode, contours...), from the last run.
+        "render_spans": runs[-1]["render_spans"],
+        "peak_rss_bytes": max(rss) if rss else None,
+        "output_bytes": runs[-1]["output_bytes"],
+        "zip_bytes": runs[-1]["zip_bytes"],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes, repeat=3, shapes=6, hero_images=2, subheadings=2, hero_scale=3, keep_dir=None,
+                  converter=CONVERTER):
+    with_timings = converter_writes_timings(converter)
+    if not with_timings:
+        logger.warning(f"{converter} writes no timing report; only wall time, RSS and bytes are measured")
+    results = {
+        "commit": _git_commit(),
+        "converter": os.path.abspath(converter),
+        "python": platform.python_version(),
+        "psd_tools": psd_tools.__version__,
+        "options": {"repeat": repeat, "shapes": shapes, "hero_images": hero_images,
+                    "subheadings": subheadings, "hero_scale": hero_scale},
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        psd_dir = keep_dir or scratch
+        os.makedirs(psd_dir, exist_ok=True)
+        for width, height in sizes:
+            name = f"Bench_{width}x{height}"
+            psd_path = os.path.join(psd_dir, f"{name}.psd")
+            layers = build_banner_psd(psd_path, width, height, shapes=shapes, hero_images=hero_images,
+                                      subheadings=subheadings, hero_scale=hero_scale)
+            zip_path = os.path.join(psd_dir, f"{name}.zip")
+            with zipfile.ZipFile(zip_path, "w") as zip_ref:
+                zip_ref.write(psd_path, os.path.basename(psd_path))
+            logger.info(f"Benchmarking {name} ({layers} layers, {os.path.getsize(psd_path)} byte PSD)")
+            case = benchmark_case(zip_path, repeat, converter, with_timings)
+            case.update({"size": [width, height], "layers": layers, "psd_bytes": os.path.getsize(psd_path)})
+            results["cases"][name] = case
+    return results
+
+
+def format_results(results):
+    header = f"{'case':<18}" + "".join(f"{stage:>9}" for stage in STAGES) + f"{'total':>9}{'peak MB':>9}{'out KB':>9}"
+    lines = [f"commit {results['commit']}, python {results['python']}, psd_tools {results['psd_tools']}", header]
+    for name, case in results["cases"].items():
+        rss = case["peak_rss_bytes"]
+        stages = case["stages"]
+        lines.append(f"{name:<18}" + "".join(f"{stages[stage]:>9.3f}" if stages[stage] is not None else f"{'-':>9}"
+                                             for stage in STAGES)
+                     + f"{case['total']:>9.3f}" + (f"{rss / 2**20:>9.1f}" if rss else f"{'-':>9}")
+                     + f"{case['output_bytes'] / 1024:>9.1f}")
+    return "\n".join(lines)
+
+
+def compare_results(baseline, results, threshold):
+    """Log changes against a previous run; return the number of regressions past ``threshold``."""
+    regressions = 0
+    for name, case in results["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            continue
+        metrics = {stage: (before["stages"][stage], case["stages"][stage]) for stage in STAGES}
+        metrics["total"] = (before["total"], case["total"])
+        metrics["output_bytes"] = (before["output_bytes"], case["output_bytes"])
+        if before["peak_rss_bytes"] and case["peak_rss_bytes"]:
+            metrics["peak_rss_bytes"] = (before["peak_rss_bytes"], case["peak_rss_bytes"])
+        for metric, (old, new) in metrics.items():
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            timed = metric in STAGES or metric == "total"
+            regressed = change > threshold and not (timed and max(old, new) < MIN_COMPARABLE_SECONDS)
+            regressions += regressed
+            log = logger.warning if regressed else logger.info
+            log(f"{name} {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def parse_sizes(value):
+    return [tuple(int(part) for part in size.lower().split("x")) for size in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes(DEFAULT_SIZES),
+                        help=f"comma separated WIDTHxHEIGHT canvases (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; timings are the median")
+    parser.add_argument("--shapes", type=int, default=6, choices=range(0, 7), help="number of 'shape N' layers")
+    parser.add_argument("--hero-images", type=int, default=2, help="images in the hero group")
+    parser.add_argument("--subheadings", type=int, default=2, help="number of subHeading groups")
+    parser.add_argument("--hero-scale", type=int, default=3, help="how oversized hero photos are placed")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    parser.add_argument("--keep-psds", metavar="DIR", help="keep the generated PSDs in DIR")
+    parser.add_argument("--converter", default=CONVERTER,
+                        help="convert_psd.py to benchmark, e.g. one from an older commit (default: this checkout's)")
+    parser.add_argument("--log-level", default=os.environ.get("PSD_LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    results = run_benchmark(args.sizes, repeat=args.repeat, shapes=args.shapes, hero_images=args.hero_images,
+                            subheadings=args.subheadings, hero_scale=args.hero_scale, keep_dir=args.keep_psds,
+                            converter=args.converter)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        layout = {key: value for key, value in results["options"].items() if key != "repeat"}
+        if {key: value for key, value in baseline.get("options", {}).items() if key != "repeat"} != layout:
+            logger.warning("Comparing runs made with different options")
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            logger.error(f"{regressions} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
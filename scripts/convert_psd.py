@@ -4,6 +4,9 @@ from PIL import Image
 import os
 import numpy as np
 from psd_tools.psd.engine_data import List
+from psd_tools.constants import ChannelID, ColorMode, Compression, Resource, Tag
+from psd_tools.api.shape import Ellipse as EllipseOrigination
+from psd_tools.psd.vector import Knot
 import math
 from collections import Counter
 import cv2
@@ -12,1572 +15,3628 @@ import sys
 import zipfile
 import tempfile
 import shutil
+import errno
+import io
+import hashlib
+import html
+import json
+import logging
+import argparse
+import threading
+import time
+import functools
+import itertools
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import brotli  # noqa: F401 -- fontTools needs it to write WOFF2
+    from fontTools import subset as font_subset
+    from fontTools.ttLib import TTFont
+    logging.getLogger("fontTools").setLevel(logging.WARNING)
+except ImportError:  # optional; without it banners link the hosted Lato stylesheet
+    font_subset = TTFont = None
+
+logger = logging.getLogger("convert_psd")
+
+COMPOSITE_CACHE_BYTES = 256 * 1024 * 1024
+# Memory-bounded mode: with PSD_MAX_RSS_BYTES set, renders that would push the
+# process past it are tiled, then downsampled, instead of risking the OOM killer.
+MAX_RSS_BYTES = 0
+# Rough peak bytes per rendered pixel: psd_tools composites in float32 with
+# several intermediate buffers, topil() holds the decoded channels and the merge.
+COMPOSITE_WORKING_BYTES_PER_PIXEL = 96
+TOPIL_WORKING_BYTES_PER_PIXEL = 12
+# Keep the intermediate edge/contour images of clip-path detection for debugging.
+DEBUG_IMAGES = os.environ.get("PSD_DEBUG_IMAGES") == "1"
+# Finished banners are cached on disk by content hash (see ConversionCache).
+CONVERSION_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "psd_tool", "conversions")
+CONVERSION_CACHE_BYTES = 1024 * 1024 * 1024
+# Per-layer outputs, so an edited PSD only re-renders the layers that changed.
+LAYER_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "psd_tool", "layers")
+LAYER_CACHE_BYTES = 1024 * 1024 * 1024
+# Converter globals that process_layer reads and writes across layers.
+LAYER_STATE_GLOBALS = ("xe2", "ye2", "logo_width", "logo_height", "logo_x", "logo_y")
+# "polygon" traces fitted ellipses as polygons; "ellipse" emits a native CSS
+# ellipse() whenever the ellipse is axis-aligned.
+CLIP_PATH_ELLIPSE_MODE = os.environ.get("PSD_CLIP_PATH_ELLIPSE", "polygon")
+ELLIPSE_AXIS_TOLERANCE_DEG = 1.0
+# Decimals of clip-paths taken from vector masks, in layer pixels.
+CLIP_PATH_PRECISION = 2
+# Uploaded PSDs are buffered in memory up to this size, then spill to disk.
+PSD_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+# Images of one banner share this byte budget (the IAB 150 KB initial load).
+AD_BYTE_BUDGET = int(os.environ.get("PSD_AD_BYTE_BUDGET", 150 * 1024))
+# Lossy encodes start at IMAGE_QUALITY and step down to IMAGE_MIN_QUALITY
+# while an asset is over its share of the budget.
+IMAGE_QUALITY = int(os.environ.get("PSD_IMAGE_QUALITY", 85))
+IMAGE_MIN_QUALITY = 60
+IMAGE_QUALITY_STEP = 5
+# Shares overlap (hero slides stack in one box), so once every image is written
+# the largest lossy ones are re-encoded further down, to this floor, until the
+# banner's images fit in the budget.
+IMAGE_BUDGET_MIN_QUALITY = 30
+IMAGE_EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+LOSSY_IMAGE_FORMATS = {"jpg": "jpeg", "webp": "webp"}
+# Warm RPC workers running side by side (set by convertWorkerPool.js); each one
+# defaults to its share of the CPUs for its PSD process pool.
+WORKER_POOL_SIZE = max(1, int(os.environ.get("PSD_WORKER_POOL_SIZE", 1)))
+# PIL releases the GIL while encoding, so a banner's images encode in parallel.
+ENCODE_THREADS = int(os.environ.get("PSD_ENCODE_THREADS", min(4, os.cpu_count() or 1)))
+# Also encode every asset the old way (JPEG q98 / plain PNG) to log the bytes saved.
+ENCODE_REPORT = os.environ.get("PSD_ENCODE_REPORT") == "1"
+# Optional per-PSD profiling ("cprofile", "tracemalloc"), comma separated.
+PROFILE_MODES = tuple(mode for mode in os.environ.get("PSD_PROFILE", "").split(",") if mode)
+PROFILE_TOP_ENTRIES = 30
+# Background colours without a solid fill are averaged over about this many
+# evenly strided pixels instead of a full composite.
+BACKGROUND_SAMPLE_PIXELS = 64 * 1024
+# Fonts the text layers use are subset from this directory into each banner's
+# fonts/ as WOFF2 (needs fontTools and brotli).
+FONT_DIR = os.environ.get("PSD_FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+FONT_DISPLAY = os.environ.get("PSD_FONT_DISPLAY", "swap")
+FONT_EXTENSIONS = (".ttf", ".otf", ".woff", ".woff2")
+# Linked only while some face a banner uses isn't available locally.
+HOSTED_FONT_LINKS = (
+    '<link rel="preconnect" href="https://fonts.googleapis.com" />',
+    '<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin />',
+    '<link href="https://fonts.googleapis.com/css2?family=Lato:ital,wght@0,100;0,300;0,400;0,700;0,900;1,100;1,300;1,400;1,700;1,900&display=swap" rel="stylesheet">',
+)
+# Merge, prune and minify index.html and style.css once a banner is rendered;
+# set PSD_OPTIMIZE_OUTPUT=0 to keep the readable output.
+OPTIMIZE_OUTPUT = os.environ.get("PSD_OPTIMIZE_OUTPUT", "1") != "0"
+# Where process_layer puts elements: the container holds shapes, logo,
+# .contentSection (the CONTENT_SECTIONS, in this order) and mainImages.
+BANNER_SECTIONS = ("shapes", "logo", "mainImages")
+CONTENT_SECTIONS = ("mainHeading", "subHeading", "offer", "contactWrap", "cta")
+# Tags index.html uses besides those of the banner's elements.
+HTML_DOCUMENT_TAGS = ("html", "head", "body", "meta", "title", "link", "script")
+HTML_VOID_TAGS = frozenset({"img"})
+CLICKTAG_SCRIPT = r"""function getQueryStringValue(key) {
+    return decodeURIComponent(window.location.search.replace(new RegExp("^(?:.*[&\?]" + escape(key).replace(/[\.\+\*]/g, "\\$&") + "(?:\=([^&]*))?)?.*$", "i"), "$1"));
+}
+
+var clickTag = document.getElementById("sd_btn_Click-Through-URL").getAttribute("href");
+var trackingUrl = getQueryStringValue("trackurl");
+var resURL = trackingUrl + clickTag;
+
+var elements = document.getElementsByClassName("clicktru");
+
+for (var i = 0; i < elements.length; i++) {
+    elements[i].setAttribute("href", resURL);
+}"""
+# Properties that cascade into each other, grouped so rules setting any of them
+# aren't reordered past one another (see _property_family).
+CSS_PROPERTY_FAMILIES = {"top": "inset", "right": "inset", "bottom": "inset", "left": "inset",
+                         "line": "font", "row": "gap", "column": "gap",
+                         "align": "place", "justify": "place"}
+# At-rules that don't style elements themselves; anything else stops rule merging.
+CSS_INERT_AT_RULES = ("@font-face", "@keyframes", "@-webkit-keyframes", "@charset", "@import")
+# Banners are published to OUTPUT_ROOT/<name>/ once converted; each conversion
+# builds in its own hidden directory under it (see convert_psd_file).
+OUTPUT_ROOT = "output"
+# Already-compressed formats go into the output zip as-is.
+ZIP_STORED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".woff2"}
+# Files of output/<name>/ that are for the tool, not the ad, and stay out of the result zip.
+UNPACKAGED_FILES = frozenset({"manifest.json"})
+_CACHE_MISS = object()
+
+
+class ConversionError(Exception):
+    """The upload can't produce any output (no PSDs, or all of them failed)."""
+
+
+class Timings:
+    """Records timed spans (name, tags, start, duration, nesting depth).
+
+    Spans may be opened from any thread; nesting is tracked per thread.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, **tags):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.depth = depth
+            span = {"name": name, "start": round(start - self._origin, 6), "seconds": round(seconds, 6),
+                    "depth": depth, "thread": threading.current_thread().name}
+            if tags:
+                span["tags"] = tags
+            self.spans.append(span)
+
+    def report(self):
+        totals = Counter()
+        for span in self.spans:
+            totals[span["name"]] += span["seconds"]
+        return {
+            "totals": {name: round(seconds, 6) for name, seconds in totals.most_common()},
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+
+
+# Spans of the PSD being converted in this process; replaced per PSD.
+timings = Timings()
+
+
+@functools.lru_cache(maxsize=None)
+def _converter_fingerprint():
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ConversionCache:
+    """Content-addressed disk cache of finished output/<name>/ trees.
+
+    Entries are keyed by the PSD bytes, the converter source and the options
+    that change the output, and evicted least-recently-used once the cache
+    grows past max_bytes. Set PSD_CACHE_MAX_BYTES=0 to disable it.
+    """
+
+    dir_env, default_dir = "PSD_CACHE_DIR", CONVERSION_CACHE_DIR
+    max_bytes_env, default_max_bytes = "PSD_CACHE_MAX_BYTES", CONVERSION_CACHE_BYTES
+    # Bytes each cache directory holds as far as this process knows: scanned
+    # once, then grown by every store. Other processes store too, so evict()
+    # rescans before it deletes anything.
+    _tracked_bytes = {}
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(self.dir_env, self.default_dir)
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(self.max_bytes_env, self.default_max_bytes))
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, psd_digest, file_name_t):
+        # The banner name ends up in <title>, so it's part of the key.
+        options = json.dumps({"name": file_name_t, "debug_images": DEBUG_IMAGES, "fonts": font_settings(),
+                              "optimize": OPTIMIZE_OUTPUT, "clip_path_ellipse": CLIP_PATH_ELLIPSE_MODE,
+                              "encode": image_settings()},
+                             sort_keys=True)
+        key_source = f"{psd_digest}:{_converter_fingerprint()}:{options}"
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def restore(self, key, output_dir):
+        if not self.enabled:
+            return False
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return False
+        try:
+            shutil.copytree(entry, output_dir, dirs_exist_ok=True)
+            os.utime(entry)
+        except OSError as e:
+            logger.warning(f"Conversion cache entry {key} unusable: {e}")
+            return False
+        return True
+
+    def _publish(self, key, populate):
+        """Fill a staging directory and rename it into place as entry ``key``."""
+        entry = os.path.join(self.cache_dir, key)
+        staging = f"{entry}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            populate(staging)
+            size = self._tree_bytes(staging)
+            os.rename(staging, entry)
+        except OSError as e:
+            # Most likely another process stored the same entry first
+            logger.debug(f"Cache store of {key} skipped: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        if self.cache_dir in self._tracked_bytes:
+            self._tracked_bytes[self.cache_dir] += size
+        return True
+
+    def store(self, key, output_dir):
+        if self.enabled and self._publish(key, lambda staging: shutil.copytree(output_dir, staging)):
+            self.evict()
+
+    @staticmethod
+    def _tree_bytes(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(path) for name in files)
+
+    def evict(self):
+        """Drop least-recently-used entries once the cache is over max_bytes."""
+        if self.cache_dir not in self._tracked_bytes:
+            self._tracked_bytes[self.cache_dir] = self._scan_bytes()
+        if self._tracked_bytes[self.cache_dir] <= self.max_bytes:
+            return
+        self._tracked_bytes[self.cache_dir] = self._evict_scanned()
+
+    def _scan_bytes(self):
+        try:
+            return self._tree_bytes(self.cache_dir)
+        except OSError:
+            return 0
+
+    def _evict_scanned(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if os.path.isdir(entry) and ".tmp-" not in name:
+                entries.append((os.path.getmtime(entry), self._tree_bytes(entry), entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        return total
+
+
+class LayerCache(ConversionCache):
+    """Disk cache of what process_layer produced for one top-level layer.
+
+    An entry holds the document operations the layer recorded, the converter
+    globals it set, the images it wrote and the source pixels of the lossy
+    ones (for ImageEncoder's budget pass). It is keyed by a fingerprint of
+    the layer's record and channel bytes (children and clipping layers
+    included) plus everything else process_layer reads: banner name and size,
+    and the globals set by earlier layers.
+    """
+
+    dir_env, default_dir = "PSD_LAYER_CACHE_DIR", LAYER_CACHE_DIR
+    max_bytes_env, default_max_bytes = "PSD_LAYER_CACHE_MAX_BYTES", LAYER_CACHE_BYTES
+
+    @staticmethod
+    def _hash_layer(digest, layer):
+        digest.update(layer._record.tobytes())
+        for channel in layer._channels:
+            digest.update(channel.tobytes())
+        for clip_layer in getattr(layer, "clip_layers", None) or ():
+            LayerCache._hash_layer(digest, clip_layer)
+        if layer.is_group():
+            for child in layer:
+                LayerCache._hash_layer(digest, child)
+
+    def fingerprint(self, layer, context):
+        digest = hashlib.sha256()
+        digest.update(_converter_fingerprint().encode())
+        digest.update(json.dumps(context, sort_keys=True, default=str).encode())
+        self._hash_layer(digest, layer)
+        return digest.hexdigest()
+
+    def load(self, fingerprint, images_dir, encoder):
+        """Return the cached fragment and copy its images back, or None on a miss.
+
+        The sources of its lossy images go back to ``encoder``, which may
+        re-encode them to fit the byte budget.
+        """
+        if not self.enabled:
+            return None
+        entry = os.path.join(self.cache_dir, fingerprint)
+        try:
+            with open(os.path.join(entry, "fragment.json")) as f:
+                fragment = json.load(f)
+            for name in fragment["images"]:
+                shutil.copy2(os.path.join(entry, "images", name), os.path.join(images_dir, name))
+            for name in fragment["sources"]:
+                shutil.copy2(os.path.join(entry, "sources", f"{name}.png"), encoder.source_path(name))
+            for name, quality in fragment["sources"].items():
+                encoder.adopt(name, quality)
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            return None
+        return fragment
+
+    def save(self, fingerprint, fragment, images_dir, encoder):
+        if not self.enabled:
+            return
+
+        def populate(staging):
+            os.makedirs(os.path.join(staging, "images"))
+            os.makedirs(os.path.join(staging, "sources"))
+            for name in fragment["images"]:
+                shutil.copy2(os.path.join(images_dir, name), os.path.join(staging, "images", name))
+            for name in fragment["sources"]:
+                shutil.copy2(encoder.source_path(name), os.path.join(staging, "sources", f"{name}.png"))
+            with open(os.path.join(staging, "fragment.json"), "w") as f:
+                json.dump(fragment, f)
+
+        self._publish(fingerprint, populate)
+
+
+class MemoryBudget:
+    """Process RSS ceiling for memory-bounded conversions (PSD_MAX_RSS_BYTES, 0 = off).
+
+    ``degraded`` counts the renders that had to be downsampled; output that
+    depends on them is not cached.
+    """
+
+    env = "PSD_MAX_RSS_BYTES"
+
+    def __init__(self, max_rss_bytes=None):
+        if max_rss_bytes is None:
+            max_rss_bytes = int(os.environ.get(self.env, MAX_RSS_BYTES))
+        self.max_rss_bytes = max_rss_bytes
+        self.degraded = 0
+        if self.enabled and self.rss() is None:
+            logger.warning("Resident memory can't be read on this platform; ignoring the RSS ceiling")
+            self.max_rss_bytes = 0
+
+    @property
+    def enabled(self):
+        return self.max_rss_bytes > 0
+
+    @staticmethod
+    def rss():
+        """Current resident set size in bytes, or None where /proc isn't available."""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def headroom(self):
+        return self.max_rss_bytes - self.rss()
+
+    def fits(self, nbytes):
+        return not self.enabled or nbytes <= self.headroom()
+
+
+def _layer_key(layer):
+    """The layer's id, or its identity for layers written without one (id -1)."""
+    return layer.layer_id if layer.layer_id >= 0 else id(layer)
+
+
+class CompositeCache:
+    """LRU cache of rendered layer images, bounded by decoded byte size.
+
+    With an enabled MemoryBudget the cache is kept to an eighth of the
+    ceiling, and renders that don't fit in the remaining headroom first
+    evict the cache, then render in bands of rows (composite() through its
+    viewport, topil() through the row decoder), and as a last resort come
+    back downsampled (``image.info["scale"]`` < 1).
+    """
+
+    def __init__(self, max_bytes=COMPOSITE_CACHE_BYTES, memory=None):
+        self.memory = memory or MemoryBudget()
+        if self.memory.enabled:
+            max_bytes = min(max_bytes, self.memory.max_rss_bytes // 8)
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.renders = Counter()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _image_bytes(image):
+        if image is None:
+            return 0
+        return image.width * image.height * len(image.getbands())
+
+    def _render(self, layer, method, **options):
+        if isinstance(layer, LayerView):
+            layer = layer.layer
+        # The layer itself is kept in the entry so its id() can't be reused
+        # by another object while the entry is alive.
+        key = (id(layer), method, tuple(sorted(options.items())))
+        entry = self._entries.get(key, _CACHE_MISS)
+        if entry is not _CACHE_MISS:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        self.renders[(_layer_key(layer), method)] += 1
+        with timings.span(method, layer=layer.name):
+            image = self._render_bounded(layer, method, options)
+        size = self._image_bytes(image)
+        if size > self.max_bytes:
+            return image
+
+        self._entries[key] = (layer, image, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, _, old_size) = self._entries.popitem(last=False)
+            self.current_bytes -= old_size
+            self.evictions += 1
+        return image
+
+    def _render_bounded(self, layer, method, options):
+        render = getattr(layer, method)
+        x1, y1, x2, y2 = layer.bbox
+        width, height = x2 - x1, y2 - y1
+        per_pixel = COMPOSITE_WORKING_BYTES_PER_PIXEL if method == "composite" else TOPIL_WORKING_BYTES_PER_PIXEL
+        if self.memory.fits(width * height * per_pixel):
+            return render(**options)
+
+        self.clear()
+        if self.memory.fits(width * height * per_pixel):
+            return render(**options)
+        headroom = max(self.memory.headroom(), 0)
+        tileable = method == "composite" or _region_decodable(layer)
+        if options or not tileable or not width or not height:
+            logger.warning(f"Rendering {layer.name} ({width}x{height}) with {headroom} bytes of headroom")
+            return render(**options)
+
+        # Downsample by the smallest factor whose output still fits, then
+        # render bands of rows small enough for their working buffers to fit too.
+        factor = 1
+        while width * height * 4 // (factor * factor) > headroom // 2 and factor < 64:
+            factor *= 2
+        rows = max(factor, (headroom // 2) // max(1, width * per_pixel) // factor * factor)
+        logger.warning(f"Rendering {layer.name} ({width}x{height}) in {rows}-row bands"
+                       + (f" at 1/{factor} scale" if factor > 1 else ""))
+        if factor > 1:
+            self.memory.degraded += 1
+
+        image = None
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            if method == "composite":
+                band = render(viewport=(x1, y1 + top, x2, y1 + bottom))
+            else:
+                band = _decode_layer_region(layer, (0, top, width, bottom))
+            if band is None:
+                continue
+            if factor > 1:
+                band = band.reduce(factor)
+            if image is None:
+                image = Image.new(band.mode, (-(-width // factor), -(-height // factor)))
+            image.paste(band, (0, top // factor))
+        if image is not None and factor > 1:
+            image.info["scale"] = 1 / factor
+        return image
+
+    def composite(self, layer, **options):
+        return self._render(layer, "composite", **options)
+
+    def topil(self, layer, **options):
+        return self._render(layer, "topil", **options)
+
+    def topil_region(self, layer, box):
+        """``topil(layer).crop(box)`` that only decodes the rows the box covers.
+
+        ``box`` is in layer coordinates and, as with crop(), may reach past
+        the layer; that part comes back transparent. Only 8-bit RGB layers
+        with raw or RLE channels and no ICC profile take the fast path, the
+        rest render the full layer (through the cache) and crop it.
+        """
+        if isinstance(layer, LayerView):
+            layer = layer.layer
+        left, upper, right, lower = box
+        if right < left or lower < upper:
+            raise ValueError(f"Invalid crop box {box}")
+        with timings.span("topil_region", layer=layer.name):
+            region = _decode_layer_region(layer, box)
+        if region is None:
+            return self.topil(layer).crop(box)
+        return region
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self.current_bytes,
+            "max_renders_per_layer": max(self.renders.values(), default=0),
+        }
+
+
+def _decode_channel_rows(channel, width, height, version, top, bottom):
+    """Rows [top, bottom) of one 8-bit channel, decoded without touching the others."""
+    if channel.compression == Compression.RAW:
+        return channel.data[top * width:bottom * width]
+    # RLE channels start with the byte count of every row, then PackBits rows.
+    count_size = 2 if version == 1 else 4
+    counts = np.frombuffer(channel.data, dtype=f">u{count_size}", count=height)
+    offsets = np.concatenate(([height * count_size], height * count_size + np.cumsum(counts, dtype=np.int64)))
+    packed = channel.data[offsets[top]:offsets[bottom]]
+    return Image.frombuffer("L", (width, bottom - top), packed, "packbits", "L").tobytes()
+
+
+def _decode_channel_sample(channel, width, height, version, rows):
+    """The given rows of one 8-bit channel, as a (len(rows), width) array."""
+    if channel.compression == Compression.RAW:
+        return np.frombuffer(channel.data, dtype=np.uint8, count=width * height).reshape(height, width)[rows]
+    count_size = 2 if version == 1 else 4
+    counts = np.frombuffer(channel.data, dtype=f">u{count_size}", count=height)
+    offsets = np.concatenate(([height * count_size], height * count_size + np.cumsum(counts, dtype=np.int64)))
+    # PackBits rows are independent, so the picked rows decode as one image.
+    packed = b"".join(channel.data[offsets[row]:offsets[row + 1]] for row in rows)
+    decoded = Image.frombuffer("L", (width, len(rows)), packed, "packbits", "L")
+    return np.asarray(decoded).reshape(len(rows), width)
+
+
+_COLOR_CHANNEL_IDS = (ChannelID.CHANNEL_0, ChannelID.CHANNEL_1, ChannelID.CHANNEL_2)
+
+
+def _region_decodable(layer):
+    """Whether _decode_layer_region can produce this layer's topil() pixels."""
+    psd = layer._psd
+    channels = {info.id: data for info, data in zip(layer._record.channel_info, layer._channels)}
+    return not (psd.color_mode != ColorMode.RGB or psd.depth != 8
+                or Resource.ICC_PROFILE in psd.image_resources
+                or any(channel_id not in channels for channel_id in _COLOR_CHANNEL_IDS)
+                or any(data.compression not in (Compression.RAW, Compression.RLE) for data in channels.values()))
+
+
+def _decode_layer_region(layer, box):
+    """The part of a layer's pixels under ``box``, or None if the layer needs a full topil()."""
+    if not _region_decodable(layer):
+        return None
+    psd = layer._psd
+    channels = {info.id: data for info, data in zip(layer._record.channel_info, layer._channels)}
+    color_ids = _COLOR_CHANNEL_IDS
+
+    width, height = layer.width, layer.height
+    left, upper, right, lower = box
+    mode = "RGBA" if ChannelID.TRANSPARENCY_MASK in channels else "RGB"
+    region = Image.new(mode, (right - left, lower - upper))
+    # Intersect with the layer first so nothing outside the box is decoded.
+    x1, y1 = max(left, 0), max(upper, 0)
+    x2, y2 = min(right, width), min(lower, height)
+    if x2 <= x1 or y2 <= y1:
+        return region
+
+    bands = []
+    for channel_id in color_ids + ((ChannelID.TRANSPARENCY_MASK,) if mode == "RGBA" else ()):
+        rows = _decode_channel_rows(channels[channel_id], width, height, psd.version, y1, y2)
+        bands.append(Image.frombytes("L", (width, y2 - y1), rows).crop((x1, 0, x2, y2 - y1)))
+    region.paste(Image.merge(mode, bands), (x1 - left, y1 - upper))
+    return region
+
+
+class LayerView:
+    """Layer proxy that defers pixel rendering to the composite cache.
+
+    Everything except rendering is delegated to the wrapped layer, so branches
+    that only read names, bboxes or text data never pay for a composite.
+    """
+
+    __slots__ = ("layer", "cache")
+
+    def __init__(self, layer, cache):
+        self.layer = layer
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.layer, name)
+
+    def __iter__(self):
+        return (LayerView(child, self.cache) for child in self.layer)
+
+    def __reversed__(self):
+        return (LayerView(child, self.cache) for child in reversed(self.layer))
+
+    def __len__(self):
+        return len(self.layer)
+
+    @property
+    def has_pixels(self):
+        x1, y1, x2, y2 = self.layer.bbox
+        return x2 > x1 and y2 > y1
+
+    def composite(self, **options):
+        return self.cache.composite(self.layer, **options)
+
+    def topil(self, **options):
+        return self.cache.topil(self.layer, **options)
+
+
+def choose_image_format(image):
+    """"png" (palette) for up to 256 colours, else "webp" with alpha or "jpeg" without."""
+    if image.getcolors(maxcolors=256) is not None:
+        return "png"
+    return "webp" if image.mode == "RGBA" else "jpeg"
+
+
+def palette_png_bytes(image):
+    """Lossless palette PNG of an image with at most 256 distinct colours."""
+    pixels = np.ascontiguousarray(np.asarray(image.convert("RGBA"))).view(np.uint32)
+    palette, indices = np.unique(pixels.reshape(-1), return_inverse=True)
+    indexed = Image.frombytes("P", image.size, indices.astype(np.uint8).tobytes())
+    entries = palette.view(np.uint8).reshape(-1, 4)
+    indexed.putpalette(entries[:, :3].tobytes())
+    options = {"optimize": True}
+    if image.mode == "RGBA":
+        options["transparency"] = entries[:, 3].tobytes()
+    buffer = io.BytesIO()
+    indexed.save(buffer, "PNG", **options)
+    return buffer.getvalue()
+
+
+def lossy_image_bytes(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def baseline_image_bytes(image):
+    """Size of the image as the converter used to write it: JPEG q98 for opaque, PNG otherwise."""
+    buffer = io.BytesIO()
+    if image.mode == "RGBA":
+        image.save(buffer, "PNG")
+    else:
+        image.save(buffer, "JPEG", quality=98, optimize=True)
+    return len(buffer.getvalue())
+
+
+def image_settings(budget=AD_BYTE_BUDGET):
+    """The encoder options that change a banner's images, for cache keys."""
+    return {"budget": budget, "quality": IMAGE_QUALITY, "min_quality": IMAGE_MIN_QUALITY,
+            "budget_min_quality": IMAGE_BUDGET_MIN_QUALITY}
+
+
+class ImageEncoder:
+    """Writes a banner's images, choosing the format per asset, on a thread pool.
+
+    The format (and so the file name) is decided by save() from alpha and
+    colour count, so HTML can reference the file straight away; the encode
+    itself runs in the background until wait(). Every asset gets a share of
+    the ad byte budget in proportion to its area on the canvas, and lossy
+    encodes lower their quality until they fit in it. Overlapping assets can
+    still add up to more than the budget, so close() re-encodes the largest
+    lossy images in images/ until the whole directory fits. It re-encodes
+    from each lossy image's source pixels, which are spilled to a scratch
+    directory as PNG rather than kept in memory; the layer cache stores them
+    (see lossy_sources() and adopt()) so replayed images fit the same way.
+    """
+
+    def __init__(self, images_dir, canvas_size, budget=AD_BYTE_BUDGET, threads=ENCODE_THREADS):
+        self.images_dir = images_dir
+        self.canvas_area = max(1, canvas_size[0] * canvas_size[1])
+        self.budget = budget
+        self.report = []
+        # stem -> (key, filename, future)
+        self._assets = {}
+        # filename -> quality of a lossy file; its source pixels are in source_path(filename)
+        self._lossy = {}
+        self._spill = tempfile.TemporaryDirectory(prefix="psd-sources-")
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads))
+
+    def settings(self):
+        return image_settings(self.budget)
+
+    def source_path(self, filename):
+        return os.path.join(self._spill.name, f"{filename}.png")
+
+    def lossy_sources(self, filenames):
+        """{filename: quality} of the given files that were encoded lossily."""
+        return {name: self._lossy[name] for name in filenames if name in self._lossy}
+
+    def adopt(self, filename, quality):
+        """Take over a lossy file written elsewhere, whose source is already at source_path()."""
+        self._lossy[filename] = quality
+
+    def encoded(self, stem, key):
+        """Whether ``stem`` was already saved from the same source ``key``."""
+        asset = self._assets.get(stem)
+        return asset is not None and key is not None and asset[0] == key
+
+    def filename(self, stem, default_extension):
+        asset = self._assets.get(stem)
+        return asset[1] if asset else f"{stem}{default_extension}"
+
+    def save(self, image, stem, key=None):
+        """Queue ``image`` for encoding as images/<stem>.<ext> and return that file name."""
+        previous = self._assets.get(stem)
+        if previous is not None:
+            if key is not None and previous[0] == key:
+                return previous[1]
+            # Saving the same name twice: the later image wins, as with image.save().
+            previous[2].result()
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        if image.mode == "RGBA" and image.getextrema()[3][0] == 255:
+            image = image.convert("RGB")
+        fmt = choose_image_format(image)
+        filename = f"{stem}.{IMAGE_EXTENSIONS[fmt]}"
+        if previous is not None and previous[1] != filename:
+            try:
+                os.remove(os.path.join(self.images_dir, previous[1]))
+            except OSError:
+                pass
+
+        future = self._executor.submit(self._timed_encode, image, fmt, filename)
+        self._assets[stem] = (key, filename, future)
+        return filename
+
+    def _timed_encode(self, image, fmt, filename):
+        with timings.span("encode", file=filename, format=fmt):
+            self._encode(image, fmt, filename)
+
+    def _encode(self, image, fmt, filename):
+        share = int(self.budget * image.width * image.height / self.canvas_area)
+        quality = None
+        try:
+            if fmt == "png":
+                data = palette_png_bytes(image)
+            else:
+                for quality in range(IMAGE_QUALITY, min(IMAGE_QUALITY, IMAGE_MIN_QUALITY) - 1, -IMAGE_QUALITY_STEP):
+                    data = lossy_image_bytes(image, fmt, quality)
+                    if len(data) <= share:
+                        break
+            with open(os.path.join(self.images_dir, filename), "wb") as f:
+                f.write(data)
+            if quality is not None:
+                image.save(self.source_path(filename), "PNG", compress_level=1)
+                self._lossy[filename] = quality
+        except Exception as e:
+            logger.error(f"Failed to encode {filename}: {e}")
+            return
+
+        entry = {"file": filename, "format": fmt, "quality": quality, "bytes": len(data), "budget": share}
+        message = f"Encoded {filename} as {fmt}" + (f" q{quality}" if quality else "") + f": {len(data)} bytes"
+        if ENCODE_REPORT:
+            entry["baseline_bytes"] = baseline_image_bytes(image)
+            entry["saved_bytes"] = entry["baseline_bytes"] - len(data)
+            message += f", {entry['saved_bytes']} saved"
+        self.report.append(entry)
+        logger.info(message)
+
+    def wait(self):
+        with timings.span("encode_wait"):
+            for _, _, future in list(self._assets.values()):
+                future.result()
+
+    def close(self):
+        """Finish every encode, fit images/ into the budget and return the per-banner totals."""
+        self.wait()
+        self._executor.shutdown()
+        # A file that was written twice counts once, with its final encode.
+        latest = {asset[1] for asset in self._assets.values()}
+        entries = {entry["file"]: entry for entry in self.report if entry["file"] in latest}
+        with timings.span("encode_budget"):
+            sizes = self._fit_budget(entries)
+        self._spill.cleanup()
+        summary = {"assets": len(sizes), "bytes": sum(sizes.values()), "budget": self.budget}
+        if ENCODE_REPORT:
+            summary["saved_bytes"] = sum(entry["saved_bytes"] for entry in entries.values())
+        if summary["bytes"] > self.budget:
+            logger.warning(f"Images take {summary['bytes']} bytes, over the {self.budget} byte budget "
+                           f"even at q{IMAGE_BUDGET_MIN_QUALITY}")
+        return summary
+
+    def _fit_budget(self, entries):
+        """Re-encode the largest lossy file a step lower until images/ fits in the budget.
+
+        Ties go to the first file name, so a banner replayed from the layer
+        cache ends up with the same bytes as a fresh conversion. Returns the
+        final size of every file.
+        """
+        sizes = {entry.name: entry.stat().st_size for entry in os.scandir(self.images_dir) if entry.is_file()}
+        total = sum(sizes.values())
+        qualities = {name: quality for name, quality in sorted(self._lossy.items()) if name in sizes}
+        while total > self.budget:
+            candidates = [name for name, quality in qualities.items()
+                          if quality - IMAGE_QUALITY_STEP >= IMAGE_BUDGET_MIN_QUALITY]
+            if not candidates:
+                break
+            name = max(candidates, key=sizes.get)
+            quality = qualities[name] = qualities[name] - IMAGE_QUALITY_STEP
+            path = os.path.join(self.images_dir, name)
+            try:
+                with Image.open(self.source_path(name)) as source:
+                    data = lossy_image_bytes(source, LOSSY_IMAGE_FORMATS[os.path.splitext(name)[1][1:]], quality)
+                if len(data) >= sizes[name]:
+                    continue
+                with open(path, "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                logger.error(f"Failed to re-encode {name}: {e}")
+                del qualities[name]
+                continue
+            total -= sizes[name] - len(data)
+            sizes[name] = len(data)
+            if name in entries:
+                entries[name].update(quality=quality, bytes=len(data))
+            logger.info(f"Re-encoded {name} at q{quality} to fit the budget: {len(data)} bytes")
+        return sizes
+
+
+# Name fragments the converter keys on, most specific first. A layer has every
+# role whose fragment appears in its name ("logoArea" is also "logo", "hero 2"
+# is also "hero"); its primary role is the first one that matches.
+LAYER_ROLES = (
+    "logoArea", "logo", "contentArea",
+    "shape 1", "shape 2", "shape 3", "shape 4", "shape 5", "shape 6",
+    "hero 2", "hero", "imageWrap1", "imageWrap", "imageBorder",
+    "mainHeading", "subHeading", "offer", "cta",
+    "contactWrap", "contactBackground", "contactArea",
+)
+
+
+class LayerInfo:
+    """What the converter needs to know about a layer, computed once."""
+
+    __slots__ = ("layer", "name", "roles", "role", "kind", "bbox", "is_group", "locked", "parent", "children",
+                 "text_style")
+
+    def __init__(self, layer, parent=None):
+        self.layer = layer
+        self.name = layer.name
+        self.roles = frozenset(role for role in LAYER_ROLES if role in self.name)
+        self.role = next((role for role in LAYER_ROLES if role in self.roles), None)
+        self.kind = layer.kind
+        self.is_group = layer.is_group()
+        self.locked = bool(getattr(getattr(layer, "locks", None), "transparency", False))
+        self.parent = parent
+        self.children = []
+        self.bbox = tuple(layer.bbox)
+        self.text_style = None
+
+
+class LayerIndex:
+    """One walk over the PSD tree: every layer's roles, kind and bbox, and layers by role."""
+
+    def __init__(self, psd):
+        self._infos = {}
+        self.by_role = {role: [] for role in LAYER_ROLES}
+        self.top_level = [self._add(layer, None) for layer in psd]
+
+    def _add(self, layer, parent):
+        info = LayerInfo(layer, parent)
+        self._infos[id(layer)] = info
+        for role in info.roles:
+            self.by_role[role].append(info)
+        if info.is_group:
+            info.children = [self._add(child, info) for child in layer]
+        return info
+
+    def __getitem__(self, layer):
+        if isinstance(layer, LayerView):
+            layer = layer.layer
+        return self._infos[id(layer)]
+
+    def roles(self, layer):
+        return self[layer].roles
+
+    def text_style(self, layer):
+        """The layer's TextStyle, parsed on first use."""
+        info = self[layer]
+        if info.text_style is None:
+            info.text_style = TextStyle(info.layer)
+        return info.text_style
+
+    def first(self, role):
+        """The first layer with ``role`` in document order, or None."""
+        infos = self.by_role.get(role)
+        return infos[0] if infos else None
+
+
+class DocumentFacts:
+    """Document-level facts gathered in one pass over the top-level layers.
+
+    ``background`` is the colour of the last unlocked top-level "bg" layer
+    (None when there is none or it has no colour); ``logo_area`` is the
+    (width, height, x, y) of the first top-level pixel "logoArea" layer.
+    """
+
+    __slots__ = ("background", "logo_area", "locked")
+
+    def __init__(self, index, composites):
+        self.background = None
+        self.logo_area = None
+        self.locked = []
+        bg = None
+        for info in index.top_level:
+            if info.locked:
+                self.locked.append(info)
+                continue
+            if info.name == "bg":
+                bg = info
+            if self.logo_area is None and "logoArea" in info.roles and not info.is_group and info.layer.has_pixels:
+                x1, y1, x2, y2 = info.bbox
+                self.logo_area = (x2 - x1, y2 - y1, x1, y1)
+        if bg is not None:
+            self.background = get_layer_color(LayerView(bg.layer, composites))
+
+
+def sanitize_filename(filename):
+    """Sanitize layer names to be valid filenames."""
+    return re.sub(r'[<>:"/\\|?*]', '_', filename)
+
+def _first_most_common(values):
+    """Most frequent value; ties go to the earliest one, like Counter.most_common."""
+    uniques, first_index, counts = np.unique(values, return_index=True, return_counts=True)
+    winners = np.flatnonzero(counts == counts.max())
+    return uniques[winners[np.argmin(first_index[winners])]]
+
+
+def dominant_color(image, opaque_only=False, sample_step=1, tolerance=0):
+    """Most common colour of a PIL image, as Counter(image.getdata()) would give.
+
+    Channels are packed into one uint32 per pixel so counting happens in NumPy.
+    ``sample_step`` > 1 samples every n-th row/column, and ``tolerance`` > 0
+    buckets colours whose channels differ by up to that amount before the vote,
+    returning the most common exact colour of the winning bucket.
+    """
+    pixels = np.asarray(image)
+    if sample_step > 1:
+        pixels = pixels[::sample_step, ::sample_step]
+    single_band = pixels.ndim == 2
+    pixels = pixels.reshape(-1, 1 if single_band else pixels.shape[-1])
+    if opaque_only:
+        pixels = pixels[pixels[:, 3] > 0]
+    if not len(pixels):
+        return None
+
+    channels = pixels.shape[1]
+    wide = pixels.astype(np.uint32)
+    packed = np.zeros(len(pixels), dtype=np.uint32)
+    for channel in range(channels):
+        packed = (packed << 8) | wide[:, channel]
+
+    if tolerance > 0:
+        buckets = np.zeros(len(pixels), dtype=np.uint32)
+        for channel in range(channels):
+            buckets = (buckets << 8) | (wide[:, channel] // (tolerance + 1))
+        packed = packed[buckets == _first_most_common(buckets)]
+
+    color = int(_first_most_common(packed))
+    if single_band:
+        return color
+    return tuple((color >> (8 * (channels - 1 - channel))) & 0xFF for channel in range(channels))
+
+
+def get_better_color(layer):
+    if layer.name == "cta" and layer.is_group() or layer.name == "contactWrap" and layer.is_group():
+        try:
+            for rect in layer:
+                if rect.kind == "shape":
+                    image = rect.topil()
+                    most_common_color = dominant_color(image)
+                    return most_common_color
+                elif getattr(rect, "kind", None) == "pixel" or hasattr(rect, "getpixel"):
+                    if hasattr(rect , "topil"):  # Ensure it can be converted
+                        image = rect.topil().convert("RGB")
+                        most_common_color = dominant_color(image)
+                        if most_common_color:
+                            return most_common_color
 
-def convert_psd_to_html(zip_path):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
 
-        psd_files = [f for f in os.listdir(temp_dir) if f.endswith('.psd')]
-        if not psd_files:
-            print("Error: No PSD files found in the zip", file=sys.stderr)
-            sys.exit(1)
 
-        output_dir = os.path.join(temp_dir, "output")
-        os.makedirs(output_dir, exist_ok=True)
+        except Exception as e:
+            return None            
 
-        def sanitize_filename(filename):
-            """Sanitize layer names to be valid filenames."""
-            return re.sub(r'[<>:"/\\|?*]', '_', filename)
+def shape_better_color(layer):
+    if not layer.name.startswith("shape"):
+        return None
+    try:
+        if getattr(layer, "kind", None) in ("shape", "pixel") or hasattr(layer, "getpixel"):
+            if hasattr(layer, "topil"):
+                image = layer.topil().convert("RGBA")
 
-        def get_better_color(layer):
-            if layer.name == "cta" and layer.is_group() or layer.name == "contactWrap" and layer.is_group():
-                try:
-                    for rect in layer:
-                        if rect.kind == "shape":
-                            image = rect.topil()
-                            pixels = list(image.getdata())
-                            most_common_color = Counter(pixels).most_common(1)[0][0]
-                            return most_common_color
-                        elif getattr(rect, "kind", None) == "pixel" or hasattr(rect, "getpixel"):
-                            if hasattr(rect , "topil"):  # Ensure it can be converted
-                                image = rect.topil().convert("RGB")
-                                pixels = list(image.getdata())
-                                if pixels:
-                                    return Counter(pixels).most_common(1)[0][0]
+                if not image.width or not image.height:
+                    logger.warning(f"Layer '{layer.name}' has no pixel data.")
+                    return None
+                most_common_color = dominant_color(image, opaque_only=True)
+                if most_common_color is None:
+                    logger.warning(f"Layer '{layer.name}' has only transparent pixels")
+                    return None
+                logger.debug(f"Most common color in '{layer.name}'")
+                return most_common_color
 
+            else:
+                raise ValueError("Layer lacks 'topil' method")
+        else:
+            raise ValueError("Unsupported layer kind")
+
+    except Exception as e:
+        logger.error(f"Error processing layer '{layer.name}': {str(e)}")
+        return None
+
+
+def solid_fill_color(layer):
+    """The (r, g, b) of a layer's solid colour fill, read from its fill record, or None."""
+    if layer._psd.color_mode != ColorMode.RGB or layer.has_effects():
+        return None
+    blocks = layer.tagged_blocks
+    if blocks is None:
+        return None
+    stroke = blocks.get_data(Tag.VECTOR_STROKE_DATA)
+    if stroke and getattr(stroke.get(b"fillEnabled"), "value", True) is False:
+        return None
+    fill = blocks.get_data(Tag.SOLID_COLOR_SHEET_SETTING)
+    color = fill.get(b"Clr ") if fill is not None else None
+    if color is None or b"Rd  " not in color:
+        return None
+    return tuple(min(255, max(0, round(float(color[key])))) for key in (b"Rd  ", b"Grn ", b"Bl  "))
+
+
+def sampled_mean_color(layer, max_samples=BACKGROUND_SAMPLE_PIXELS):
+    """Mean (r, g, b) of layer.composite().convert("RGB") from a strided pixel sample.
+
+    Reads only every n-th row of the layer's channels and every n-th pixel of
+    those rows. Like composite(), fully transparent pixels count as white.
+    Returns None for layers whose composite isn't just their own pixels
+    (effects, vector masks, clipping, partial opacity) or that can't be
+    decoded channel by channel.
+    """
+    if (not _region_decodable(layer) or layer.has_effects() or layer.has_vector_mask()
+            or layer.has_clip_layers() or layer.opacity != 255):
+        return None
+    width, height = layer.width, layer.height
+    if width <= 0 or height <= 0:
+        return None
+    channels = {info.id: data for info, data in zip(layer._record.channel_info, layer._channels)}
+    mask = layer.mask if layer.has_mask() and not layer.mask.disabled else None
+    if mask is not None:
+        if mask.has_real() or ChannelID.USER_LAYER_MASK not in channels:
+            return None
+        if channels[ChannelID.USER_LAYER_MASK].compression not in (Compression.RAW, Compression.RLE):
+            return None
+
+    step = max(1, math.ceil(math.sqrt(width * height / max_samples)))
+    rows = np.arange(step // 2, height, step)
+    columns = np.arange(step // 2, width, step)
+    version = layer._psd.version
+
+    def sampled(channel_id):
+        return _decode_channel_sample(channels[channel_id], width, height, version, rows)[:, columns]
+
+    color = np.stack([sampled(channel_id) for channel_id in _COLOR_CHANNEL_IDS], axis=-1).astype(np.float64)
+    visible = np.ones(color.shape[:2], dtype=bool)
+    if ChannelID.TRANSPARENCY_MASK in channels:
+        visible &= sampled(ChannelID.TRANSPARENCY_MASK) > 0
+    if mask is not None:
+        # The mask has its own bounds; outside them it is its background colour.
+        mask_width, mask_height = mask.width, mask.height
+        mask_rows = rows + layer.top - mask.top
+        mask_columns = columns + layer.left - mask.left
+        row_inside = (mask_rows >= 0) & (mask_rows < mask_height)
+        column_inside = (mask_columns >= 0) & (mask_columns < mask_width)
+        mask_values = np.full(visible.shape, mask.background_color, dtype=np.uint8)
+        if row_inside.any() and column_inside.any():
+            decoded = _decode_channel_sample(channels[ChannelID.USER_LAYER_MASK], mask_width, mask_height,
+                                             version, mask_rows[row_inside])
+            mask_values[np.ix_(row_inside, column_inside)] = decoded[:, mask_columns[column_inside]]
+        visible &= mask_values > 0
+    color[~visible] = 255
+    return tuple(map(int, color.mean(axis=(0, 1))))
+
+
+def get_layer_color(layer):
+    """A layer's background colour: its solid fill, else the mean of its pixels."""
+    try:
+        if layer.name == "bg" or layer.name == "shape 1" or layer.name == "shape1":
+            if layer.is_group():
+                return None 
+
+            source = layer.layer if isinstance(layer, LayerView) else layer
+            color = solid_fill_color(source)
+            if color is None:
+                color = sampled_mean_color(source)
+            if color is not None:
+                return color
+
+            image = layer.composite()
+            image = image.convert("RGB")
+            np_image = np.array(image)
+
+            avg_color = np.mean(np_image, axis=(0, 1)) 
+            return tuple(map(int, avg_color))
+    except Exception as e:
+        return None        
+
+
+def get_text_layer_dimensions(layer):
+    if layer.kind == 'type': 
+        tx1, ty1, tx2, ty2 = layer.bbox
+        width, height = tx2 - tx1, ty2 - ty1 
+        return width, height, tx1, ty1
+    return None, None, None, None
+
+
+def image_to_array(image):
+    """View a PIL image as a NumPy array (RGB/RGBA channel order) for OpenCV."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image)
+    return image
+
+
+def to_gray(image):
+    if image.ndim == 2:
+        return image
+    code = cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(image, code)
+
+
+def polygon_css(points, precision=None):
+    """CSS polygon() for an (n, 2) array or an OpenCV (n, 1, 2) contour.
+
+    All coordinates are formatted in a single %-format pass. ``precision`` is
+    the number of decimals; None prints the values as integers.
+    """
+    points = np.asarray(points).reshape(-1, 2)
+    coordinate = "%dpx %dpx" if precision is None else f"%.{precision}fpx %.{precision}fpx"
+    return "polygon(" + ", ".join([coordinate] * len(points)) % tuple(points.ravel().tolist()) + ")"
+
+
+def ellipse_points(center, axes, angle, num_points):
+    """Points on a rotated ellipse, as returned by cv2.fitEllipse, as an (n, 2) array."""
+    theta = 2 * np.pi * np.arange(num_points) / num_points
+    angle_rad = math.radians(angle)
+    a, b = axes[0] / 2, axes[1] / 2
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    x = center[0] + a * cos_theta * math.cos(angle_rad) - b * sin_theta * math.sin(angle_rad)
+    y = center[1] + a * cos_theta * math.sin(angle_rad) + b * sin_theta * math.cos(angle_rad)
+    return np.column_stack((x, y))
+
+
+def ellipse_clip_path(center, axes, angle, num_points, precision):
+    """clip-path for a fitted ellipse.
+
+    With CLIP_PATH_ELLIPSE_MODE = "ellipse", an (almost) axis-aligned ellipse
+    becomes a native ellipse(), a few dozen bytes instead of a polygon with
+    num_points vertices. CSS ellipse() can't rotate, so tilted ellipses always
+    stay polygons.
+    """
+    if CLIP_PATH_ELLIPSE_MODE == "ellipse":
+        tilt = angle % 180
+        if min(tilt, 180 - tilt) <= ELLIPSE_AXIS_TOLERANCE_DEG:
+            rx, ry = axes[0] / 2, axes[1] / 2
+        elif abs(tilt - 90) <= ELLIPSE_AXIS_TOLERANCE_DEG:
+            rx, ry = axes[1] / 2, axes[0] / 2
+        else:
+            rx = None
+        if rx is not None:
+            return f"ellipse({rx:.{precision}f}px {ry:.{precision}f}px at {center[0]:.{precision}f}px {center[1]:.{precision}f}px)"
+    return polygon_css(ellipse_points(center, axes, angle, num_points), precision)
+
+
+def _vector_components(vector_mask):
+    """The mask's subpaths as (operation, [knot lists]) components, as psd_tools fills them."""
+    components = []
+    for subpath in vector_mask.paths:
+        knots = [knot for knot in subpath if isinstance(knot, Knot)]
+        if subpath.operation == -1 and components:
+            components[-1][1].append((subpath, knots))
+        else:
+            components.append((subpath.operation, [(subpath, knots)]))
+    return [(operation, [(subpath, knots) for subpath, knots in subpaths if len(knots) > 1])
+            for operation, subpaths in components]
+
+
+def _points_bbox(points):
+    xs, ys = points[:, 0], points[:, 1]
+    return xs.min(), ys.min(), xs.max(), ys.max()
+
+
+def _boxes_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def vector_clip_path(layer, precision=CLIP_PATH_PRECISION):
+    """clip-path for a layer's vector mask, in layer-local pixels, without rasterizing.
+
+    Returns (shape, clip_path) where shape is "rectangle", "polygon",
+    "ellipse", "circle" or "path", or None when the layer has no vector mask
+    or the mask can't be written as one clip-path (inverted, or shape
+    operations that even-odd filling can't reproduce).
+    """
+    if not layer.has_vector_mask():
+        return None
+    vector_mask = layer.vector_mask
+    if vector_mask is None or vector_mask.disabled or vector_mask.inverted or vector_mask.initial_fill_rule:
+        return None
+
+    doc_width, doc_height = layer._psd.width, layer._psd.height
+    left, top, right, bottom = layer.bbox
+    scale = np.array([doc_width, doc_height], dtype=np.float64)
+    offset = np.array([left, top], dtype=np.float64)
+
+    def local(point):
+        # Knot points are (y, x), relative to the document. Adding 0.0 turns
+        # the -0.0 of rounded fixed-point noise into 0.0.
+        return np.round(np.array([point[1], point[0]]) * scale - offset, precision) + 0.0
+
+    # One even-odd fill over every subpath is exact for a single component, for
+    # excluded (xor) components, and for combined components that don't touch.
+    subpaths = []
+    boxes = []
+    for operation, component in _vector_components(vector_mask):
+        if not component:
+            continue
+        if operation not in (0, 1):
+            return None
+        component_points = []
+        for subpath, knots in component:
+            points = np.array([[local(knot.preceding), local(knot.anchor), local(knot.leaving)] for knot in knots])
+            component_points.append(points.reshape(-1, 2))
+            subpaths.append((subpath.is_closed(), points))
+        box = _points_bbox(np.concatenate(component_points))
+        if operation == 1 and any(_boxes_overlap(box, other) for other in boxes):
+            return None
+        boxes.append(box)
+    if not subpaths:
+        return None
+
+    fmt = f"%.{precision}f"
+    straight = all(np.allclose(points[:, 0], points[:, 1]) and np.allclose(points[:, 2], points[:, 1])
+                   for _, points in subpaths)
+    if len(subpaths) == 1:
+        closed, points = subpaths[0]
+        anchors = points[:, 1]
+        if straight:
+            xs, ys = np.unique(anchors[:, 0].round(3)), np.unique(anchors[:, 1].round(3))
+            if len(anchors) == 4 and len(xs) == 2 and len(ys) == 2 and np.allclose(
+                    [xs[0], ys[0], xs[1], ys[1]], [0, 0, right - left, bottom - top], atol=0.5):
+                return "rectangle", polygon_css(anchors, precision)
+            return "polygon", polygon_css(anchors, precision)
+        ellipses = [shape for shape in layer.origination if isinstance(shape, EllipseOrigination)]
+        if len(ellipses) == 1 and len(layer.origination) == 1:
+            x1, y1, x2, y2 = np.array(ellipses[0].bbox) - np.concatenate([offset, offset])
+            if np.allclose(_points_bbox(anchors), (x1, y1, x2, y2), atol=1.0):
+                rx, ry = (x2 - x1) / 2, (y2 - y1) / 2
+                cx, cy = x1 + rx, y1 + ry
+                if abs(rx - ry) < 0.5:
+                    return "circle", f"circle({fmt % rx}px at {fmt % cx}px {fmt % cy}px)"
+                return "ellipse", f"ellipse({fmt % rx}px {fmt % ry}px at {fmt % cx}px {fmt % cy}px)"
+
+    commands = []
+    for closed, points in subpaths:
+        commands.append("M %s %s" % (fmt % points[0, 1, 0], fmt % points[0, 1, 1]))
+        segments = list(zip(points, points[1:]))
+        if closed:
+            segments.append((points[-1], points[0]))
+        for i, (start, end) in enumerate(segments):
+            if np.allclose(start[2], start[1]) and np.allclose(end[0], end[1]):
+                if not (closed and i == len(segments) - 1):
+                    # The closing line is drawn by Z.
+                    commands.append("L %s %s" % (fmt % end[1, 0], fmt % end[1, 1]))
+            else:
+                commands.append("C " + " ".join(fmt % value for value in (*start[2], *end[0], *end[1])))
+        commands.append("Z")
+    return "path", 'path(evenodd, "%s")' % " ".join(commands)
 
 
-                except Exception as e:
-                    return None            
+def create_shapes(image):
+    try:
+        image = image_to_array(image)
+        gray = to_gray(image)
+        
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                    cv2.THRESH_BINARY, 11, 2)
+        edges = cv2.Canny(edges, 50, 150)
+        
+        kernel = np.ones((3, 3), np.uint8)
+        edges = cv2.dilate(edges, kernel, iterations=1)
+        
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        def shape_better_color(layer):
-            if not layer.name.startswith("shape"):
-                return None
-            try:
-                if getattr(layer, "kind", None) in ("shape", "pixel") or hasattr(layer, "getpixel"):
-                    if hasattr(layer, "topil"):
-                        image = layer.topil().convert("RGBA")
-                        pixels = list(image.getdata())
-                        
-                        if not pixels:
-                            print(f"Layer '{layer.name}' has no pixel data.")
-                            return None
-                        opaque_pixels = [p for p in pixels if p[3] > 0] 
-                        if not opaque_pixels:
-                            print(f"Layer '{layer.name}' has only transparent pixels: {pixels[:5]}")
-                            return None
-                        most_common_color = Counter(opaque_pixels).most_common(1)[0][0]
-                        print(f"Most common color in '{layer.name}'")
-                        return most_common_color
+        clip_paths = []
+        for i, contour in enumerate(contours, 1):
+            area = cv2.contourArea(contour)
+            perimeter = cv2.arcLength(contour, True)
+            if area < 500: 
+                continue
 
-                    else:
-                        raise ValueError("Layer lacks 'topil' method")
-                else:
-                    raise ValueError("Unsupported layer kind")
+            epsilon = 0.015 * perimeter 
+            approx = cv2.approxPolyDP(contour, epsilon, True)
+            sides = len(approx)
 
-            except Exception as e:
-                print(f"Error processing layer '{layer.name}': {str(e)}")
-                return None
+            # print(f"Contour {i}: Area={area}, Perimeter={perimeter}, Sides={sides}") done
 
+            shape = "Unknown"
+            clip_path = ""
 
-        def get_layer_color(layer):
-            try:
-                if layer.name == "bg" or layer.name == "shape 1" or layer.name == "shape1":
-                    if layer.is_group():
-                        return None 
+            if sides == 3:
+                x, y, w, h = cv2.boundingRect(contour)
+                aspect_ratio = w / h if h != 0 else 1
+                if aspect_ratio < 0.5: 
+                    shape = "Slanted Triangle"
+                else:
+                    shape = "Triangle"
+                clip_path = polygon_css(approx)
+
+            elif sides == 4:
+                shape = "Rectangle"
+                clip_path = polygon_css(approx)
+
+            elif sides > 8:
+                (center, axes, angle) = cv2.fitEllipse(contour)
+                aspect_ratio = axes[0] / axes[1] if axes[1] != 0 else 1
+                if 0.95 <= aspect_ratio <= 1.05:
+                    shape = "Circle"
+                    clip_path = f"circle({axes[0]/2:.1f}px at {center[0]:.1f}px {center[1]:.1f}px)"
+                else:
+                    shape = "Ellipse"
+                    clip_path = ellipse_clip_path(center, axes, angle, 100, 2)
+            else:
+                shape = f"Polygon with {sides} sides"
+                clip_path = polygon_css(approx)
 
+            logger.debug(f"Processed: Shape {i} - {shape}")
+            clip_paths.append(clip_path.strip("[]'"))
 
-                    if hasattr(layer, 'is_shape') and layer.is_shape():
-                        try:
-                            color = layer.fill_color
-                            if color:
-                                return color 
-                        except AttributeError:
-                            return None  
+        return clip_paths[0] if clip_paths else None
+    except Exception as e:
+        logger.error(f"Error in create_shapes: {e}")
+        return None
 
-                    image = layer.composite()
-                    image = image.convert("RGB")
-                    np_image = np.array(image)
 
-                    avg_color = np.mean(np_image, axis=(0, 1)) 
-                    return tuple(map(int, avg_color))
-            except Exception as e:
-                return None        
 
 
-        def get_text_layer_dimensions(layer):
-            if layer.kind == 'type': 
-                tx1, ty1, tx2, ty2 = layer.bbox
-                width, height = tx2 - tx1, ty2 - ty1 
-                return width, height, tx1, ty1
-            return None, None, None, None
+def image_clip_path_generate(image, child_layer, images_dir):
+    try:
+        image = image_to_array(image)
+        if image is None or not image.size:
+            raise ValueError(f"no pixels to trace for {child_layer.name}")
 
+        gray = to_gray(image)
+        if image.ndim == 3 and image.shape[2] == 4:
+            alpha = image[:, :, 3]
 
-        def create_shapes(image_path):
-            try:
-                image = cv2.imread(image_path)
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                
-                blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-                edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                            cv2.THRESH_BINARY, 11, 2)
-                edges = cv2.Canny(edges, 50, 150)
-                
-                kernel = np.ones((3, 3), np.uint8)
-                edges = cv2.dilate(edges, kernel, iterations=1)
+            if gray.min() == gray.max():
+                logger.debug("Grayscale is uniform, using alpha channel or enhancing contrast")
+                if alpha.min() != alpha.max():
+                    gray = alpha
+                else:
+                    gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
+
+        gray = cv2.GaussianBlur(gray, (3, 3), 0)
+        logger.debug("Applied Gaussian blur to grayscale")
+
+        edges = cv2.Canny(gray, 10, 50)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        edges = cv2.dilate(edges, kernel, iterations=1)
+        edges = cv2.erode(edges, kernel, iterations=1)
+        if DEBUG_IMAGES:
+            cv2.imwrite(os.path.join(images_dir, f"{child_layer.name}_edges.png"), edges)
+            annotated = cv2.cvtColor(to_gray(image), cv2.COLOR_GRAY2BGR)
+
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        logger.debug(f"Found {len(contours)} contours")
+
+        if not contours:
+            logger.warning(f"No contours found in {child_layer.name}"
+                           + (f"; check the saved edges image {child_layer.name}_edges.png" if DEBUG_IMAGES else ""))
+        else:
+            for i, contour in enumerate(contours, 1):
+                epsilon = 0.005 * cv2.arcLength(contour, True) 
+                approx = cv2.approxPolyDP(contour, epsilon, True)
+                sides = len(approx)
                 
-                contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-                clip_paths = []
-                for i, contour in enumerate(contours, 1):
-                    area = cv2.contourArea(contour)
-                    perimeter = cv2.arcLength(contour, True)
-                    if area < 500: 
-                        continue
-
-                    epsilon = 0.015 * perimeter 
-                    approx = cv2.approxPolyDP(contour, epsilon, True)
-                    sides = len(approx)
-
-                    # print(f"Contour {i}: Area={area}, Perimeter={perimeter}, Sides={sides}") done
-
-                    shape = "Unknown"
-                    clip_path = ""
+                area = cv2.contourArea(contour)
+                if area < 100:
+                    logger.debug(f"Skipping contour {i} (area < 100)")
+                    continue
 
+                if len(contour) >= 5:
+                    ellipse = cv2.fitEllipse(contour)
+                    (center, axes, angle) = ellipse
+                    aspect_ratio = axes[0] / axes[1] if axes[1] != 0 else 1
+                    
                     if sides == 3:
-                        x, y, w, h = cv2.boundingRect(contour)
-                        aspect_ratio = w / h if h != 0 else 1
-                        if aspect_ratio < 0.5: 
-                            shape = "Slanted Triangle"
-                        else:
-                            shape = "Triangle"
-                        clip_path = "polygon(" + ", ".join(f"{p[0][0]}px {p[0][1]}px" for p in approx) + ")"
-
+                        shape = "Triangle"
+                        clip_path = polygon_css(approx, 1)
                     elif sides == 4:
                         shape = "Rectangle"
-                        clip_path = "polygon(" + ", ".join(f"{p[0][0]}px {p[0][1]}px" for p in approx) + ")"
-
-                    elif sides > 8:
-                        (center, axes, angle) = cv2.fitEllipse(contour)
-                        aspect_ratio = axes[0] / axes[1] if axes[1] != 0 else 1
-                        if 0.95 <= aspect_ratio <= 1.05:
-                            shape = "Circle"
-                            clip_path = f"circle({axes[0]/2:.1f}px at {center[0]:.1f}px {center[1]:.1f}px)"
-                        else:
-                            shape = "Ellipse"
-                            num_points = 100
-                            ellipse_points = []
-                            angle_rad = math.radians(angle)
-                            cos_angle = math.cos(angle_rad)
-                            sin_angle = math.sin(angle_rad)
-                            a, b = axes[0] / 2, axes[1] / 2
-                            cx, cy = center
-
-                            for t in range(num_points):
-                                theta = 2 * math.pi * t / num_points
-                                x = cx + a * math.cos(theta) * cos_angle - b * math.sin(theta) * sin_angle
-                                y = cy + a * math.cos(theta) * sin_angle + b * math.sin(theta) * cos_angle
-                                ellipse_points.append(f"{x:.2f}px {y:.2f}px")
-
-                            clip_path = "polygon(" + ", ".join(ellipse_points) + ")"
+                        clip_path = polygon_css(approx, 1)
+                    elif sides > 8 and 0.95 <= aspect_ratio <= 1.05:
+                        shape = "Circle"
+                        clip_path = f"circle({axes[0]/2:.1f}px at {center[0]:.1f}px {center[1]:.1f}px)"
+                    elif sides > 6 and (aspect_ratio < 0.95 or aspect_ratio > 1.05):
+                        shape = "Ellipse"
+                        clip_path = ellipse_clip_path(center, axes, angle, 256, 1)
                     else:
                         shape = f"Polygon with {sides} sides"
-                        clip_path = "polygon(" + ", ".join(f"{p[0][0]}px {p[0][1]}px" for p in approx) + ")"
-
-                    print(f"Processed: Shape {i} - {shape}")
-                    clip_paths.append(clip_path.strip("[]'"))
-                    cv2.drawContours(image, [approx], -1, (0, 255, 0), 2)
-
-                return clip_paths[0] if clip_paths else None
+                        clip_path = polygon_css(approx, 1)
+                else:
+                    shape = f"Polygon with {sides} sides"
+                    clip_path = polygon_css(approx, 1)
+                logger.debug(f"Contour {i}: Shape type = {shape}")
+                if shape == "Rectangle":
+                    return None
+
+                logger.debug(f"Processed: Shape {i}, Clip-path:")
+
+                if DEBUG_IMAGES:
+                    cv2.drawContours(annotated, [approx], -1, (0, 255, 0), 2)
+                    if 'ellipse' in locals():
+                        cv2.ellipse(annotated, ellipse, (255, 0, 0), 2)
+            if DEBUG_IMAGES:
+                cv2.imwrite(os.path.join(images_dir, f"{child_layer.name}_contours.png"), annotated)
+                logger.info(f"Saved annotated image: {child_layer.name}_contours.png")
+            return clip_path
+    except Exception as e:
+        logger.error(f"Error in image_clip_path_generate for {child_layer.name}: {e}")
+
+
+
+def rgba_to_rgb(rgba_values):
+    if not rgba_values or len(rgba_values) < 3:
+        return None
+    r = int(rgba_values[1] * 255)
+    g = int(rgba_values[2] * 255)
+    b = int(rgba_values[3] * 255)
+    return (r, g, b)
+
+FONT_WEIGHTS = {
+    'Thin': '100',
+    'ExtraLight': '200',
+    'Light': '300',
+    'Regular': '400',
+    'Normal': '400',
+    'Medium': '500',
+    'SemiBold': '600',
+    'Bold': '700',
+    'ExtraBold': '800',
+    'Black': '900',
+}
+FONT_NAME_PATTERN = re.compile(r'^(.*?)[-_ ]?(Thin|ExtraLight|Light|Regular|Normal|Medium|SemiBold|Bold|ExtraBold|Black)?(Italic)?$',
+                               re.IGNORECASE)
+# CSS text-align of a paragraph's Justification; anything else is left.
+TEXT_ALIGN = {0: "left", 1: "center", 2: "center"}
+
+
+def extract_font_weight(font_name):
+    font_name = font_name.strip().strip("'\"")
+    font_name = font_name.replace("\xa0", " ")
+    font_name = font_name.encode("ascii", "ignore").decode()
+    
+    match = FONT_NAME_PATTERN.match(font_name)
+    if match:
+        font_family = match.group(1).replace("Roman", "").strip()
+        fontWt = match.group(2) if match.group(2) else "Regular"
+        italic_w = match.group(3) if match.group(3) else "normal"
+        italic_wd = italic_w.lower() 
+    else:
+        font_family = font_name
+        fontWt = "Regular"
+    
+    fontWt = fontWt[0].upper() + fontWt[1:] if fontWt.lower() != "regular" else "Regular"
+    fontGetWeight = FONT_WEIGHTS.get(fontWt, '400')
+    return font_family, fontWt, fontGetWeight, italic_wd
+
+
+def _run_spans(run):
+    """(start, end, item) for each entry of an engine-data run (StyleRun, ParagraphRun)."""
+    start = 0
+    for item, length in zip(run.get('RunArray', []), run.get('RunLengthArray', [])):
+        yield start, start + int(length), item
+        start += int(length)
+
+
+class TextRun:
+    """Characters [start, end) of a type layer and the style they are set in."""
+
+    __slots__ = ("start", "end", "font", "font_size", "leading", "font_caps", "fill", "stroke")
+
+    def __init__(self, start, end, sheet, fonts):
+        self.start = start
+        self.end = end
+        font = sheet.get('Font')
+        self.font = fonts[font] if font is not None and 0 <= font < len(fonts) else None
+        self.font_size = sheet.get('FontSize')
+        self.leading = sheet.get('Leading')
+        self.font_caps = sheet.get('FontCaps')
+        fill = sheet.get('FillColor', {}).get('Values')
+        stroke = sheet.get('StrokeColor', {}).get('Values')
+        self.fill = rgba_to_rgb(fill) if fill else None
+        self.stroke = rgba_to_rgb(stroke) if stroke else None
+
+
+class ParagraphRun:
+    """Characters [start, end) of a type layer and their paragraph alignment."""
+
+    __slots__ = ("start", "end", "justification")
+
+    def __init__(self, start, end, properties):
+        self.start = start
+        self.end = end
+        self.justification = properties.get('Justification')
+
+    @property
+    def text_align(self):
+        return TEXT_ALIGN.get(self.justification, "left")
+
+
+class TextStyle:
+    """A type layer's style runs and paragraphs, parsed once from its engine data.
+
+    The CSS values describe the first run and paragraph: the font size and
+    line height in px (pt at 72 dpi, scaled by the layer transform), the
+    line height in em, alignment, caps, colour and the resolved font.
+    """
+
+    __slots__ = ("runs", "paragraphs", "font_size", "line_height", "line_height_em", "text_align",
+                 "caps", "color", "stroke", "family", "weight_name", "weight", "font_style")
+
+    def __init__(self, layer):
+        engine = layer.engine_dict
+        fonts = [str(font['Name']).strip("'\"") for font in layer.resource_dict['FontSet']]
+        self.runs = [TextRun(start, end, item.get('StyleSheet', {}).get('StyleSheetData', {}), fonts)
+                     for start, end, item in _run_spans(engine.get('StyleRun', {}))]
+        self.paragraphs = [ParagraphRun(start, end, item.get('ParagraphSheet', {}).get('Properties', {}))
+                           for start, end, item in _run_spans(engine.get('ParagraphRun', {}))]
+
+        first = self.runs[0]
+        scale_x = layer.transform[0]
+        self.font_size = f'{first.font_size * scale_x:.2f}'
+        # Auto leading, and anything looser than 120%, is set at 120%.
+        if first.leading is None or float(first.font_size) * 1.2 < first.leading:
+            line_height = first.font_size * 1.2
+        else:
+            line_height = first.leading
+        self.line_height = f'{line_height * scale_x:.2f}'
+        self.line_height_em = round(float(self.line_height) / float(self.font_size), 2)
+        self.text_align = self.paragraphs[0].text_align if self.paragraphs else "left"
+        self.caps = first.font_caps == 2
+        self.color = first.fill
+        self.stroke = first.stroke
+        self.family, self.weight_name, self.weight, self.font_style = extract_font_weight(first.font or fonts[0])
+
+
+_local_font_index = {}
+
+
+def local_fonts(font_dir=FONT_DIR):
+    """(family, weight, style) -> font file for the fonts under ``font_dir``.
+
+    Faces are keyed the way extract_font_weight resolves a PSD font, from each
+    file's PostScript name (or its file name). The scan is cached until the
+    directory changes.
+    """
+    if TTFont is None or not os.path.isdir(font_dir):
+        return {}
+    stamp = os.stat(font_dir).st_mtime_ns
+    cached = _local_font_index.get(font_dir)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    faces = {}
+    for root, dirs, files in os.walk(font_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(FONT_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with TTFont(path, lazy=True) as font:
+                    postscript_name = font["name"].getDebugName(6)
             except Exception as e:
-                print(f"Error in create_shapes for {image_path}: {e}")
-                return None
-
-
-
-
-        def image_clip_path_generate(image_path, child_layer):
+                logger.warning(f"Skipping font {path}: {e}")
+                continue
+            family, _, weight, style = extract_font_weight(postscript_name or os.path.splitext(name)[0])
+            faces.setdefault((family, weight, style), path)
+    _local_font_index[font_dir] = (stamp, faces)
+    return faces
+
+
+def font_settings(font_dir=FONT_DIR):
+    """What about the local fonts changes a banner's output, for cache keys."""
+    faces = local_fonts(font_dir)
+    return {"display": FONT_DISPLAY,
+            "faces": sorted([*face, os.path.getsize(path), os.path.getmtime(path)] for face, path in faces.items())}
+
+
+class FontSubsetter:
+    """Collects the faces and characters a banner's text uses, then self-hosts them.
+
+    ``usage`` is a plain list of [family, weight, style, text] so cached layer
+    fragments can replay it.
+    """
+
+    def __init__(self, fonts_dir, font_dir=FONT_DIR, display=FONT_DISPLAY):
+        self.fonts_dir = fonts_dir
+        self.font_dir = font_dir
+        self.display = display
+        self.usage = []
+
+    def use(self, family, weight, style, text):
+        self.usage.append([family, weight, style, text])
+
+    def faces(self):
+        """(family, weight, style) -> the characters set in it, in order of first use."""
+        faces = {}
+        for family, weight, style, text in self.usage:
+            faces.setdefault((family, weight, style), set()).update(text)
+        return faces
+
+    def build(self):
+        """Write a WOFF2 subset of every used face found locally.
+
+        Returns the @font-face rules for style.css and the faces that weren't
+        found (or couldn't be subset).
+        """
+        faces = self.faces()
+        local = local_fonts(self.font_dir)
+        rules, missing = [], []
+        for (family, weight, style), characters in faces.items():
+            path = local.get((family, weight, style))
+            if path is None:
+                missing.append((family, weight, style))
+                continue
+            suffix = "-italic" if style == "italic" else ""
+            filename = sanitize_filename(f"{family}-{weight}{suffix}.woff2").replace(" ", "-")
             try:
-                image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-                if image is None:
-                    raise FileNotFoundError(f"cv2.imread failed to load {image_path}")
-
-                if image.shape[2] == 4:
-                    b, g, r, alpha = cv2.split(image)
-                    gray = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
-
-                    if gray.min() == gray.max():
-                        print("Grayscale is uniform, using alpha channel or enhancing contrast")
-                        if alpha.min() != alpha.max():
-                            gray = alpha
-                        else:
-                            gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
-
-                gray = cv2.GaussianBlur(gray, (3, 3), 0)
-                print(f"Applied Gaussian blur to grayscale")
-
-                edges = cv2.Canny(gray, 10, 50)
-                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-                edges = cv2.dilate(edges, kernel, iterations=1)
-                edges = cv2.erode(edges, kernel, iterations=1)
-                cv2.imwrite(f"output/{file_name_t}/images/{child_layer.name}_edges.png", edges)
-
-                contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                print(f"Found {len(contours)} contours")
-
-                if not contours:
-                    print(f"No contours found. Check saved edges image: {child_layer.name}_edges.png")
-                else:
-                    for i, contour in enumerate(contours, 1):
-                        epsilon = 0.005 * cv2.arcLength(contour, True) 
-                        approx = cv2.approxPolyDP(contour, epsilon, True)
-                        sides = len(approx)
-                        
-                        area = cv2.contourArea(contour)
-                        if area < 100:
-                            print(f"Skipping contour {i} (area < 100)")
-                            continue
-
-                        if len(contour) >= 5:
-                            ellipse = cv2.fitEllipse(contour)
-                            (center, axes, angle) = ellipse
-                            aspect_ratio = axes[0] / axes[1] if axes[1] != 0 else 1
-                            
-                            if sides == 3:
-                                shape = "Triangle"
-                                clip_path = "polygon(" + ", ".join(f"{p[0][0]:.1f}px {p[0][1]:.1f}px" for p in approx) + ")"
-                            elif sides == 4:
-                                shape = "Rectangle"
-                                clip_path = "polygon(" + ", ".join(f"{p[0][0]:.1f}px {p[0][1]:.1f}px" for p in approx) + ")"
-                            elif sides > 8 and 0.95 <= aspect_ratio <= 1.05:
-                                shape = "Circle"
-                                clip_path = f"circle({axes[0]/2:.1f}px at {center[0]:.1f}px {center[1]:.1f}px)"
-                            elif sides > 6 and (aspect_ratio < 0.95 or aspect_ratio > 1.05):
-                                shape = "Ellipse"
-                                num_points = 256 
-                                ellipse_points = []
-                                angle_rad = math.radians(angle)
-                                cos_angle = math.cos(angle_rad)
-                                sin_angle = math.sin(angle_rad)
-                                a = axes[0] / 2  
-                                b = axes[1] / 2  
-                                cx, cy = center
-
-                                for t in range(num_points):
-                                    theta = 2 * math.pi * t / num_points
-                                    x = cx + a * math.cos(theta) * cos_angle - b * math.sin(theta) * sin_angle
-                                    y = cy + a * math.cos(theta) * sin_angle + b * math.sin(theta) * cos_angle
-                                    ellipse_points.append(f"{x:.1f}px {y:.1f}px")
-                                
-                                clip_path = "polygon(" + ", ".join(ellipse_points) + ")"
-                                css_ellipse = f"ellipse({a:.1f}px {b:.1f}px at {cx:.1f}px {cy:.1f}px) rotate({angle:.1f}deg)"
-                            else:
-                                shape = f"Polygon with {sides} sides"
-                                clip_path = "polygon(" + ", ".join(f"{p[0][0]:.1f}px {p[0][1]:.1f}px" for p in approx) + ")"
-                        else:
-                            shape = f"Polygon with {sides} sides"
-                            clip_path = "polygon(" + ", ".join(f"{p[0][0]:.1f}px {p[0][1]:.1f}px" for p in approx) + ")"
-                        print(f"Contour {i}: Shape type = {shape}")
-                        if shape == "Rectangle":
-                            file_path_r = [
-                                image_path,
-                                f"output/{file_name_t}/images/{child_layer.name}_edges.png"
-                            ]
-                            for path_r in file_path_r:
-                                if os.path.exists(path_r):
-                                    os.remove(path_r)
-                            return None
-
-                        if shape == "Ellipse":
-                            print(f"CSS Ellipse Alternative: {css_ellipse}")
-                        print(f"Processed: Shape {i}, Clip-path:")
-                        
-                        cv2.drawContours(image, [approx], -1, (0, 255, 0), 2)
-                        if 'ellipse' in locals():
-                            cv2.ellipse(image, ellipse, (255, 0, 0), 2)
-                    cv2.imwrite(f"output/{file_name_t}/images/{child_layer.name}_contours.png", image)
-                    print(f"Saved annotated image: {child_layer.name}_contours.png")
-                    file_path_r = [
-                        image_path,
-                        f"output/{file_name_t}/images/{child_layer.name}_edges.png",
-                        f"output/{file_name_t}/images/{child_layer.name}_contours.png"   
-                    ] 
-                    for path_r in file_path_r:
-                        os.remove(path_r)
-                    return clip_path
+                self._subset(path, characters, os.path.join(self.fonts_dir, filename))
             except Exception as e:
-                print(f"Error in create_shapes for {image_path}: {e}")
- 
-
-
-        def rgba_to_rgb(rgba_values):
-            if not rgba_values or len(rgba_values) < 3:
-                return None
-            r = int(rgba_values[1] * 255)
-            g = int(rgba_values[2] * 255)
-            b = int(rgba_values[3] * 255)
-            return (r, g, b)
-
-        def extract_font_weight(font_name):
-            font_weights = {
-                'Thin': '100',
-                'ExtraLight': '200',
-                'Light': '300',
-                'Regular': '400',
-                'Normal': '400',
-                'Medium': '500',
-                'SemiBold': '600',
-                'Bold': '700',
-                'ExtraBold': '800',
-                'Black': '900',
-            }
-
-            font_name = font_name.strip().strip("'\"")
-            font_name = font_name.replace("\xa0", " ")
-            font_name = font_name.encode("ascii", "ignore").decode()
-            
-            match = re.match(r'^(.*?)[-_ ]?(Thin|ExtraLight|Light|Regular|Normal|Medium|SemiBold|Bold|ExtraBold|Black)?(Italic)?$', font_name, re.IGNORECASE)
-            if match:
-                font_family = match.group(1).replace("Roman", "").strip()
-                fontWt = match.group(2) if match.group(2) else "Regular"
-                italic_w = match.group(3) if match.group(3) else "normal"
-                italic_wd = italic_w.lower() 
+                logger.warning(f"Failed to subset {path}: {e}")
+                missing.append((family, weight, style))
+                continue
+            rules.append(f"""
+            @font-face {{
+                font-family: '{family}';
+                font-style: {style};
+                font-weight: {weight};
+                font-display: {self.display};
+                src: url('../fonts/{filename}') format('woff2');
+            }}
+            """)
+        if missing:
+            logger.info(f"Fonts not available locally, linking hosted fonts: {missing}")
+        return rules, missing
+
+    @staticmethod
+    def _subset(path, characters, output_path):
+        options = font_subset.Options()
+        options.flavor = "woff2"
+        options.layout_features = ["*"]
+        font = font_subset.load_font(path, options)
+        try:
+            subsetter = font_subset.Subsetter(options)
+            subsetter.populate(text="".join(sorted(characters)))
+            subsetter.subset(font)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            font_subset.save_font(font, output_path, options)
+        finally:
+            font.close()
+
+
+_CSS_STRING = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_PSEUDO_OR_ATTRIBUTE = re.compile(r"::?[-\w]+(\([^)]*\))?|\[[^\]]*\]")
+_CSS_COMPOUND_TOKEN = re.compile(r"([.#]?)([-\w]+)")
+_CSS_IMPORTANT = re.compile(r"!\s*important\s*$", re.IGNORECASE)
+# A vendor-prefixed keyword or function in a value, e.g. -webkit-box.
+_CSS_VENDOR_VALUE = re.compile(r"(^|[^\w-])-(webkit|moz|ms|o)-")
+# White-space: normal collapses these, but never a no-break space.
+_HTML_SPACE = re.compile(r"[ \t\n\r\f]+")
+
+
+def _squeeze(text, around=""):
+    """Collapse whitespace outside CSS strings, dropping it around the ``around`` characters."""
+    parts = _CSS_STRING.split(text)
+    tight = re.compile(rf"\s*([{re.escape(around)}])\s*") if around else None
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+        if tight:
+            parts[i] = tight.sub(r"\1", parts[i])
+    return "".join(parts).strip()
+
+
+def _split_outside(text, separator):
+    """Split ``text`` on ``separator`` where it isn't inside a string or brackets."""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote and text[i - 1] != "\\":
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _css_blocks(css):
+    """Yield (prelude, body) per top-level block; body is None for ``@import ...;`` statements."""
+    depth, quote, start, opened = 0, None, 0, 0
+    for i, ch in enumerate(css):
+        if quote:
+            if ch == quote and css[i - 1] != "\\":
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "{":
+            if depth == 0:
+                opened = i
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"unbalanced '}}' at offset {i}")
+            if depth == 0:
+                yield css[start:opened], css[opened + 1:i]
+                start = i + 1
+        elif ch == ";" and depth == 0:
+            yield css[start:i], None
+            start = i + 1
+    if depth or quote:
+        raise ValueError("unterminated block or string")
+    if css[start:].strip():
+        yield css[start:], None
+
+
+def _declarations(body):
+    declarations = []
+    for item in _split_outside(body, ";"):
+        prop, colon, value = item.partition(":")
+        prop, value = prop.strip(), _squeeze(value, ",")
+        if colon and prop and value:
+            declarations.append((prop, value))
+    return declarations
+
+
+def _dedupe_declarations(declarations):
+    """Keep one declaration per property: the last one, or the last ``!important`` one.
+
+    An overridden value stays when either it or its override is vendor-prefixed,
+    since that is a fallback (``display: -webkit-box; display: flex``).
+    """
+    kept = []
+    for prop, value in reversed(declarations):
+        key = prop if prop.startswith("--") else prop.lower()
+        important = bool(_CSS_IMPORTANT.search(value))
+        overridden = False
+        for later in list(kept):
+            later_key, later_prop, later_value, later_important = later
+            if later_key != key:
+                continue
+            if (later_prop, later_value) == (prop, value):
+                overridden = True
+                break
+            if _CSS_VENDOR_VALUE.search(value) or _CSS_VENDOR_VALUE.search(later_value):
+                continue
+            if important and not later_important:
+                kept.remove(later)
             else:
-                font_family = font_name
-                fontWt = "Regular"
-            
-            fontWt = fontWt[0].upper() + fontWt[1:] if fontWt.lower() != "regular" else "Regular"
-            fontGetWeight = font_weights.get(fontWt, '400')
-            return font_family, fontWt, fontGetWeight, italic_wd
-
-
-        
-        def broder_radius_get(shape, child_layer):
-            radii = getattr(shape, 'radii', None)
-            if radii:
-                # print(f"child_layer '{child_layer.name}' has border radius: {radii}")
-                top_left = radii.get(b'topLeft', 0.0)
-                top_right = radii.get(b'topRight', 0.0)
-                bottom_right = radii.get(b'bottomRight', 0.0)
-                bottom_left = radii.get(b'bottomLeft', 0.0)
-                
-                border_radius = f"{top_left}px {top_right}px {bottom_right}px {bottom_left}px"
-                return border_radius
+                overridden = True
+        if not overridden:
+            kept.append((key, prop, value, important))
+    return [(prop, value) for _, prop, value, _ in reversed(kept)]
+
+
+def _unprefixed(prop):
+    return prop if prop.startswith("--") else re.sub(r"^-(webkit|moz|ms|o)-", "", prop.lower())
+
+
+def _property_family(prop):
+    if prop.startswith("--"):
+        return prop
+    root = _unprefixed(prop).split("-")[0]
+    return CSS_PROPERTY_FAMILIES.get(root, root)
+
+
+def _order_free(declarations):
+    """Whether reordering a block's declarations can't change it: no property
+    repeats, and none is a shorthand of another."""
+    props = [(_unprefixed(prop), _property_family(prop)) for prop, _ in declarations]
+    for i, (prop, family) in enumerate(props):
+        for other, other_family in props[i + 1:]:
+            if prop == other or other.startswith(f"{prop}-") or prop.startswith(f"{other}-"):
+                return False
+            if "all" in (prop, other) or (family == other_family and (
+                    family in (prop, other) or prop.startswith("place-") or other.startswith("place-"))):
+                return False
+    return True
+
+
+class CssRule:
+    """A style rule of the generated stylesheet: its selectors and (property, value) pairs."""
+
+    __slots__ = ("selectors", "declarations", "_families", "_block")
+
+    def __init__(self, selectors, declarations):
+        self.selectors = selectors
+        self.declarations = declarations
+        self._families = self._block = None
+
+    @property
+    def families(self):
+        if self._families is None:
+            self._families = {_property_family(prop) for prop, _ in self.declarations}
+        return self._families
+
+    @property
+    def block(self):
+        """The declarations, as a set when their order doesn't matter."""
+        if self._block is None:
+            ordered = not _order_free(self.declarations)
+            self._block = tuple(self.declarations) if ordered else frozenset(self.declarations)
+        return self._block
+
+    @property
+    def groupable(self):
+        # A selector list is dropped whole if one selector is invalid, so
+        # vendor pseudo-elements/classes stay in rules of their own.
+        return not any(":-" in selector for selector in self.selectors)
+
+    def __str__(self):
+        return f"{','.join(self.selectors)}{{{';'.join(f'{prop}:{value}' for prop, value in self.declarations)}}}"
+
+    def minified(self):
+        return CssRule(self.selectors, _dedupe_declarations([(prop, _squeeze(value, ","))
+                                                             for prop, value in self.declarations]))
+
+    def readable(self):
+        declarations = "".join(f"    {prop}: {value};\n" for prop, value in self.declarations)
+        return f"{', '.join(self.selectors)} {{\n{declarations}}}\n"
+
+
+def parse_css(css):
+    """Minified CssRules for the top-level style rules of ``css``; at-rules stay as text."""
+    rules = []
+    for prelude, body in _css_blocks(_CSS_COMMENT.sub("", css)):
+        prelude = _squeeze(prelude)
+        if body is None:
+            if prelude:
+                rules.append(f"{prelude};")
+        elif prelude.startswith("@"):
+            if "{" in body:
+                inner = "".join(str(rule) for rule in parse_css(body))
             else:
-                print(f"child_layer '{child_layer.name}' is a rounded rectangle but no radius defined.")
-                return None
-
-
-        for psd_file in psd_files:  
-            psd_path = os.path.join(temp_dir, psd_file)
-            psd = PSDImage.open(psd_path)
-            file_name_t = os.path.splitext(psd_file)[0]
-            width_meta, height_meta = psd.width, psd.height
-
-            need_valid_sizes = [(300, 600), (320, 520), (160, 600)]
-            width_contain = None
-            width_psd, height_psd = psd.width, psd.height
-
-            output_dir = f"output/{file_name_t}"
-            os.makedirs(f"{output_dir}/images", exist_ok=True)
-            os.makedirs(f"{output_dir}/css", exist_ok=True)
-
-            sequenceOrder_layer = {
-                "mainHeading": [],
-                "subHeading": [],
-                "offer": [],
-                "cta": [],
-                "contactWrap": []
-            }
-            outerSection = {
-                "logo": [],
-                "mainImages": [],
-                "shapes": []
-            }
-            extracted_values = {}
-
-            def process_layer(layer, html_content, css_content, content_html_app):
-
-                image = layer.composite()
-                sanitized_name = sanitize_filename(layer.name)
+                inner = ";".join(f"{prop}:{value}" for prop, value in _declarations(body))
+            rules.append(f"{prelude}{{{inner}}}")
+        else:
+            selectors = [_squeeze(selector) if "[" in selector or "(" in selector
+                         else _squeeze(selector, ",>+~")
+                         for selector in _split_outside(prelude, ",")]
+            declarations = _dedupe_declarations(_declarations(body))
+            if declarations:
+                rules.append(CssRule(list(dict.fromkeys(selectors)), declarations))
+    return rules
+
+
+class DocumentNames:
+    """Tag names, classes and ids a page uses, to tell which selectors can match it."""
+
+    __slots__ = ("tags", "classes", "ids")
+
+    def __init__(self, tags=(), classes=(), ids=()):
+        self.tags, self.classes, self.ids = set(tags), set(classes), set(ids)
+
+    def may_match(self, selector):
+        """False only when ``selector`` names a tag, class or id the page lacks."""
+        if "\\" in selector:
+            return True
+        for compound in re.split(r"[\s>+~]+", _CSS_PSEUDO_OR_ATTRIBUTE.sub("", selector)):
+            for prefix, name in _CSS_COMPOUND_TOKEN.findall(compound):
+                known = {"": self.tags, ".": self.classes, "#": self.ids}[prefix]
+                if (name.lower() if not prefix else name) not in known:
+                    return False
+        return True
+
+
+def _merge_rules(rules, same):
+    """Fold each CssRule into an earlier one when ``same(earlier, later)``.
+
+    The merged rule sits where the earlier one was, or failing that where the
+    later one was, whichever doesn't carry declarations past a rule that sets
+    a property of the same family (or past an at-rule that styles elements).
+    """
+    merged = []
+    for rule in rules:
+        if isinstance(rule, CssRule):
+            for i in range(len(merged) - 1, -1, -1):
+                earlier = merged[i]
+                if not isinstance(earlier, CssRule) or not same(earlier, rule):
+                    continue
+                between = merged[i + 1:]
+                if any(isinstance(other, str) and not other.startswith(CSS_INERT_AT_RULES) for other in between):
+                    break
+                touched = set().union(*(other.families for other in between if isinstance(other, CssRule)))
+                combined = CssRule(list(dict.fromkeys(earlier.selectors + rule.selectors)),
+                                   _dedupe_declarations(earlier.declarations + rule.declarations))
+                if not rule.families & touched:
+                    merged[i] = combined
+                    rule = None
+                elif not earlier.families & touched:
+                    del merged[i]
+                    rule = combined
+                break
+        if rule is not None:
+            merged.append(rule)
+    return merged
+
+
+def optimize_rules(rules, names=None):
+    """Drop unused selectors, then merge duplicate selectors and identical rules.
+
+    ``rules`` are CssRules and at-rule strings, as parse_css returns them;
+    they aren't modified. ``names`` is the DocumentNames of the page; without
+    it nothing is pruned.
+    """
+    if names is not None:
+        rules = [rule if not isinstance(rule, CssRule)
+                 else CssRule([selector for selector in rule.selectors if names.may_match(selector)],
+                              rule.declarations)
+                 for rule in rules]
+        rules = [rule for rule in rules if not isinstance(rule, CssRule) or rule.selectors]
+    rules = _merge_rules(rules, lambda earlier, later: earlier.selectors == later.selectors)
+    return _merge_rules(rules, lambda earlier, later: (earlier.groupable and later.groupable
+                                                       and earlier.block == later.block))
+
+
+def broder_radius_get(shape, child_layer):
+    radii = getattr(shape, 'radii', None)
+    if radii:
+        # print(f"child_layer '{child_layer.name}' has border radius: {radii}")
+        top_left = radii.get(b'topLeft', 0.0)
+        top_right = radii.get(b'topRight', 0.0)
+        bottom_right = radii.get(b'bottomRight', 0.0)
+        bottom_left = radii.get(b'bottomLeft', 0.0)
+        
+        border_radius = f"{top_left}px {top_right}px {bottom_right}px {bottom_left}px"
+        return border_radius
+    else:
+        logger.warning(f"child_layer '{child_layer.name}' is a rounded rectangle but no radius defined.")
+        return None
+
+
+def list_psd_members(zip_ref):
+    """Names of the .psd entries of an upload, at any depth, in a stable order.
+
+    Only the central directory is read. macOS resource forks (__MACOSX/, ._*)
+    are skipped, and so are later entries whose file name repeats an earlier
+    one, since both would convert into the same output/<name>/.
+    """
+    members = {}
+    for info in sorted(zip_ref.infolist(), key=lambda info: info.filename):
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or not base.lower().endswith('.psd'):
+            continue
+        if base.startswith('._') or name.startswith('__MACOSX/'):
+            continue
+        if base in members:
+            logger.warning(f"Skipping {name}: {members[base]} already converts to output/{os.path.splitext(base)[0]}")
+            continue
+        members[base] = name
+    return list(members.values())
+
+
+def spool_psd_member(zip_path, member, max_memory_bytes=PSD_SPOOL_MAX_BYTES):
+    """Copy one .psd entry out of the upload without extracting the archive.
+
+    The entry is decompressed into a spooled buffer that stays in memory up to
+    ``max_memory_bytes`` and rolls over to a temp file beyond that (0 goes
+    straight to disk), and is hashed on the way. Returns (spool, sha256 hexdigest).
+    """
+    digest = hashlib.sha256()
+    if max_memory_bytes > 0:
+        spool = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes)
+    else:
+        spool = tempfile.TemporaryFile()
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref, zip_ref.open(member) as src:
+        while chunk := src.read(1024 * 1024):
+            digest.update(chunk)
+            spool.write(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+
+def convert_psd_file(zip_path, member):
+    """Convert one PSD entry of the upload and return the banner's directory.
+
+    The banner is built as <name>/ in a fresh hidden directory under
+    OUTPUT_ROOT, so neither leftovers of an earlier conversion nor another
+    worker converting a banner of the same name can touch it;
+    publish_output_tree() moves it to OUTPUT_ROOT/<name>/ once it's zipped.
+    Unchanged PSDs are restored from the conversion cache instead of rendered.
+    """
+    file_name_t = os.path.splitext(os.path.basename(member))[0]
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=".build-", dir=OUTPUT_ROOT)
+    try:
+        return _convert_psd_file(zip_path, member, file_name_t, os.path.join(build_dir, file_name_t))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+
+def _convert_psd_file(zip_path, member, file_name_t, output_dir):
+    cache = ConversionCache()
+    memory = MemoryBudget()
+    with timings.span("spool"):
+        # Bounded conversions keep the raw PSD on disk; psd_tools reads it from there.
+        spool, digest = spool_psd_member(zip_path, member, 0 if memory.enabled else PSD_SPOOL_MAX_BYTES)
+    with spool:
+        cache_key = cache.key(digest, file_name_t)
+        with timings.span("cache_restore"):
+            restored = cache.restore(cache_key, output_dir)
+        if restored:
+            logger.info(f"Conversion cache hit for {file_name_t}")
+            return output_dir
+        with timings.span("parse"):
+            psd = PSDImage.open(spool)
+
+    with timings.span("render"):
+        render_psd(psd, file_name_t, memory, output_dir)
+    if memory.degraded:
+        logger.warning(f"{file_name_t}: {memory.degraded} render(s) downsampled to stay under "
+                       f"{memory.max_rss_bytes} bytes; not caching the result")
+        return output_dir
+    with timings.span("cache_store"):
+        cache.store(cache_key, output_dir)
+    return output_dir
+
+
+def publish_output_tree(output_dir):
+    """Move a banner built by convert_psd_file to OUTPUT_ROOT/<name>/, replacing the one there."""
+    build_dir = os.path.dirname(output_dir)
+    target = os.path.join(OUTPUT_ROOT, os.path.basename(output_dir))
+    try:
+        for attempt in itertools.count():
+            try:
+                os.rename(output_dir, target)
+                return
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+            # Move the published tree aside into our build directory; it goes with it.
+            try:
+                os.rename(target, os.path.join(build_dir, f"replaced-{attempt}"))
+            except FileNotFoundError:
+                pass
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+class BannerElement:
+    """One element of a banner's body.
+
+    ``bbox`` is (left, top, width, height) in banner pixels, ``animation`` an
+    (effect, delay in seconds) pair for the animation.css classes and
+    ``asset`` the file under images/ an <img> shows. ``rules`` are the
+    CssRules that size and place this element.
+    """
+
+    __slots__ = ("role", "tag", "classes", "id", "bbox", "animation", "asset", "text", "attrs", "children", "rules")
+
+    def __init__(self, role, tag="div", classes=(), id=None, bbox=None, animation=None, asset=None, text=None,
+                 attrs=None):
+        self.role = role
+        self.tag = tag
+        self.classes = list(classes)
+        self.id = id
+        self.bbox = list(bbox) if bbox is not None else None
+        self.animation = tuple(animation) if animation else None
+        self.asset = asset
+        self.text = text
+        self.attrs = dict(attrs or {})
+        self.children = []
+        self.rules = []
+
+    @property
+    def class_names(self):
+        if self.animation is None:
+            return self.classes
+        effect, delay = self.animation
+        return [*self.classes, f"animate_{effect}", f"delay_{delay:g}s".replace(".", "_")]
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def html_lines(self, compact=False):
+        attrs = {}
+        if self.asset:
+            attrs["src"] = f"images/{self.asset}"
+        if self.class_names:
+            attrs["class"] = " ".join(self.class_names)
+        if self.id:
+            attrs["id"] = self.id
+        attrs.update(self.attrs)
+        start = "".join(f' {name}="{html.escape(str(value))}"' for name, value in attrs.items())
+        if self.tag in HTML_VOID_TAGS:
+            return [f"<{self.tag}{start} />"]
+        text = ""
+        if self.text is not None:
+            text = html.escape(_HTML_SPACE.sub(" ", self.text).strip(" ") if compact else self.text, quote=False)
+        if not self.children:
+            return [f"<{self.tag}{start}>{text}</{self.tag}>"]
+        children = [line for child in self.children for line in child.html_lines(compact)]
+        return [f"<{self.tag}{start}>{text}", *children, f"</{self.tag}>"]
+
+    def manifest(self):
+        entry = {"role": self.role, "tag": self.tag}
+        for name in ("classes", "id", "bbox", "asset", "text", "attrs"):
+            value = getattr(self, name)
+            if value:
+                entry[name] = value
+        if self.animation:
+            entry["animation"] = dict(zip(("effect", "delay"), self.animation))
+        if self.rules:
+            entry["style"] = {prop: value for rule in self.rules for prop, value in rule.declarations}
+        if self.children:
+            entry["children"] = [child.manifest() for child in self.children]
+        return entry
+
+
+class BannerDocument:
+    """A banner as elements and style rules, before it's serialized.
+
+    process_layer only calls add() and style(). Both are recorded as JSON-able
+    operations in ``journal`` (elements are referred to relative to the
+    operation), so the layer cache stores and replays a layer's share of the
+    document with since() and replay().
+    """
+
+    # Elements every banner has; operations refer to them by name.
+    _fixed = ("container", "content", "click_tag", "click_through")
+
+    def __init__(self, name, width, height, background):
+        self.name, self.width, self.height, self.background = name, width, height, background
+        self.hosted_fonts = True
+        self.font_faces = []
+        self.sections = {section: [] for section in (*BANNER_SECTIONS, *CONTENT_SECTIONS)}
+        self.rules = []
+        self.journal = []
+        self._elements = []
+        self._positions = {}
+        self.container = BannerElement("container", classes=["container"], id="sd_bgcolor_Main-Background",
+                                       bbox=(0, 0, width, height))
+        self.content = BannerElement("contentSection", classes=["contentSection"])
+        self.click_tag = BannerElement("clickTag", tag="a",
+                                       attrs={"href": "javascript:window.open(window.trackingUrl + window.clickTag)"})
+        self.click_through = BannerElement("clickThrough", tag="a", classes=["clicktru"],
+                                           attrs={"target": "_blank", "href": "#"})
+
+        self.style(None, ["*"], {"margin": "0px", "padding": "0px", "box-sizing": "border-box"})
+        self.style(None, [":root"], {"--width": f"{width}px", "--height": f"{height}px"})
+        self.style(self.container, [".container"], {
+            "width": f"{width}px", "height": f"{height}px", "position": "relative", "overflow": "hidden",
+            "border": "1px solid #7a8599", "background-color": f"rgb{background}"})
+        self.style(self.click_through, [".clicktru"],
+                   {"z-index": "9999", "width": "100%", "height": "100%", "position": "absolute"})
+        self.style(None, ["a"], {"text-decoration": "none"})
+        self.style(None, ["#sd_btn_Click-Through-URL:empty"], {"display": "none"})
+
+    def _ref(self, element):
+        if element is None:
+            return None
+        for name in self._fixed:
+            if element is getattr(self, name):
+                return name
+        return self._positions[id(element)] - len(self.journal)
+
+    def _resolve(self, ref):
+        if ref is None:
+            return None
+        if isinstance(ref, str):
+            return getattr(self, ref)
+        return self._elements[len(self.journal) + ref]
+
+    def _apply(self, operation):
+        kind, target, *args = operation
+        parent = self._resolve(target)
+        if kind == "add":
+            section, fields = args
+            element = result = BannerElement(**fields)
+            (self.sections[section] if parent is None else parent.children).append(element)
+            self._positions[id(element)] = len(self.journal)
+        else:
+            selectors, declarations, bbox = args
+            element, result = None, CssRule(list(selectors), [tuple(declaration) for declaration in declarations])
+            self.rules.append(result)
+            if parent is not None:
+                parent.rules.append(result)
+                if bbox is not None:
+                    parent.bbox = list(bbox)
+        self.journal.append(operation)
+        self._elements.append(element)
+        return result
+
+    def add(self, role, section=None, parent=None, **fields):
+        """Append an element to ``section``, or as the last child of ``parent``."""
+        return self._apply(["add", self._ref(parent), section, {"role": role, **fields}])
+
+    def style(self, element, selectors, declarations, bbox=None):
+        """Append a rule to style.css; ``element`` (if any) is what it styles, and ``bbox`` places it."""
+        return self._apply(["style", self._ref(element), list(selectors), list(declarations.items()), bbox])
+
+    def since(self, mark):
+        return self.journal[mark:]
+
+    def replay(self, operations):
+        for operation in operations:
+            self._apply(operation)
+
+    def body(self):
+        """The container, its children in document order."""
+        self.content.children = [element for section in CONTENT_SECTIONS for element in self.sections[section]]
+        self.container.children = [self.click_tag, self.click_through, *self.sections["shapes"], *self.sections["logo"], self.content,
+                                   *self.sections["mainImages"]]
+        return self.container
+
+    def names(self):
+        names = DocumentNames(HTML_DOCUMENT_TAGS)
+        for element in self.body().walk():
+            names.tags.add(element.tag)
+            names.classes.update(element.class_names)
+            if element.id:
+                names.ids.add(element.id)
+        return names
+
+
+def banner_html(document, compact=False):
+    """index.html of ``document``; ``compact`` leaves out the whitespace that doesn't render."""
+    script = CLICKTAG_SCRIPT
+    if compact:
+        script = "\n".join(line.strip() for line in script.splitlines() if line.strip())
+    lines = ['<!DOCTYPE html>',
+             '<html lang="en">',
+             '<head>',
+             '<meta charset="UTF-8" />',
+             '<meta name="viewport" content="width=device-width, initial-scale=1.0" />',
+             f'<meta name="ad.size" content="width={document.width},height={document.height}" />',
+             '<meta http-equiv="X-UA-Compatible" content="ie=edge" />',
+             f'<title>{html.escape(document.name)}</title>',
+             *(HOSTED_FONT_LINKS if document.hosted_fonts else ()),
+             '<link rel="stylesheet" href="https://digital.mediaferry.com/animation.css">',
+             '<link rel="stylesheet" href="./css/style.css" />',
+             '</head>',
+             '<body>',
+             *document.body().html_lines(compact),
+             f'<script>\n{script}\n</script>' if not compact else f'<script>{script}</script>',
+             '</body>',
+             '</html>']
+    return ("" if compact else "\n").join(lines)
+
+
+def banner_css(document, compact=False):
+    """style.css of ``document``; ``compact`` also prunes, merges and minifies its rules."""
+    rules = [*document.font_faces, *document.rules]
+    if compact:
+        rules = [rule.minified() if isinstance(rule, CssRule) else rule for rule in rules]
+        return "".join(str(rule) for rule in optimize_rules(rules, document.names()))
+    return "\n".join(rule if isinstance(rule, str) else rule.readable() for rule in rules)
+
+
+def banner_manifest(document):
+    """manifest.json of ``document``: its elements with their roles, boxes, styles and assets."""
+    return {"name": document.name, "size": [document.width, document.height],
+            "background": list(document.background) if document.background else None,
+            "hosted_fonts": document.hosted_fonts,
+            "assets": sorted({element.asset for element in document.body().walk() if element.asset}),
+            "body": document.body().manifest()}
+
+
+def render_psd(psd, file_name_t, memory=None, output_dir=None):
+    """Generate a banner (index.html, css/, images/) from a parsed PSD in ``output_dir``,
+    by default output/<name>/.
+
+    ``memory`` is the MemoryBudget renders are held to (default: from the
+    environment). When it is enabled, rendered layers are released as soon
+    as each top-level layer's output is written.
+    """
+    # Start from a clean slate so a banner's output never depends on which
+    # PSD a (possibly reused pool) process converted before it.
+    for name in LAYER_STATE_GLOBALS:
+        globals().pop(name, None)
+    width_meta, height_meta = psd.width, psd.height
+
+    need_valid_sizes = [(300, 600), (320, 520), (160, 600)]
+    width_contain = None
+    width_psd, height_psd = psd.width, psd.height
+
+    output_dir = output_dir or os.path.join(OUTPUT_ROOT, file_name_t)
+    os.makedirs(f"{output_dir}/images", exist_ok=True)
+    os.makedirs(f"{output_dir}/css", exist_ok=True)
+
+    extracted_values = {}
+    memory = memory or MemoryBudget()
+    composites = CompositeCache(memory=memory)
+    with timings.span("index"):
+        index = LayerIndex(psd)
+        facts = DocumentFacts(index, composites)
+    if facts.background:
+        logger.info(f"backgroundColor has color: {facts.background}")
+    else:
+        logger.warning("backgroundColor has no color.")
+    if facts.logo_area:
+        # Seed the logo metrics so a logo above its logoArea still sizes itself.
+        globals().update(zip(("logo_width", "logo_height", "logo_x", "logo_y"), facts.logo_area))
+    document = BannerDocument(file_name_t, width_meta, height_meta, facts.background)
+    layer_cache = LayerCache()
+    images_dir = f"{output_dir}/images"
+    encoder = ImageEncoder(images_dir, (width_psd, height_psd))
+    fonts = FontSubsetter(f"{output_dir}/fonts")
+
+    def process_layer(layer):
+
+        sanitized_name = sanitize_filename(layer.name)
+            
+        layer_info = index[layer]
+        layer_roles = layer_info.roles
+        x1, y1, x2, y2 = layer_info.bbox
+        width = x2 - x1
+        height = y2 - y1
+        global xe2, ye2, logo_width, logo_height, logo_x, logo_y
+        checkHtmlContactWrap = checkAppendContactWrap = 1
+        shapeCounts = 1
+        cnt = cnt2 = 0
+        counter_hero2 = 1
+        imageLayer = f"sd_img_Image"
+        """Process individual layers and generate HTML/CSS."""
+        if not layer.is_group() and layer.has_pixels:
+            logo_processed = False
+            if "logoArea" in layer_roles and not logo_processed:
+                logo_width, logo_height = width, height
+                logo_x, logo_y = x1, y1
+                return
+
+            if "logo" in layer_roles:
+                if (width_psd, height_psd) in need_valid_sizes:
+                    logo_adjust = "center"
+                else: 
+                    logo_adjust = "flex-start"
                     
-                x1, y1, x2, y2 = layer.bbox
-                width = x2 - x1
-                height = y2 - y1
-                global xe2, ye2, logo_width, logo_height, logo_x, logo_y
-                checkHtmlContactWrap = checkAppendContactWrap = 1
-                shapeCounts = 1
-                cnt = cnt2 = 0
-                counter_hero2 = 1
-                imageLayer = f"sd_img_Image"
-                """Process individual layers and generate HTML/CSS."""
-                if not layer.is_group() and layer.composite():
-                    logo_processed = False
-                    if "logoArea" in layer.name and not logo_processed:
-                        logo_width, logo_height = width, height
-                        logo_x, logo_y = x1, y1
-                        return
-
-                    if "logo" in layer.name:
-                        if (width_psd, height_psd) in need_valid_sizes:
-                            logo_adjust = "center"
-                        else: 
-                            logo_adjust = "flex-start"
+                logo_file = f"{sanitized_name}.png"
+                if cnt == 0:
+                    try:
+                        image = layer.composite()
+                        logo_file = encoder.save(image, sanitized_name)
+                        image_path = f"{images_dir}/{logo_file}"
+                        logger.info(f"Saving image for {layer.name} at {image_path}")
+                        extracted_values['logo_path'] = image_path
+                    except Exception as e:
+                        logger.error(f"Failed to save image for {layer.name}: {e}")
+                    logo = document.add("logo", section="logo", classes=["logo"])
+                    logo_image = document.add("image", parent=logo, tag="img", id="sd_img_Logo", asset=logo_file,
+                                              attrs={"alt": "logo"})
+                    document.style(logo, [".logo"], {
+                        "width": f"{logo_width -3}px",
+                        "height": f"{logo_height - 3}px",
+                        "position": "absolute",
+                        "left": f"{logo_x}px",
+                        "top": f"{logo_y}px",
+                        "display": "flex",
+                        "align-items": "center",
+                        "justify-content": logo_adjust,
+                    }, bbox=(logo_x, logo_y, logo_width, logo_height))
+                    document.style(logo_image, [".logo img"], {
+                        "max-width": f"{logo_width -3}px",
+                        "max-height": f"{logo_height - 3}px",
+                    })
+                    logo_processed = True
+                    logger.info(f"Processed Logo: {sanitized_name}")
+
+
+            shape_names = ["shape 1", "shape 2", "shape 3", "shape 4", "shape 5", "shape 6"]
+            for name in shape_names:
+                if name in layer_roles:
+                    shape_element = document.add("shape", section="shapes", classes=[f"shape{shapeCounts}"],
+                                                 id=f"sd_bgcolor_Shape-{shapeCounts}", animation=("fadeIn", 0))
+                    ShapeColor = shape_better_color(layer)
+                    border_radius_shape = "initial"
+                    clip_path = None
+                    if layer.kind == "shape" or hasattr(layer, 'smart_object'):
+                        # Vector masks give the clip-path directly; only pixels get traced.
+                        vector_clip = vector_clip_path(layer)
+                        if vector_clip is not None and not layer.origination:
+                            clip_path = vector_clip[1]
+                        if layer.origination:
+                            for shape in layer.origination:
+                                if 'RoundedRectangle' in str(shape):
+                                    border_radius_shape = broder_radius_get(shape, layer)
+                                elif vector_clip is not None:
+                                    clip_path = vector_clip[1]
+                                else:
+                                    layer_image = composites.composite(layer)
+                                    if layer_image is not None and "scale" in layer_image.info:
+                                        logger.warning(f"Skipping clip-path of {layer.name}: rendered downsampled")
+                                        continue
+                                    with timings.span("contours", layer=layer.name):
+                                        clip_path = create_shapes(image_to_array(layer_image))
+
+                        # cv2.imwrite('output_image.jpg', image)
+                        # cv2.waitKey(0)
+                        # cv2.destroyAllWindows()
+                    # else:
+                    #     clip_path = "inherit"
+
+                            
+                    # layer_image = layer.composite()
+                    # image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
+                    # layer_image.save(image_path)
+                    # print(f"Saved shape layer to: {image_path}")
+
+                    # def extract_clip_path(image_path):
+                    #     image = cv2.imread(image_path)
+                    #     if image is None:
+                    #         print(f"Error: Could not load image at {image_path}")
+                    #         return None
+
+                    #     height, width = image.shape[:2]
+                    #     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                    #     gray = cv2.GaussianBlur(gray, (5, 5), 0)
+                    #     median_intensity = np.median(gray)
+                    #     lower_threshold = int(max(0, 0.66 * median_intensity))
+                    #     upper_threshold = int(min(255, 1.33 * median_intensity))
+                    #     edges = cv2.Canny(gray, lower_threshold, upper_threshold)
+                    #     contours, _ = cv2.findContours(edges.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+                    #     padding_x = int(width * 0.05)
+                    #     padding_y = int(height * 0.05)
+
+                    #     if contours:
+                    #         largest_contour = max(contours, key=cv2.contourArea)
+                    #         x, y, w, h = cv2.boundingRect(largest_contour)
+
+                    #         aspect_ratio = w / float(h)
+                    #         area = cv2.contourArea(largest_contour)
+                    #         rect_area = w * h
+                    #         extent = area / float(rect_area)
+
+                    #         if len(largest_contour) >= 5: 
+                    #             ellipse = cv2.fitEllipse(largest_contour)
+                    #             (center_x, center_y), (axis1, axis2), angle = ellipse
+                    #             circle_check = abs(axis1 - axis2) / max(axis1, axis2) < 0.1 
+                    #         else:
+                    #             circle_check = False
+
+                    #         if circle_check:
+                    #             radius = int(min(axis1, axis2) / 2)
+                    #             clip_path = f'circle({int(center_x)}px {int(center_y)}px at {radius}px)'
+                    #         elif 0.9 < extent < 1.1:
+                    #             clip_path = f'polygon({x}px {y}px, {x + w}px {y}px, {x + w}px {y + h}px, {x}px {y + h}px)'
+                    #         else:
+                    #             epsilon = 0.01 * cv2.arcLength(largest_contour, True)
+                    #             approx = cv2.approxPolyDP(largest_contour, epsilon, True)
+                    #             clip_path = 'polygon(' + ', '.join(f'{point[0][0]}px {point[0][1]}px' for point in approx) + ')'
+                    #     else:
+
+                    #         print('No contours found. Using padded rectangular clip-path.')
+                    #         clip_path = f'polygon({padding_x}px {padding_y}px, {width - padding_x}px {padding_y}px, {width - padding_x}px {height - padding_y}px, {padding_x}px {height - padding_y}px)'
+
+                    #     cv2.imwrite('edges_debug.jpg', edges)
+                    #     print('Edge image saved as edges_debug.jpg for debugging')
+
+                    #     os.remove(image_path)
+                    #     print(f'CSS clip-path: {clip_path}')
+                    #     return clip_path
+                        
+                    # getRightPath = extract_clip_path(image_path)    
+                    # print(f"here is right path of shape: {getRightPath}")
+
+
+
+                    # doc_width = psd.width
+                    # doc_height = psd.height
+                    # print(f"PSD size: {doc_width}x{doc_height}px")
+
+                    # def get_shape_points(layer):
+                    #     if layer.kind == 'shape' and hasattr(layer, 'vector_mask') and layer.vector_mask is not None:
+                    #         # Get bounding box
+                    #         bbox = layer.bbox
+                    #         bbox_left, bbox_top, bbox_right, bbox_bottom = bbox
+                    #         bbox_width = bbox_right - bbox_left
+                    #         bbox_height = bbox_bottom - bbox_top
+                    #         print(f"Layer bbox: left={bbox_left}, top={bbox_top}, width={bbox_width}, height={bbox_height}")
+
+                    #         # Get vector mask points
+                    #         vector_mask = layer.vector_mask
+                    #         raw_points = [(knot.anchor[0], knot.anchor[1]) for path in vector_mask.paths for knot in path]
+                    #         print("Raw points:", raw_points)
+
+                    #         # Stretch X to full bbox width
+                    #         min_x_raw = min(x for x, _ in raw_points)
+                    #         max_x_raw = max(x for x, _ in raw_points)
+                    #         x_range_raw = max_x_raw - min_x_raw
+
+                    #         points = []
+                    #         for x, y in raw_points:
+                    #             # Stretch X to full width
+                    #             scaled_x = bbox_left + ((x - min_x_raw) / x_range_raw) * bbox_width
+                    #             # Y: 0 at top (103), 1 at bottom (276)
+                    #             scaled_y = bbox_top + (y * bbox_height)
+                    #             points.append((scaled_x, scaled_y))
                             
-                        image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
-                        if cnt == 0:
+                    #         print("Scaled points:", points)
+
+                    #         # For "shape 1", manually adjust to match the image (wider at bottom)
+                    #         if layer.name == "shape 1":
+                    #             # Current points: wider at top, need wider at bottom
+                    #             # Reinterpret points based on image
+                    #             # From image: top narrower, bottom wider
+                    #             top_left_x = bbox_left + ((0.3416 - min_x_raw) / x_range_raw) * bbox_width  # Was at Y=1 (bottom)
+                    #             top_right_x = bbox_left + ((0.1749 - min_x_raw) / x_range_raw) * bbox_width  # Was at Y=1 (bottom)
+                    #             bottom_left_x = bbox_left  # Was at Y=0 (top)
+                    #             bottom_right_x = bbox_right  # Was at Y=0 (top)
+                    #             points = [
+                    #                 (top_left_x, bbox_top),      # Top-left
+                    #                 (bottom_left_x, bbox_bottom), # Bottom-left
+                    #                 (bottom_right_x, bbox_bottom), # Bottom-right
+                    #                 (top_right_x, bbox_top)      # Top-right
+                    #             ]
+                    #             print("Adjusted points for shape 1:", points)
+
+                    #         return points
+                    #     return None
+
+                    # def points_to_clip_path(points):
+                    #     clip_path = "polygon(" + ", ".join(f"{x:.2f}px {y:.2f}px" for x, y in points) + ")"
+                    #     return clip_path
+
+                    # # Process all layers
+                    # points = get_shape_points(layer)
+                    # if points:
+                    #     print(f"\nLayer: {layer.name}")
+                    #     print("Final points:", points)
+                    #     clip_path = points_to_clip_path(points)
+                    #     print("CSS clip-path:", clip_path)
+                    #     min_x = min(p[0] for p in points)
+                    #     max_x = max(p[0] for p in points)
+                    #     print(f"Shape width: {max_x - min_x:.2f}px")
+                    # # Try bounding box if vector mask isn't right
+                    # print("\nUsing bounding box:")
+                    # points = get_shape_points(layer)
+                    # if points:
+                    #     print(f"Layer: {layer.name}")
+                    #     print("Scaled points:", points)
+                    #     clip_path = points_to_clip_path(points)
+                    #     print("CSS clip-path:", clip_path)
+                    #     min_x = min(p[0] for p in points)
+                    #     max_x = max(p[0] for p in points)
+                    #     print(f"Shape width: {max_x - min_x:.2f}px")
+
+                    document.style(shape_element, [f".shape{shapeCounts}"], {
+                        "width": f"{width - 1 }px",
+                        "height": f"{height - 1}px",
+                        "position": "absolute",
+                        "left": f"{x1}px",
+                        "top": f"{y1}px",
+                        "background-color": f"rgb{ShapeColor}",
+                        "border-radius": border_radius_shape,
+                        "clip-path": f"{clip_path}",
+                        "-webkit-clip-path": f"{clip_path}",
+                    }, bbox=(x1, y1, width, height))
+
+                shapeCounts += 1
+
+
+
+            if "contentArea" in layer_roles:
+                xe2, ye2 = x1, y1
+                document.style(document.content, [".contentSection"], {
+                    "width": f"{width}px",
+                    "height": f"{height}px",
+                    "position": "relative",
+                    "left": f"{xe2}px",
+                    "top": f"{ye2}px",
+                    "overflow": "hidden",
+                }, bbox=(x1, y1, width, height))
+            # else:
+            #     xe2, ye2
+            # elif "imageHero1" in layer.name:
+            #     image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
+            #     try:
+            #         image.save(image_path)
+            #         print(f"Saved image for {layer.name} at {image_path}")
+            #     except Exception as e:
+            #         print(f"Failed to save image for {layer.name}: {e}")
+            # elif "imageHero2" in layer.name:
+            #     image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
+            #     try:
+            #         image.save(image_path)
+            #         print(f"Saved image for {layer.name} at {image_path}")
+            #     except Exception as e:
+            #         print(f"Failed to save image for {layer.name}: {e}")
+            # elif "imageHero3" in layer.name:
+            #     image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
+            #     try:
+            #         image.save(image_path)
+            #         print(f"Saved image for {layer.name} at {image_path}")
+            #     except Exception as e:
+            #         print(f"Failed to save image for {layer.name}: {e}")        
+
+            logger.info(f"Processed: {sanitized_name}")
+        
+        elif layer.is_group():
+            incre = cSubheading = 1
+            animateCr = 4
+            HeroAnimateOne = 0
+            HeroAnimateTwo = 0
+            animateCrOut = 7
+            countersOne = 1
+            countersTwo = 1
+            idxImageTwo = idxImageOne = 1
+            logger.debug(f"Skipping group: {layer.name}")
+            if "contactWrap" in layer_roles:
+                # Contact lines are sized to the contactArea, wherever it sits in the stack.
+                contact_area = next((child for child in layer if "contactArea" in index[child].roles), None)
+                cx1, cy1, cx2, cy2 = index[contact_area].bbox if contact_area is not None else layer_info.bbox
+                AreaConWidth = cx2 - cx1 - 2
+                AreaConHeight = cy2 - cy1 - 2
+            for pp in reversed(layer):
+                pp_info = index[pp]
+                pp_roles = pp_info.roles
+                # if layer.kind == "shape":
+                #     continue
+                if hasattr(pp, 'kind') and pp.kind == 'type':
+                    logger.debug(f"Text layer found: {pp.name}")
+                    if hasattr(pp, 'text') and pp.text:
+                        text_content = pp.text.replace('', ' ')
+                        logger.debug(f"Text content found: {text_content}")
+                        if hasattr(pp, 'engine_dict'):
                             try:
-                                image.save(image_path)
-                                print(f"Saved image for {layer.name} at {image_path}")
-                                extracted_values['logo_path'] = image_path
+                                style = index.text_style(pp)
+                                font_sized = style.font_size
+                                line_height_em = style.line_height_em
+                                text_align = style.text_align
+                                if style.caps:
+                                    text_content = text_content.upper()  # Convert all text to uppercase
+                                rgb_color = style.color
+                                family, font_weight_name, weight_value, type_font = (
+                                    style.family, style.weight_name, style.weight, style.font_style)
+                                fonts.use(family, weight_value, type_font, text_content)
                             except Exception as e:
-                                print(f"Failed to save image for {layer.name}: {e}")
-                            outerSection["logo"].append(f'<div class="logo">')
-                            outerSection["logo"].append(f'<img src="images/{sanitized_name}.png" alt="logo" id="sd_img_Logo"/>')
-                            outerSection["logo"].append('</div>')
-                            css_content.append(f"""
-                            .logo {{
-                                width: {logo_width -3}px;
-                                height: {logo_height - 3}px;
-                                position: absolute;
-                                left: {logo_x}px;
-                                top: {logo_y}px;
-                                display: flex;
-                                align-items: center;
-                                justify-content: {logo_adjust};
-                            }}
-                            .logo img{{
-                                max-width: {logo_width -3}px;
-                                max-height: {logo_height - 3}px;
-                            }}
-                            """)
-                            logo_processed = True
-                            print(f"Processed Logo: {sanitized_name}")
-
-
-                    shape_names = ["shape 1", "shape 2", "shape 3", "shape 4", "shape 5", "shape 6"]
-                    for name in shape_names:
-                        if name in layer.name:
-                            outerSection["shapes"].append(f'<div class="shape{shapeCounts} animate_fadeIn delay_0s" id="sd_bgcolor_Shape-{shapeCounts}">')
-                            outerSection["shapes"].append('</div>')
-                            ShapeColor = shape_better_color(layer)
-                            border_radius_shape = "initial"
+                                logger.error(f"Error accessing engine dict data: {e}")
+                        
+                        else:
+                            logger.warning("Engine dict not available.")
+                    
+                else:
+                    logger.debug("This is not a text layer.")
+
+
+                # process_layer(pp, html_content, css_content)
+                sub_heading = f"sd_txta_Sub-Heading-{incre}"    
+                if "offer" in layer_roles:
+                    offer_wrap = document.add("textWrap", section="offer", classes=["offerwrap"],
+                                              animation=("fadeIn", 0))
+                    offer = document.add("offer", parent=offer_wrap, classes=["offerBox"], id="sd_txta_Offer-text",
+                                         text=text_content)
+                    document.style(offer, [".offerBox"], {
+                        "width": f"{width}px",
+                        "height": f"{height}px",
+                        "position": "absolute",
+                        "left": f"{x1 - xe2}px",
+                        "top": f"{y1 - ye2}px",
+                        "font-size": f"{font_sized}px",
+                        "font-family": f"'{family}', serif",
+                        "font-weight": f"{weight_value}",
+                        "font-style": f"{type_font}",
+                        "color": f"rgb{rgb_color}",
+                        "line-height": f"{line_height_em}em",
+                        "text-align": f"{text_align}",
+                    }, bbox=(x1, y1, width, height))
+
+
+                if "contactWrap" in layer_roles:
+                    logger.debug(f"contactWrap child: {pp.name}")
+                    if "contactBackground" in pp_roles:
+                        contentBgx1, contentBgy1, contentBgx2, contentBgy2 = pp_info.bbox
+                        contentBgWidth = contentBgx2 - contentBgx1
+                        contentBgHeight = contentBgy2 - contentBgy1    
+                        # html_content.append(f'<div class="outer contactWrap" id="sd_txta-BGGG">')
+                        # html_content.append('</div>')
+                        bgContact = get_better_color(layer)
+                        document.style(None, [".contactWrap"], {
+                            "width": f"{contentBgWidth}px",
+                            "height": f"{contentBgHeight}px",
+                            "position": "absolute",
+                            "left": f"{contentBgx1}px",
+                            "top": f"{contentBgy1}px",
+                            "background": f"rgb{bgContact}",
+                        })
+                    if "contactArea" not in pp_roles and "contactBackground" not in pp_roles:
+                        if pp.kind == 'type':
+                            contactWidth, contactHeight, tx1, ty1 = get_text_layer_dimensions(pp)
+                        if checkHtmlContactWrap == 1:
+                            classForContact = "tel"
+                            idContact = "Tel"
+                            contact_wrap = document.add("contactWrap", section="contactWrap", classes=["contactWrap"],
+                                                        id="sd_bgcolor_Contact-Background")
+                        else:
+                            classForContact = "email"
+                            idContact = "Email"
+
+                        contact = document.add("contact", parent=contact_wrap, classes=[classForContact],
+                                               id=f"sd_txta-{idContact}", text=text_content)
+                        checkHtmlContactWrap += 1 
+                        
+                        if checkAppendContactWrap in (1, 2):
+                            document.style(contact, [f".{classForContact}"], {
+                                "width": f"{AreaConWidth}px",
+                                "height": f"{contactHeight}px",
+                                "font-size": f"{font_sized}px",
+                                "font-family": f"'{family}', serif",
+                                "font-weight": f"{weight_value}",
+                                "font-style": f"{type_font}",
+                                "color": f"rgb{rgb_color}",
+                                "line-height": f"{line_height_em}em",
+                                "text-align": f"{text_align}",
+                                "position": "absolute",
+                                "left": f"{tx1 - xe2}px",
+                                "top": f"{ty1 - xe2}px",
+                            }, bbox=(tx1, ty1, AreaConWidth, contactHeight))
+                        checkAppendContactWrap += 1
+                        # if checkHtmlContactWrap > 1:
+                    
+                
+                if "mainHeading" in layer_roles:
+                    heading_wrap = document.add("textWrap", section="mainHeading", classes=["textWrap"],
+                                                animation=("fadeOut", 3))
+                    heading = document.add("mainHeading", parent=heading_wrap, classes=["mainHeading"],
+                                           id="sd_txta_Heading", animation=("fadeIn", 0), text=text_content)
+                    document.style(heading, [".mainHeading"], {
+                        "width": f"{width}px",
+                        "height": f"{height}px",
+                        "position": "absolute",
+                        "left": f"{x1 - xe2}px",
+                        "top": f"{y1 - ye2}px",
+                        "font-family": f"'{family}', serif",
+                        "font-weight": f"{weight_value}",
+                        "font-style": f"{type_font}",
+                        "font-size": f"{font_sized}px",
+                        "color": f"rgb{rgb_color}",
+                        "line-height": f"{line_height_em}em",
+                        "text-align": f"{text_align}",
+                    }, bbox=(x1, y1, width, height))
+                
+
+                if "subHeading" in layer_roles:
+                    num_child_subHeading = len(layer)
+                    if num_child_subHeading > cSubheading:
+                        subHeadingAnimation = ("fadeOut", animateCrOut)
+                    else:
+                        subHeadingAnimation = None
+                    sub_heading_wrap = document.add("textWrap", section="subHeading", classes=["textWrap"],
+                                                    animation=subHeadingAnimation)
+                    sub_heading_element = document.add("subHeading", parent=sub_heading_wrap,
+                                                       classes=[f"subHeading{incre}"], id=sub_heading,
+                                                       animation=("fadeIn", animateCr), text=text_content)
+                    if cSubheading == 1:
+                        document.style(sub_heading_element, [".subHeading1", ".subHeading2", ".subHeading3"], {
+                            "width": f"{width}px",
+                            "height": f"{height}px",
+                            "position": "absolute",
+                            "left": f"{x1 - xe2}px",
+                            "top": f"{y1 - ye2}px",
+                            "font-family": f"'{family}', serif",
+                            "font-weight": f"{weight_value}",
+                            "font-style": f"{type_font}",
+                            "font-size": f"{font_sized}px",
+                            "color": f"rgb{rgb_color}",
+                            "line-height": f"{line_height_em}em",
+                            "text-align": f"{text_align}",
+                        }, bbox=(x1, y1, width, height))
+                    incre += 1; cSubheading += 1
+                    animateCr += 4; animateCrOut += 4
+
+                if "hero" in layer_roles and "hero 2" not in layer_roles:
+                    logger.info(f"Processing hero layer: {layer.name}")
+                    cssImage = None
+                    check = None
+                    clip_paths = []
+                    for idx, child_layer in enumerate(reversed(layer)):
+                        child_info = index[child_layer]
+                        if "imageWrap" in child_info.roles:
+                            border_radius = "initial"
                             clip_path = None
-                            if layer.kind == "shape" or hasattr(layer, 'smart_object'):
-                                layer_image = layer.composite()
-                                image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
-                                layer_image.save(image_path)
-                                print(f"Saved shape layer to: {image_path}")
-                                # if layer.kind == 'shape' and hasattr(layer, 'vector_mask'):
-                                if layer.origination:
-                                    for shape in layer.origination:
+                            wrapp_image = None
+                            if child_layer.kind == 'shape' and hasattr(child_layer, 'vector_mask'):
+                                # Vector masks give the clip-path directly; only pixels get traced.
+                                vector_clip = vector_clip_path(child_layer)
+                                if vector_clip is not None:
+                                    # A plain rectangle clips nothing the wrapper doesn't already.
+                                    vector_clip_css = "inherit" if vector_clip[0] == "rectangle" else vector_clip[1]
+                                    if not child_layer.origination:
+                                        clip_path = vector_clip_css
+                                if child_layer.origination:
+                                    for shape in child_layer.origination:
                                         if 'RoundedRectangle' in str(shape):
-                                            border_radius_shape = broder_radius_get(shape, layer)
+                                            border_radius = broder_radius_get(shape, child_layer)
+                                        elif vector_clip is not None:
+                                            clip_path = vector_clip_css
                                         else:
-                                            clip_path = create_shapes(image_path)
+                                            try:                                                        
+                                                wrapp_image = composites.topil(child_layer)
+                                                if wrapp_image is None:
+                                                    raise ValueError("topil() returned None")
+                                                elif not isinstance(wrapp_image, Image.Image):
+                                                    raise TypeError(f"topil() returned invalid type: {type(wrapp_image)}")
+                                            except Exception as e:
+                                                logger.error(f"topil() failed: {e}")
+                                                clip_path = "inherit"
+
+                                            if wrapp_image and "scale" in wrapp_image.info:
+                                                logger.warning(f"Skipping clip-path of {child_layer.name}: rendered downsampled")
+                                                clip_path = "inherit"
+                                            elif wrapp_image:
+                                                with timings.span("contours", layer=child_layer.name):
+                                                    clip_path = image_clip_path_generate(image_to_array(wrapp_image), child_layer, images_dir)
+                                                if clip_path is None:
+                                                    clip_path = "inherit"
+                                
+                        if "imageWrap1" in child_info.roles or "imageWrap" in child_info.roles or "imageBorder" in child_info.roles:
+                            logger.debug(f"skipping shape: {child_layer.name}")
+                            check = child_layer.name
+                            if "imageBorder" not in child_info.roles:
+                                x1, y1, x2, y2 = child_info.bbox
+                                width = x2 - x1
+                                height = y2 - y1
+                            continue
+                        if pp.kind not in ['pixel', 'smartobject']:
+                            logger.debug("no pixel")
+                            continue
+                        if pp.is_visible():
+                            imgx1, imgy1, imgx2, imgy2 = child_info.bbox
+                            if imgx1 < 0 or imgy1 < 0:
+                                crop_x1 = max(0, x1 - imgx1)
+                                crop_y1 = max(0, y1 - imgy1)
+                            else:
+                                crop_x1 = x1 - imgx1
+                                crop_y1 = y1 - imgy1
 
-                                os.remove(image_path)
-                                # cv2.imwrite('output_image.jpg', image)
-                                # cv2.waitKey(0)
-                                # cv2.destroyAllWindows()
-                            # else:
-                            #     clip_path = "inherit"
+                            crop_x2 = min(imgx2 - imgx1, x2 - imgx1)
+                            crop_y2 = min(imgy2 - imgy1, y2 - imgy1)
 
-                                    
-                            # layer_image = layer.composite()
-                            # image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
-                            # layer_image.save(image_path)
-                            # print(f"Saved shape layer to: {image_path}")
-
-                            # def extract_clip_path(image_path):
-                            #     image = cv2.imread(image_path)
-                            #     if image is None:
-                            #         print(f"Error: Could not load image at {image_path}")
-                            #         return None
-
-                            #     height, width = image.shape[:2]
-                            #     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                            #     gray = cv2.GaussianBlur(gray, (5, 5), 0)
-                            #     median_intensity = np.median(gray)
-                            #     lower_threshold = int(max(0, 0.66 * median_intensity))
-                            #     upper_threshold = int(min(255, 1.33 * median_intensity))
-                            #     edges = cv2.Canny(gray, lower_threshold, upper_threshold)
-                            #     contours, _ = cv2.findContours(edges.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-                            #     padding_x = int(width * 0.05)
-                            #     padding_y = int(height * 0.05)
-
-                            #     if contours:
-                            #         largest_contour = max(contours, key=cv2.contourArea)
-                            #         x, y, w, h = cv2.boundingRect(largest_contour)
-
-                            #         aspect_ratio = w / float(h)
-                            #         area = cv2.contourArea(largest_contour)
-                            #         rect_area = w * h
-                            #         extent = area / float(rect_area)
-
-                            #         if len(largest_contour) >= 5: 
-                            #             ellipse = cv2.fitEllipse(largest_contour)
-                            #             (center_x, center_y), (axis1, axis2), angle = ellipse
-                            #             circle_check = abs(axis1 - axis2) / max(axis1, axis2) < 0.1 
-                            #         else:
-                            #             circle_check = False
-
-                            #         if circle_check:
-                            #             radius = int(min(axis1, axis2) / 2)
-                            #             clip_path = f'circle({int(center_x)}px {int(center_y)}px at {radius}px)'
-                            #         elif 0.9 < extent < 1.1:
-                            #             clip_path = f'polygon({x}px {y}px, {x + w}px {y}px, {x + w}px {y + h}px, {x}px {y + h}px)'
-                            #         else:
-                            #             epsilon = 0.01 * cv2.arcLength(largest_contour, True)
-                            #             approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-                            #             clip_path = 'polygon(' + ', '.join(f'{point[0][0]}px {point[0][1]}px' for point in approx) + ')'
-                            #     else:
-
-                            #         print('No contours found. Using padded rectangular clip-path.')
-                            #         clip_path = f'polygon({padding_x}px {padding_y}px, {width - padding_x}px {padding_y}px, {width - padding_x}px {height - padding_y}px, {padding_x}px {height - padding_y}px)'
-
-                            #     cv2.imwrite('edges_debug.jpg', edges)
-                            #     print('Edge image saved as edges_debug.jpg for debugging')
-
-                            #     os.remove(image_path)
-                            #     print(f'CSS clip-path: {clip_path}')
-                            #     return clip_path
-                                
-                            # getRightPath = extract_clip_path(image_path)    
-                            # print(f"here is right path of shape: {getRightPath}")
-
-
-
-                            # doc_width = psd.width
-                            # doc_height = psd.height
-                            # print(f"PSD size: {doc_width}x{doc_height}px")
-
-                            # def get_shape_points(layer):
-                            #     if layer.kind == 'shape' and hasattr(layer, 'vector_mask') and layer.vector_mask is not None:
-                            #         # Get bounding box
-                            #         bbox = layer.bbox
-                            #         bbox_left, bbox_top, bbox_right, bbox_bottom = bbox
-                            #         bbox_width = bbox_right - bbox_left
-                            #         bbox_height = bbox_bottom - bbox_top
-                            #         print(f"Layer bbox: left={bbox_left}, top={bbox_top}, width={bbox_width}, height={bbox_height}")
-
-                            #         # Get vector mask points
-                            #         vector_mask = layer.vector_mask
-                            #         raw_points = [(knot.anchor[0], knot.anchor[1]) for path in vector_mask.paths for knot in path]
-                            #         print("Raw points:", raw_points)
-
-                            #         # Stretch X to full bbox width
-                            #         min_x_raw = min(x for x, _ in raw_points)
-                            #         max_x_raw = max(x for x, _ in raw_points)
-                            #         x_range_raw = max_x_raw - min_x_raw
-
-                            #         points = []
-                            #         for x, y in raw_points:
-                            #             # Stretch X to full width
-                            #             scaled_x = bbox_left + ((x - min_x_raw) / x_range_raw) * bbox_width
-                            #             # Y: 0 at top (103), 1 at bottom (276)
-                            #             scaled_y = bbox_top + (y * bbox_height)
-                            #             points.append((scaled_x, scaled_y))
-                                    
-                            #         print("Scaled points:", points)
-
-                            #         # For "shape 1", manually adjust to match the image (wider at bottom)
-                            #         if layer.name == "shape 1":
-                            #             # Current points: wider at top, need wider at bottom
-                            #             # Reinterpret points based on image
-                            #             # From image: top narrower, bottom wider
-                            #             top_left_x = bbox_left + ((0.3416 - min_x_raw) / x_range_raw) * bbox_width  # Was at Y=1 (bottom)
-                            #             top_right_x = bbox_left + ((0.1749 - min_x_raw) / x_range_raw) * bbox_width  # Was at Y=1 (bottom)
-                            #             bottom_left_x = bbox_left  # Was at Y=0 (top)
-                            #             bottom_right_x = bbox_right  # Was at Y=0 (top)
-                            #             points = [
-                            #                 (top_left_x, bbox_top),      # Top-left
-                            #                 (bottom_left_x, bbox_bottom), # Bottom-left
-                            #                 (bottom_right_x, bbox_bottom), # Bottom-right
-                            #                 (top_right_x, bbox_top)      # Top-right
-                            #             ]
-                            #             print("Adjusted points for shape 1:", points)
-
-                            #         return points
-                            #     return None
-
-                            # def points_to_clip_path(points):
-                            #     clip_path = "polygon(" + ", ".join(f"{x:.2f}px {y:.2f}px" for x, y in points) + ")"
-                            #     return clip_path
-
-                            # # Process all layers
-                            # points = get_shape_points(layer)
-                            # if points:
-                            #     print(f"\nLayer: {layer.name}")
-                            #     print("Final points:", points)
-                            #     clip_path = points_to_clip_path(points)
-                            #     print("CSS clip-path:", clip_path)
-                            #     min_x = min(p[0] for p in points)
-                            #     max_x = max(p[0] for p in points)
-                            #     print(f"Shape width: {max_x - min_x:.2f}px")
-                            # # Try bounding box if vector mask isn't right
-                            # print("\nUsing bounding box:")
-                            # points = get_shape_points(layer)
-                            # if points:
-                            #     print(f"Layer: {layer.name}")
-                            #     print("Scaled points:", points)
-                            #     clip_path = points_to_clip_path(points)
-                            #     print("CSS clip-path:", clip_path)
-                            #     min_x = min(p[0] for p in points)
-                            #     max_x = max(p[0] for p in points)
-                            #     print(f"Shape width: {max_x - min_x:.2f}px")
-
-                            css_content.append(f"""
-                            .shape{shapeCounts} {{
-                                width: {width - 1 }px;
-                                height: {height - 1}px;
-                                position: absolute;
-                                left: {x1}px;
-                                top: {y1}px;
-                                background-color: rgb{ShapeColor};
-                                border-radius: {border_radius_shape};
-                                clip-path: {clip_path};
-                                -webkit-clip-path: {clip_path}
+                            file_update_name = re.sub(r'\s+', '-', child_layer.name.strip())
+                            crop_box = (crop_x1, crop_y1, crop_x2, crop_y2)
+                            # Every pass over the group re-visits all images; encode each crop once.
+                            if encoder.encoded(file_update_name, (child_layer.layer_id, crop_box)):
+                                continue
                             
-                            }}
-                                        """)
-
-                        shapeCounts += 1
+                            try:
+                                cropped_image = composites.topil_region(child_layer, crop_box)
+                                if cropped_image.mode in ('RGBA', 'P'):
+                                    cropped_image = cropped_image.convert("RGB")
+                                encoder.save(cropped_image, file_update_name, key=(child_layer.layer_id, crop_box))
 
+                            except Exception as e:
+                                logger.error(f"Failed to save image for {child_layer.name}: {e}")
 
+                    if countersOne == 1 or countersOne == 2 or countersOne == 3:
+                        HeroAnimation = ("fadeIn", HeroAnimateOne)
+                    else:
+                        HeroAnimation = None
 
-                    if "contentArea" in layer.name:
-                        xe2, ye2 = x1, y1
-                        css_content.append(f"""
-                        .contentSection {{
-                            width: {width}px;
-                            height: {height}px;
-                            position: relative;
-                            left: {xe2}px;
-                            top: {ye2}px;
-                            overflow: hidden;
-                        }}
-                                    """)
-                    # else:
-                    #     xe2, ye2
-                    # elif "imageHero1" in layer.name:
-                    #     image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
-                    #     try:
-                    #         image.save(image_path)
-                    #         print(f"Saved image for {layer.name} at {image_path}")
-                    #     except Exception as e:
-                    #         print(f"Failed to save image for {layer.name}: {e}")
-                    # elif "imageHero2" in layer.name:
-                    #     image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
-                    #     try:
-                    #         image.save(image_path)
-                    #         print(f"Saved image for {layer.name} at {image_path}")
-                    #     except Exception as e:
-                    #         print(f"Failed to save image for {layer.name}: {e}")
-                    # elif "imageHero3" in layer.name:
-                    #     image_path = f"output/{file_name_t}/images/{sanitized_name}.png"
-                    #     try:
-                    #         image.save(image_path)
-                    #         print(f"Saved image for {layer.name} at {image_path}")
-                    #     except Exception as e:
-                    #         print(f"Failed to save image for {layer.name}: {e}")        
-
-                    print(f"Processed: {sanitized_name}")
                 
-                elif layer.is_group():
-                    incre = cSubheading = 1
-                    animateCr = 4
-                    HeroAnimateOne = 0
-                    HeroAnimateTwo = 0
-                    animateCrOut = 7
-                    countersOne = 1
-                    countersTwo = 1
-                    idxImageTwo = idxImageOne = 1
-                    print(f"Skipping group: {layer.name}")
-                    for pp in reversed(layer):
-                        # if layer.kind == "shape":
-                        #     continue
-                        if hasattr(pp, 'kind') and pp.kind == 'type':
-                            print(f"Text layer found: {pp.name}")
-                            if hasattr(pp, 'text') and pp.text:
-                                text_content = pp.text.replace('', ' ')
-                                print(f"Text content found: {text_content}")
-                                if hasattr(pp, 'engine_dict'):
-                                    engine_data = pp.engine_dict
-                                    if hasattr(pp, 'transform'):
-                                        transform_matrix = pp.transform
-                                    try:
-                                        if 'StyleRun' in engine_data:
-                                            font_size = engine_data['StyleRun'].get('RunArray', [{}])[0].get('StyleSheet', {}).get('StyleSheetData', {}).get('FontSize', 'Font size not available')
-                                            scaling_factor_x = transform_matrix[0]
-                                            scaling_factor_y = transform_matrix[3]
-                                            font_size_points = font_size
-                                            dpi = 72
-                                            font_size_pixels = font_size_points * (dpi / 72)
-                                            scaled_font_size_x = font_size_pixels * scaling_factor_x
-                                            scaled_font_size_y = font_size_pixels * scaling_factor_y
-                                            empirical_factor = 0.75  
-                                            effective_font_size = (scaled_font_size_x + scaled_font_size_y) / 2 * empirical_factor
-                                            font_sized = f'{scaled_font_size_x:.2f}'
-                                            
-                                            line_height_font = engine_data['StyleRun'].get('RunArray', [{}])[0].get('StyleSheet', {}).get('StyleSheetData', {}).get('Leading', None)
-                                            # print(engine_data['StyleRun'].get('RunArray', [{}])[0].get('StyleSheet', {}).get('StyleSheetData', {}))
-                                            # print(f"checking of this : {line_height_font}")
-                                            if float(font_size_points) * 1.2 < line_height_font: 
-                                                line_height_points = font_size_points * 1.2
-                                            else:
-                                                line_height_points = line_height_font
-
-                                            line_height_pixels = line_height_points * (dpi / 72)
-                                            scaled_line_height_x_line = line_height_pixels * scaling_factor_x
-                                            scaled_line_height_y_line = line_height_pixels * scaling_factor_y
-                                            effective_line_height = (scaled_line_height_x_line + scaled_line_height_y_line) / 2 * empirical_factor
-
-                                            line_height_get = f'{scaled_line_height_x_line:.2f}' 
-                                            line_height_convert = float(line_height_get) / float(font_sized)
-                                            line_height_em = round(line_height_convert, 2)
-
-                                            # LineHeightstyle_data = engine_data['StyleRun'].get('RunArray', [{}])[0].get('StyleSheet', {}).get('StyleSheetData', {})
-                                            # line_height = LineHeightstyle_data.get('Leading', None)
-                                            # # print(f"line height data {LineHeightstyle_data}")
-                                            # try:
-                                            #     line_height = float(line_height) if line_height and isinstance(line_height, (int, float, str)) and str(line_height).replace('.', '', 1).isdigit() else None
-                                            # except (ValueError, TypeError):
-                                            #     line_height = None
-
-                                            # if not line_height or line_height == 0:
-                                            #     line_height = float(font_sized) * (1.0 if float(font_sized) < 20 else 1.2)
-
-                                            # VScaling_factor_y = transform_matrix[3] if transform_matrix[3] != 0 else 1
-
-                                            # max_scaling = 0.81 if float(font_sized) < 20 else 0.835
-                                            # VScaling_factor_y = min(VScaling_factor_y, max_scaling)
-
-                                            # line_height_pixels = line_height * (dpi / 72)
-                                            # scaled_line_height = line_height_pixels * VScaling_factor_y
-                                            # scaled_line_height = max(scaled_line_height, float(font_sized) * 1.0)
-                                            # line_height_em = scaled_line_height / float(font_sized)
-
-                                            # print(f"DEBUG: Font Size: {font_sized}, Raw Leading: {line_height}, "
-                                            # f"Scaled X: {scaled_line_height_x}, Scaled Y: {scaled_line_height_y}, Line Height EM: {line_height_em:.3f}")
-                                            # print(f"Layer: {pp.name}, Line Height: {effective_line_height:.5f} px, {line_height_em:.3f} em")
-                                        
-                                        if 'StyleRun' in engine_data:
-                                            center = pp.engine_dict['StyleRun']
-                                            font_caps = center.get('RunArray', [{}])[0].get('StyleSheet', {}).get('StyleSheetData', {}).get('FontCaps', None)
-                                            style_run_alignment = center.get('RunArray', [{}])[0].get('StyleSheet', {}).get('StyleSheetData', {}).get('StyleRunAlignment', None)                                   
-                                            paracheck = pp.engine_dict['ParagraphRun']
-                                            aligncheck = paracheck.get('RunArray', [{}])[0].get('ParagraphSheet', {}).get('Properties', {}).get('Justification', None)
-                                            if aligncheck == 0:
-                                                text_align = "left"
-                                            elif aligncheck == 1:
-                                                text_align = "center"
-                                            elif aligncheck == 2:
-                                                text_align = "center"
-                                            else:
-                                                text_align = "left"
-
-                                            if font_caps == 2:
-                                                text_content = text_content.upper()  # Convert all text to uppercase
-                                            # if font_caps == 1:
-                                            #     text_content = "".join([char.upper() if char.islower() else char for char in text_content])
-                                            else:
-                                                text_content
-
-
-                                            centers = pp.engine_dict.get('StyleRun', {})
-                                            run_array = centers.get('RunArray', [{}])
-                                            fill_color = run_array[0].get('StyleSheet', {}).get('StyleSheetData', {}).get('FillColor', {}).get('Values', None)
-                                            stroke_color = run_array[0].get('StyleSheet', {}).get('StyleSheetData', {}).get('StrokeColor', {}).get('Values', None)
-                                            if fill_color:
-                                                rgb_fill = rgba_to_rgb(fill_color)
-
-                                            if stroke_color:
-                                                rgb_stroke = rgba_to_rgb(stroke_color)
-                                            rgb_color = rgb_fill
-
-                                            # fontset = pp.resource_dict['FontSet']
-
-                                            fontset = pp.resource_dict['FontSet']
-                                            fontsGet = str(fontset[0]['Name']).strip("'\"")
-                                            
-                                            family, font_weight_name, weight_value, type_font = extract_font_weight(fontsGet)
-
-                                    except Exception as e:
-                                        print(f"Error accessing engine dict data: {e}")
-                                
-                                else:
-                                    print("Engine dict not available.")
-                            
-                        else:
-                            print("This is not a text layer.")
-
-
-                        # process_layer(pp, html_content, css_content)
-                        sub_heading = f"sd_txta_Sub-Heading-{incre}"    
-                        if "offer" in layer.name:
-                            sequenceOrder_layer["offer"].append(f'<div class="offerwrap animate_fadeIn delay_0s"><div class="offerBox" id="sd_txta_Offer-text">')
-                            sequenceOrder_layer["offer"].append(f'{text_content}')
-                            sequenceOrder_layer["offer"].append('</div></div>')
-
-                            css_content.append(f"""
-                            .offerBox {{
-                                width: {width}px;
-                                height: {height}px;
-                                position: absolute;
-                                left: {x1 - xe2}px;
-                                top: {y1 - ye2}px;
-                                font-size: {font_sized}px;
-                                font-family: '{family}', serif;
-                                font-weight: {weight_value};
-                                font-style: {type_font};
-                                color: rgb{rgb_color};
-                                line-height: {line_height_em}em;
-                                text-align: {text_align};
-                            }}
-                                        """)
-
-
-                        if "contactWrap" in layer.name:
-                            shapeWrap =  ' id="sd_bgcolor_Contact-Background"'
-                            print(f"newww: {pp.name}")
-                            if "contactBackground" in pp.name:
-                                contentBgx1, contentBgy1, contentBgx2, contentBgy2 = pp.bbox
-                                contentBgWidth = contentBgx2 - contentBgx1
-                                contentBgHeight = contentBgy2 - contentBgy1    
-                                # html_content.append(f'<div class="outer contactWrap" id="sd_txta-BGGG">')
-                                # html_content.append('</div>')
-                                bgContact = get_better_color(layer)
-                                css_content.append(f"""
-                                    .contactWrap {{
-                                            width: {contentBgWidth}px;
-                                            height: {contentBgHeight}px;
-                                            position: absolute;
-                                            left: {contentBgx1}px;
-                                            top: {contentBgy1}px;
-                                            background: rgb{bgContact};
-                                        }}
-                                    """)
-                            if "contactArea" in pp.name:
-                                cx1, cy1, cx2, cy2 = pp.bbox
-                                AreaConWidth = cx2 - cx1 -2
-                                AreaConHeight = cy2 - cy1 -2
-
-                            if "contactArea" not in getattr(pp, "name", "") and "contactBackground" not in getattr(pp, "name", ""):
-                                if pp.kind == 'type':
-                                    contactWidth, contactHeight, tx1, ty1 = get_text_layer_dimensions(pp)
-                                if checkHtmlContactWrap == 1:
-                                    classForContact = "tel"
-                                    idContact = "Tel"
-                                    sequenceOrder_layer.append(f'<div class="contactWrap"{shapeWrap}>')
-                                else:
-                                    classForContact = "email"
-                                    idContact = "Email"
-
-                                sequenceOrder_layer.append(f'<div class="{classForContact}" id="sd_txta-{idContact}">')
-                                sequenceOrder_layer.append(f'{text_content}')
-                                sequenceOrder_layer.append('</div>')
-                                if checkHtmlContactWrap == 2:  
-                                    sequenceOrder_layer.append('</div>')  
-                                checkHtmlContactWrap += 1 
-                                
-                                if checkAppendContactWrap == 1:    
-                                    css_content.append(f"""
-                                        .tel {{
-                                            width: {AreaConWidth}px;
-                                            height: {contactHeight}px;
-                                            font-size: {font_sized}px;
-                                            font-family: '{family}', serif;
-                                            font-weight: {weight_value};
-                                            font-style: {type_font};
-                                            color: rgb{rgb_color};
-                                            line-height: {line_height_em}em;
-                                            text-align: {text_align};
-                                            position: absolute;
-                                            left: {tx1 - xe2}px;
-                                            top: {ty1 - xe2}px;
-                                        }}
-
-                                            """)
-                                if checkAppendContactWrap == 2:            
-                                    css_content.append(f"""
-                                        .email {{
-                                            width: {AreaConWidth}px;
-                                            height: {contactHeight}px;
-                                            font-size: {font_sized}px;
-                                            font-family: '{family}', serif;
-                                            font-weight: {weight_value};
-                                            font-style: {type_font};
-                                            color: rgb{rgb_color};
-                                            line-height: {line_height_em}em;
-                                            text-align: {text_align};
-                                            position: absolute;
-                                            left: {tx1 - xe2}px;
-                                            top: {ty1 - xe2}px;
-                                        }}
-
-                                            """)        
-                                checkAppendContactWrap += 1
-                                # if checkHtmlContactWrap > 1:
-                            
-                        
-                        if "mainHeading" in layer.name:
-                            sequenceOrder_layer["mainHeading"].append(f'<div class="textWrap animate_fadeOut delay_3s"><div class="mainHeading animate_fadeIn delay_0s" id="sd_txta_Heading">')
-                            sequenceOrder_layer["mainHeading"].append(f'{text_content}')
-                            sequenceOrder_layer["mainHeading"].append('</div></div>')
-                            css_content.append(f"""
-                                .mainHeading {{
-                                    width: {width}px;
-                                    height: {height}px;
-                                    position: absolute;
-                                    left: {x1 - xe2}px;
-                                    top: {y1 - ye2}px;
-                                    font-family: '{family}', serif;
-                                    font-weight: {weight_value};
-                                    font-style: {type_font};
-                                    font-size: {font_sized}px;
-                                    color: rgb{rgb_color};
-                                    line-height: {line_height_em}em;
-                                    text-align: {text_align};
-                                }}
-                                        """)
-                        
+                    if "hero 2" in layer_roles:
+                        cssImage = 1
+                    else:    
+                        cssImage = ''
+
+                    if "imageWrap1" not in pp_roles and "imageWrap" not in pp_roles and "imageBorder" not in pp_roles:  
+                        final_path_image = encoder.filename(re.sub(r'\s+', '-', pp.name), ".jpg")
+                        hero_image = document.add("hero", section="mainImages",
+                                                  classes=[f"mainImage{countersOne}", f"imageBox{cssImage}"],
+                                                  animation=HeroAnimation)
+                        document.add("image", parent=hero_image, tag="img", id=f"{imageLayer}-{countersOne}",
+                                     asset=final_path_image, attrs={"alt": sanitized_name})
+                        countersOne += 1  
+                        idxImageOne += 1    
+                    if countersOne == 2:
+                        # if x1 < 0 or y1 < 0:
+                        #     xImg = +1
+                        #     yImg = +1
+                        # else:    
+                        #     xImg = -1
+                        #     yImg = -1
+
+                        document.style(None, [f".imageBox{cssImage}"], {
+                            "width": f"{width-3}px",
+                            "height": f"{height-3}px",
+                            "position": "absolute",
+                            "left": f"{x1}px",
+                            "top": f"{y1}px",
+                            "z-index": "1",
+                            "overflow": "hidden",
+                            "border-radius": f"{border_radius}",
+                            "clip-path": f"{clip_path}",
+                            "-webkit-clip-path": f"{clip_path}",
+                        })
+                        document.style(None, [f".imageBox{cssImage} img"], {
+                            "width": f"{width-3}px",
+                            "height": f"{height-3}px",
+                            "object-fit": "cover",
+                        })
+                    HeroAnimateOne += 4    
+                    logger.info(f"Processed image: {sanitized_name}")
 
-                        if "subHeading" in layer.name:
-                            num_child_subHeading = len(layer)
-                            if num_child_subHeading > cSubheading:
-                                subHeadingAnimation = f" animate_fadeOut delay_{animateCrOut}s"
-                            else:
-                                subHeadingAnimation = ''
-                            sequenceOrder_layer["subHeading"].append(f'<div class="textWrap{subHeadingAnimation}"><div class="subHeading{incre} animate_fadeIn delay_{animateCr}s" id="{sub_heading}">')
-                            sequenceOrder_layer["subHeading"].append(f'{text_content}')
-                            sequenceOrder_layer["subHeading"].append('</div></div>')
-                            if cSubheading == 1:
-                                css_content.append(f"""
-                                .subHeading1,.subHeading2,.subHeading3 {{
-                                    width: {width}px;
-                                    height: {height}px;
-                                    position: absolute;
-                                    left: {x1 - xe2}px;
-                                    top: {y1 - ye2}px;
-                                    font-family: '{family}', serif;
-                                    font-weight: {weight_value};
-                                    font-style: {type_font};
-                                    font-size: {font_sized}px;
-                                    color: rgb{rgb_color};
-                                    line-height: {line_height_em}em;
-                                    text-align: {text_align};
-                                }}
-                                        """)
-                            incre += 1; cSubheading += 1
-                            animateCr += 4; animateCrOut += 4
-
-                        if "hero" in layer.name and "hero 2" not in layer.name:
-                            print(f"Processing hero layer: {layer.name}")
-                            cssImage = None
-                            check = None
-                            clip_paths = []
-                            for idx, child_layer in enumerate(reversed(layer)):
-                                if "imageWrap" in child_layer.name:
-                                    border_radius = "initial"
-                                    clip_path = None
-                                    wrapp_image = None
-                                    if child_layer.kind == 'shape' and hasattr(child_layer, 'vector_mask'):
-                                        if child_layer.origination:
-                                            for shape in child_layer.origination:
-                                                if 'RoundedRectangle' in str(shape):
-                                                    border_radius = broder_radius_get(shape, child_layer)
-                                                else:
-                                                    try:                                                        
-                                                        wrapp_image = child_layer.topil()
-                                                        if wrapp_image is None:
-                                                            raise ValueError("topil() returned None")
-                                                        elif not isinstance(wrapp_image, Image.Image):
-                                                            raise TypeError(f"topil() returned invalid type: {type(wrapp_image)}")
-                                                    except Exception as e:
-                                                        print(f"topil() failed: {e}")
-                                                        clip_path = "inherit"
-
-                                                    if wrapp_image:
-                                                        image_path = f"output/{file_name_t}/images/{child_layer.name}.png"
-                                                        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                                                        try:
-                                                            wrapp_image.save(image_path, "PNG")
-                                                            file_size = os.path.getsize(image_path)
-                                                            print(f"Saved image to {image_path} (Size: {file_size} bytes)")
-                                                        except Exception as e:
-                                                            print(f"Failed to save image to {image_path}: {e}")
-                                                            clip_path = "inherit"
-                                                            image_path = None
-
-                                                        if image_path:
-                                                            clip_path = image_clip_path_generate(image_path, child_layer)
-                                                            if clip_path is None:
-                                                                clip_path = "inherit"
-                                        
-                                if "imageWrap1" in child_layer.name or "imageWrap" in child_layer.name or "imageBorder" in child_layer.name:
-                                    print(f"skipping shape: {child_layer.name}")
-                                    check = child_layer.name
-                                    if "imageBorder" not in check:
-                                        x1, y1, x2, y2 = child_layer.bbox
-                                        width = x2 - x1
-                                        height = y2 - y1
-                                    continue
-                                if pp.kind not in ['pixel', 'smartobject']:
-                                    print(f"no pixel")
-                                    continue
-                                if pp.is_visible():
-                                    imgx1, imgy1, imgx2, imgy2 = child_layer.bbox
-                                    if imgx1 < 0 or imgy1 < 0:
-                                        crop_x1 = max(0, x1 - imgx1)
-                                        crop_y1 = max(0, y1 - imgy1)
-                                    else:
-                                        crop_x1 = x1 - imgx1
-                                        crop_y1 = y1 - imgy1
-
-                                    crop_x2 = min(imgx2 - imgx1, x2 - imgx1)
-                                    crop_y2 = min(imgy2 - imgy1, y2 - imgy1)
-
-                                    file_update_name = re.sub(r'\s+', '-', child_layer.name.strip())
-                                    image_path = f"output/{file_name_t}/images/{file_update_name}.jpg"
-                                    
-                                    try:
-                                        layer_image = child_layer.topil()
-                                        cropped_image = layer_image.crop((crop_x1, crop_y1, crop_x2, crop_y2))
-                                        if cropped_image.mode in ('RGBA', 'P'):
-                                            cropped_image = cropped_image.convert("RGB")
-                                        cropped_image.save(image_path, "JPEG", quality=98, optimize=True)
-
-                                    except Exception as e:
-                                        print(f"Failed to save image for {child_layer.name}: {e}")
-
-                            if countersOne == 1 or countersOne == 2 or countersOne == 3:
-                                HeroAnimation = f" animate_fadeIn delay_{HeroAnimateOne}s"
-                            else:
-                                HeroAnimation = ''         
-
-                        
-                            if "hero 2" in layer.name:
-                                cssImage = 1
-                            else:    
-                                cssImage = ''
-
-                            if "imageWrap1" not in pp.name and "imageWrap" not in pp.name and "imageBorder" not in pp.name:  
-                                final_path_image = re.sub(r'\s+', '-', pp.name)
-                                outerSection["mainImages"].append(f'<div class="mainImage{countersOne} imageBox{cssImage}{HeroAnimation}">')
-                                outerSection["mainImages"].append(f'<img src="images/{final_path_image}.jpg" alt="{sanitized_name}" id="{imageLayer}-{countersOne}" />')
-                                outerSection["mainImages"].append('</div>')
-                                countersOne += 1  
-                                idxImageOne += 1    
-                            if countersOne == 2:
-                                # if x1 < 0 or y1 < 0:
-                                #     xImg = +1
-                                #     yImg = +1
-                                # else:    
-                                #     xImg = -1
-                                #     yImg = -1
-
-                                css_content.append(f"""
-                                    .imageBox{cssImage} {{
-                                        width: {width-3}px;
-                                        height: {height-3}px;
-                                        position: absolute;
-                                        left: {x1}px;
-                                        top: {y1}px;
-                                        z-index: 1;
-                                        overflow: hidden;
-                                        border-radius: {border_radius};
-                                        clip-path: {clip_path};
-                                        -webkit-clip-path: {clip_path}
-                                    }}
-                                    .imageBox{cssImage} img {{
-                                        width: {width-3}px;
-                                        height: {height-3}px;
-                                        object-fit: cover;
-                                    }}
-                                """)
-                            HeroAnimateOne += 4    
-                            print(f"Processed image: {sanitized_name}")
+            
+                if "hero 2" in layer_roles:
+                    logger.info(f"Processing hero layer: {layer.name}")
+                    cssImage = None
+                    check = None
+                    for idx, child_layer in enumerate(reversed(layer), start=1):
+                        child_info = index[child_layer]
+
+                        if "imageWrap" in child_info.roles:
+                            border_radius = "initial"
+                            clip_path = None
 
-                    
-                        if "hero 2" in layer.name:
-                            print(f"Processing hero layer: {layer.name}")
-                            cssImage = None
-                            check = None
-                            for idx, child_layer in enumerate(reversed(layer), start=1):
-
-                                if "imageWrap" in child_layer.name:
-                                    border_radius = "initial"
-                                    clip_path = None
-
-                                    wrapp_image = None
-                                    if child_layer.kind == 'shape' and hasattr(child_layer, 'vector_mask'):
-                                        if child_layer.origination:
-                                            for shape in child_layer.origination:
-                                                if 'RoundedRectangle' in str(shape):
-                                                    border_radius = broder_radius_get(shape, child_layer)
-                                                else:
-                                                    try:                                                        
-                                                        wrapp_image = child_layer.topil()
-                                                        if wrapp_image is None:
-                                                            raise ValueError("topil() returned None")
-                                                        elif not isinstance(wrapp_image, Image.Image):
-                                                            raise TypeError(f"topil() returned invalid type: {type(wrapp_image)}")
-                                                    except Exception as e:
-                                                        print(f"topil() failed: {e}")
-                                                        clip_path = "inherit"
-
-                                                    if wrapp_image:
-                                                        image_path = f"output/{file_name_t}/images/{child_layer.name}.png"
-                                                        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                                                        try:
-                                                            wrapp_image.save(image_path, "PNG")
-                                                            file_size = os.path.getsize(image_path)
-                                                            print(f"Saved image to {image_path} (Size: {file_size} bytes)")
-                                                        except Exception as e:
-                                                            print(f"Failed to save image to {image_path}: {e}")
-                                                            clip_path = "inherit"
-                                                            image_path = None
-
-                                                        if image_path:
-                                                            clip_path = image_clip_path_generate(image_path, child_layer)
-                                                            if clip_path is None:
-                                                                clip_path = "inherit"
-
-
-
-                                if "imageWrap1" in child_layer.name or "imageWrap" in child_layer.name or "imageBorder" in child_layer.name:
-                                    print(f"skipping shape: {child_layer.name}")
-                                    check = child_layer.name
-                                    if "imageBorder" not in check:
-                                        x1, y1, x2, y2 = child_layer.bbox
-                                        width = x2 - x1
-                                        height = y2 - y1
-                                    continue
-                                if pp.kind not in ['pixel', 'smartobject']:
-                                    print(f"no pixel")
-                                    continue
-                                if pp.is_visible():
-                                    imgx1, imgy1, imgx2, imgy2 = child_layer.bbox
-                                    if imgx1 < 0 or imgy1 < 0:
-                                        crop_x1 = max(0, x1 - imgx1)
-                                        crop_y1 = max(0, y1 - imgy1)
-                                    else:
-                                        crop_x1 = x1 - imgx1
-                                        crop_y1 = y1 - imgy1
-
-                                    crop_x2 = min(imgx2 - imgx1, x2 - imgx1)
-                                    crop_y2 = min(imgy2 - imgy1, y2 - imgy1)
-
-                                    file_update_name = re.sub(r'\s+', '-', child_layer.name.strip())
-                                    image_path = f"output/{file_name_t}/images/{file_update_name}{idxImageTwo}.jpg"
-
-                                    try:
-                                        layer_image = child_layer.topil()
-                                        cropped_image = layer_image.crop((crop_x1, crop_y1, crop_x2, crop_y2))
-                                        if cropped_image.mode in ('RGBA', 'P'):
-                                            cropped_image = cropped_image.convert("RGB")
-                                        cropped_image.save(image_path, "JPEG", quality=98, optimize=True)
-                                    except Exception as e:
-                                        print(f"Failed to save image for {child_layer.name}: {e}")
-    
-                            if countersTwo == 1 or countersTwo == 2 or countersTwo == 3:
-                                HeroAnimationTwo = f" animate_fadeIn delay_{HeroAnimateTwo}_5s"
+                            wrapp_image = None
+                            if child_layer.kind == 'shape' and hasattr(child_layer, 'vector_mask'):
+                                # Vector masks give the clip-path directly; only pixels get traced.
+                                vector_clip = vector_clip_path(child_layer)
+                                if vector_clip is not None:
+                                    # A plain rectangle clips nothing the wrapper doesn't already.
+                                    vector_clip_css = "inherit" if vector_clip[0] == "rectangle" else vector_clip[1]
+                                    if not child_layer.origination:
+                                        clip_path = vector_clip_css
+                                if child_layer.origination:
+                                    for shape in child_layer.origination:
+                                        if 'RoundedRectangle' in str(shape):
+                                            border_radius = broder_radius_get(shape, child_layer)
+                                        elif vector_clip is not None:
+                                            clip_path = vector_clip_css
+                                        else:
+                                            try:                                                        
+                                                wrapp_image = composites.topil(child_layer)
+                                                if wrapp_image is None:
+                                                    raise ValueError("topil() returned None")
+                                                elif not isinstance(wrapp_image, Image.Image):
+                                                    raise TypeError(f"topil() returned invalid type: {type(wrapp_image)}")
+                                            except Exception as e:
+                                                logger.error(f"topil() failed: {e}")
+                                                clip_path = "inherit"
+
+                                            if wrapp_image and "scale" in wrapp_image.info:
+                                                logger.warning(f"Skipping clip-path of {child_layer.name}: rendered downsampled")
+                                                clip_path = "inherit"
+                                            elif wrapp_image:
+                                                with timings.span("contours", layer=child_layer.name):
+                                                    clip_path = image_clip_path_generate(image_to_array(wrapp_image), child_layer, images_dir)
+                                                if clip_path is None:
+                                                    clip_path = "inherit"
+
+
+
+                        if "imageWrap1" in child_info.roles or "imageWrap" in child_info.roles or "imageBorder" in child_info.roles:
+                            logger.debug(f"skipping shape: {child_layer.name}")
+                            check = child_layer.name
+                            if "imageBorder" not in child_info.roles:
+                                x1, y1, x2, y2 = child_info.bbox
+                                width = x2 - x1
+                                height = y2 - y1
+                            continue
+                        if pp.kind not in ['pixel', 'smartobject']:
+                            logger.debug("no pixel")
+                            continue
+                        if pp.is_visible():
+                            imgx1, imgy1, imgx2, imgy2 = child_info.bbox
+                            if imgx1 < 0 or imgy1 < 0:
+                                crop_x1 = max(0, x1 - imgx1)
+                                crop_y1 = max(0, y1 - imgy1)
                             else:
-                                HeroAnimationTwo = ''         
-
-                            # if "hero" in layer.name and "hero2" in layer.name:     
-                            #     cssImage = 1
-                            # else:
-                            #     cssImage = ''
-                            #     cssImage = cssImage.strip()
-
-                            if "hero 2" in layer.name and "hero" not in layer.name:
-                                cssImage = 1
-                            if "hero" in layer.name and "hero 2" in layer.name:
-                                cssImage = ''
-
-                            if "imageWrap1" not in pp.name and "imageWrap" not in pp.name and "imageBorder" not in pp.name:  
-                                final_path_image = re.sub(r'\s+', '-', pp.name)
-                                outerSection["mainImages"].append(f'<div class="mainImage{counter_hero2} imageBox2 {HeroAnimationTwo}">')
-                                outerSection["mainImages"].append(f'<img src="images/{final_path_image}{idxImageTwo}.jpg" alt="{sanitized_name}" id="{imageLayer}-{countersTwo}" />')
-                                outerSection["mainImages"].append('</div>')
-                                counter_hero2 += 1
-                                countersTwo += 1      
-                            if countersTwo == 2:
-                                css_content.append(f"""
-                                    .imageBox2 {{
-                                        width: {width-3}px;
-                                        height: {height-3}px;
-                                        position: absolute;
-                                        left: {x1}px;
-                                        top: {y1}px;
-                                        z-index: 1;
-                                        overflow: hidden;
-                                        border-radius: {border_radius};
-                                        clip-path: {clip_path};
-                                        -webkit-clip-path: {clip_path}
-                                    }}
-                                    .imageBox2 img {{
-                                        width: {width-3}px;
-                                        height: {height-3}px;
-                                        object-fit: cover;
-                                    }}
-                                """)
-                            HeroAnimateTwo += 4    
-                            print(f"Processed image: {sanitized_name}")
+                                crop_x1 = x1 - imgx1
+                                crop_y1 = y1 - imgy1
 
-                                    
-                        if "cta" in pp.name:
+                            crop_x2 = min(imgx2 - imgx1, x2 - imgx1)
+                            crop_y2 = min(imgy2 - imgy1, y2 - imgy1)
 
-                            # if pp.has_vector_mask():
+                            file_update_name = re.sub(r'\s+', '-', child_layer.name.strip()) + str(idxImageTwo)
+                            crop_box = (crop_x1, crop_y1, crop_x2, crop_y2)
+                            # Every pass over the group re-visits all images; encode each crop once.
+                            if encoder.encoded(file_update_name, (child_layer.layer_id, crop_box)):
+                                continue
 
-                                # def get_border_radius(layer, rendered_width=None, rendered_height=None):
-                                #     if not pp.has_vector_mask():
-                                #         print("No vector mask found")
-                                #         return None
-                                    
-                                #     vector_mask = pp.vector_mask
-                                    
-                                #     width = rendered_width if rendered_width is not None else pp.width
-                                #     height = rendered_height if rendered_height is not None else pp.height
-                                #     # print(f"Using width: {width}px, height: {height}px") print(f"Number of paths: {len(vector_mask.paths)}")
-                                    
-                                #     radii_px = []
-                                    
-                                #     for path in vector_mask.paths:
-                                #         # print(f"Processing path: {path}")print(f"Type of path: {type(path)}")print(f"Number of knots: {len(path)}")
-                                        
-                                #         for i in range(len(path)):
-                                #             knot1 = path[i]
-                                #             knot2 = path[(i + 1) % len(path)] 
-                                #             anchor1 = knot1.anchor
-                                #             anchor2 = knot2.anchor
-                                #             leaving1 = knot1.leaving
-                                #             preceding2 = knot2.preceding
-                                            
-                                #             if leaving1 != anchor1 or preceding2 != anchor2:
-                                #                 print(f"Found curved segment between {anchor1} and {anchor2}")
-                                #                 dx = anchor2[0] - anchor1[0]
-                                #                 dy = anchor2[1] - anchor1[1]
-
-                                #                 d_px = math.sqrt((dx * width)**2 + (dy * height)**2)
-                                #                 r_px = d_px / math.sqrt(2) 
-                                #                 radii_px.append(r_px)
-                                #             else:
-                                #                 print(f"Straight segment between {anchor1} and {anchor2}")
-                                    
-                                #     if radii_px:
-                                #         avg_radius = sum(radii_px) / len(radii_px)
-                                #         return avg_radius
-                                #     else:
-                                #         print("No curved segments found")
-                                #         return None
-
-                                # rendered_width = psd.width
-                                # rendered_height = psd.height 
-                                # border_radius = get_border_radius(pp, rendered_width=rendered_width, rendered_height=rendered_height)
-                                # if border_radius is not None:
-                                #     print(f"Border Radius: {border_radius:.2f}px")
-                                #     radiusGet = f'{border_radius:.2f}'
-                                #     # base_font_size = 16
-                                #     # rad_em = float(radiusGet) / base_font_size
-                                #     radius_e = radiusGet
-
-                                # vector_maskf = pp.vector_mask
-                                # for subpath in vector_maskf.paths:
-                                #     anchors = [
-                                #         (
-                                #             int(knot.anchor[0] * width),   # Scale X coordinate
-                                #             int(knot.anchor[1] * height)  # Scale Y coordinate
-                                #         )
-                                #         for knot in subpath
-                                #     ]
-                                #     print(f"Anchors for subpath: {anchors}")
-
-                                # Getting path data and radius
-                                # WIDTH_PX = width
-                                # HEIGHT_PX = height
-                                # vector_mask = pp._vector_mask
-                                # vector_data = vector_mask._data
-
-                                # if hasattr(vector_data, 'path'):
-                                #     path_items = vector_data.path._items
-                                #     if len(path_items) > 2:
-                                #         path_points = path_items[2]
-
-                                #         # Calculate radius as the actual distance between control points
-                                #         for i in range(len(path_points) - 1):
-                                #             anchor1 = getattr(path_points[i], 'anchor', None)
-                                #             anchor2 = getattr(path_points[i + 1], 'anchor', None)
-                                #             if anchor1 and anchor2:
-                                #                 # Distance between two anchor points — better for curves
-                                #                 x_diff = abs(anchor2[0] - anchor1[0])
-                                #                 y_diff = abs(anchor2[1] - anchor1[1])
-                                #                 radius_normalized = ((x_diff ** 2 + y_diff ** 2) ** 0.5) / 2
-
-                                #                 # Convert to pixels
-                                #                 border_radius_px = radius_normalized * min(WIDTH_PX, HEIGHT_PX)
-
-                                #                 # Apply scale
-                                #                 scale_factor = 2
-                                #                 border_radius_px_corrected = border_radius_px * scale_factor
-                                #                 print(f"Corrected Border Radius: {border_radius_px_corrected:.2f}px")
-                                #                 break
-
-
-
-                            if pp.origination:
-                                for shapeBtn in pp.origination:
-                                    if 'RoundedRectangle' in str(shapeBtn):
-                                        radius_e = broder_radius_get(shapeBtn, pp)
-                                        radius_e = float(radius_e.replace('px', '').split()[0])
-                                        radius_e = radius_e / 16
-                                    else:
-                                        radius_e = 0    
-                            else:
-                                radius_e = 0                
+                            try:
+                                cropped_image = composites.topil_region(child_layer, crop_box)
+                                if cropped_image.mode in ('RGBA', 'P'):
+                                    cropped_image = cropped_image.convert("RGB")
+                                encoder.save(cropped_image, file_update_name, key=(child_layer.layer_id, crop_box))
+                            except Exception as e:
+                                logger.error(f"Failed to save image for {child_layer.name}: {e}")
 
+                    if countersTwo == 1 or countersTwo == 2 or countersTwo == 3:
+                        HeroAnimationTwo = ("fadeIn", HeroAnimateTwo + 0.5)
+                    else:
+                        HeroAnimationTwo = None
+
+                    # if "hero" in layer.name and "hero2" in layer.name:     
+                    #     cssImage = 1
+                    # else:
+                    #     cssImage = ''
+                    #     cssImage = cssImage.strip()
+
+                    if "hero 2" in layer_roles and "hero" not in layer_roles:
+                        cssImage = 1
+                    if "hero" in layer_roles and "hero 2" in layer_roles:
+                        cssImage = ''
+
+                    if "imageWrap1" not in pp_roles and "imageWrap" not in pp_roles and "imageBorder" not in pp_roles:  
+                        final_path_image = encoder.filename(re.sub(r'\s+', '-', pp.name) + str(idxImageTwo), ".jpg")
+                        hero_image = document.add("hero", section="mainImages",
+                                                  classes=[f"mainImage{counter_hero2}", "imageBox2"],
+                                                  animation=HeroAnimationTwo)
+                        document.add("image", parent=hero_image, tag="img", id=f"{imageLayer}-{countersTwo}",
+                                     asset=final_path_image, attrs={"alt": sanitized_name})
+                        counter_hero2 += 1
+                        countersTwo += 1      
+                    if countersTwo == 2:
+                        document.style(None, [".imageBox2"], {
+                            "width": f"{width-3}px",
+                            "height": f"{height-3}px",
+                            "position": "absolute",
+                            "left": f"{x1}px",
+                            "top": f"{y1}px",
+                            "z-index": "1",
+                            "overflow": "hidden",
+                            "border-radius": f"{border_radius}",
+                            "clip-path": f"{clip_path}",
+                            "-webkit-clip-path": f"{clip_path}",
+                        })
+                        document.style(None, [".imageBox2 img"], {
+                            "width": f"{width-3}px",
+                            "height": f"{height-3}px",
+                            "object-fit": "cover",
+                        })
+                    HeroAnimateTwo += 4    
+                    logger.info(f"Processed image: {sanitized_name}")
 
                             
-                            if (width_psd, height_psd) in need_valid_sizes:
-                                width_contain = width_psd - 1
-                                max_width_add = float(width_contain * 0.8)
-                            else: 
-                                max_width_add = width + 2
-                                width_contain =  None
-
-                            sequenceOrder_layer["cta"].append(f'<div class="cta animate_fadeIn delay_5s">')
-                            sequenceOrder_layer["cta"].append(f'<a class="button" id="sd_btn_Click-Through-URL" target="_blank" href="http://www.ekcs.co">{text_content}')
-                            sequenceOrder_layer["cta"].append('</a>')
-                            sequenceOrder_layer["cta"].append('</div>')
-                            ctaColor = get_better_color(layer)
-                            css_lines = [".cta {"]
-                            if width_contain is not None:
-                                css_lines.append(f"    width: {width_contain}px;")
-                            else:
-                                css_lines.append(f"    width: auto;")
-
-                            css_lines.append("    display: flex;")
-                            css_lines.append("    position: absolute;")
-                            if width_contain is not None:
-                                css_lines.append(f"    left: 0px;")
-                            else:    
-                                css_lines.append(f"    left: {x1 - xe2}px;")
-                            css_lines.append(f"    top: {y1 - ye2}px;")
-                            if width_contain is not None:
-                                css_lines.append(f"    justify-content: center;")
-                            else:    
-                                css_lines.append("    text-align: center;")
-                            css_lines.append("}")
-                            css_lines.append(".button {")
-                            css_lines.append(f"    min-width: {width}px;")
-                            css_lines.append(f"    max-width: {max_width_add:.2f}px;")
-                            css_lines.append(f"    max-height: {height - 2}px;")
-                            css_lines.append(f"    font-size: {font_sized}px;")
-                            css_lines.append(f"    font-family: '{family}', serif;")
-                            css_lines.append(f"    font-weight: {weight_value};")
-                            css_lines.append(f"    font-style: {type_font};")
-                            css_lines.append("    cursor: pointer;")
-                            css_lines.append(f"    color: rgb{rgb_color};")
-                            css_lines.append("    display: inline-flex;")
-                            css_lines.append("    align-items: center;")
-                            css_lines.append("    justify-content: center;")
-                            css_lines.append(f"    background-color: rgb{ctaColor};")
-                            css_lines.append("    padding: 0.5em 0.65em 0.51em;")
-                            css_lines.append("    text-align: center;")
-                            css_lines.append(f"    line-height: {line_height_em}em;")
-                            css_lines.append(f"    border-radius: {radius_e:.2f}em;")
-                            css_lines.append("}")
-
-                            css_content.append("\n".join(css_lines))
-                        
-                        # if "contactWrap" in layer.name:
-                        #     if "contactArea" in pp.name or 'contactBackground' in pp:
-                        #         continue
-                        #     content_html_app.append(f'<div class="contactWrap animate_fadeIn delay_0s"><div class="contactText" id="sd_txta-text">')
-                        #     content_html_app.append(f'{text_content}')
-                        #     content_html_app.append('</div></div>')
-                        #     print(f"gettting {pp}")
-                        #     if pp.kind == 'type':
-                        #         wws, hhs = get_text_layer_dimensions(pp)
-                        #         print(f"sTexts: {pp} Width: {wws}px, Height: {hhs}px")
-                        #     css_content.append(f"""
-                        #     .contactWrap {{
-                        #         width: {width}px;
-                        #         height: {height}px;
-                        #         position: absolute;
-                        #         left: {x1 - xe2}px;
-                        #         top: {y1 - ye2}px;
-                        #         font-family: {fontf}', serif;
-                        #         font-weight: {fontGetWeight};
-                        #         font-size: {font_sized}px;
-                        #         color: rgb{rgb_color};
-                        #         line-height: {line_height_em}em;
-                        #         text-align: {text_align};
-                        #     }}
-
-                        #                 """)
-
-                        # if hasattr(pp, 'layers') and pp.layers:
-                        #     process_layer(pp, html_content, css_content)
-                    # for child_layer in layer:
-                    #     process_layer(child_layer, html_content, css_content)
-                        
-                    #     if hasattr(child_layer, 'text') and child_layer.text:
-                    #         text_content = child_layer.text
-                    #         print(f"Text content found: {text_content}")
-                else:
-                    print(f"Skipping unsupported layer: {layer.name}")
+                if "cta" in pp_roles:
 
+                    # if pp.has_vector_mask():
 
-            for layer in psd:
-                if hasattr(layer, "locks") and getattr(layer.locks, "transparency", False):
-                    continue
-                if layer.name == "bg":
-                    color = get_layer_color(layer)
-                    if color:
-                        print(f"backgroundColor has color: {color}")
+                        # def get_border_radius(layer, rendered_width=None, rendered_height=None):
+                        #     if not pp.has_vector_mask():
+                        #         print("No vector mask found")
+                        #         return None
+                            
+                        #     vector_mask = pp.vector_mask
+                            
+                        #     width = rendered_width if rendered_width is not None else pp.width
+                        #     height = rendered_height if rendered_height is not None else pp.height
+                        #     # print(f"Using width: {width}px, height: {height}px") print(f"Number of paths: {len(vector_mask.paths)}")
+                            
+                        #     radii_px = []
+                            
+                        #     for path in vector_mask.paths:
+                        #         # print(f"Processing path: {path}")print(f"Type of path: {type(path)}")print(f"Number of knots: {len(path)}")
+                                
+                        #         for i in range(len(path)):
+                        #             knot1 = path[i]
+                        #             knot2 = path[(i + 1) % len(path)] 
+                        #             anchor1 = knot1.anchor
+                        #             anchor2 = knot2.anchor
+                        #             leaving1 = knot1.leaving
+                        #             preceding2 = knot2.preceding
+                                    
+                        #             if leaving1 != anchor1 or preceding2 != anchor2:
+                        #                 print(f"Found curved segment between {anchor1} and {anchor2}")
+                        #                 dx = anchor2[0] - anchor1[0]
+                        #                 dy = anchor2[1] - anchor1[1]
+
+                        #                 d_px = math.sqrt((dx * width)**2 + (dy * height)**2)
+                        #                 r_px = d_px / math.sqrt(2) 
+                        #                 radii_px.append(r_px)
+                        #             else:
+                        #                 print(f"Straight segment between {anchor1} and {anchor2}")
+                            
+                        #     if radii_px:
+                        #         avg_radius = sum(radii_px) / len(radii_px)
+                        #         return avg_radius
+                        #     else:
+                        #         print("No curved segments found")
+                        #         return None
+
+                        # rendered_width = psd.width
+                        # rendered_height = psd.height 
+                        # border_radius = get_border_radius(pp, rendered_width=rendered_width, rendered_height=rendered_height)
+                        # if border_radius is not None:
+                        #     print(f"Border Radius: {border_radius:.2f}px")
+                        #     radiusGet = f'{border_radius:.2f}'
+                        #     # base_font_size = 16
+                        #     # rad_em = float(radiusGet) / base_font_size
+                        #     radius_e = radiusGet
+
+                        # vector_maskf = pp.vector_mask
+                        # for subpath in vector_maskf.paths:
+                        #     anchors = [
+                        #         (
+                        #             int(knot.anchor[0] * width),   # Scale X coordinate
+                        #             int(knot.anchor[1] * height)  # Scale Y coordinate
+                        #         )
+                        #         for knot in subpath
+                        #     ]
+                        #     print(f"Anchors for subpath: {anchors}")
+
+                        # Getting path data and radius
+                        # WIDTH_PX = width
+                        # HEIGHT_PX = height
+                        # vector_mask = pp._vector_mask
+                        # vector_data = vector_mask._data
+
+                        # if hasattr(vector_data, 'path'):
+                        #     path_items = vector_data.path._items
+                        #     if len(path_items) > 2:
+                        #         path_points = path_items[2]
+
+                        #         # Calculate radius as the actual distance between control points
+                        #         for i in range(len(path_points) - 1):
+                        #             anchor1 = getattr(path_points[i], 'anchor', None)
+                        #             anchor2 = getattr(path_points[i + 1], 'anchor', None)
+                        #             if anchor1 and anchor2:
+                        #                 # Distance between two anchor points — better for curves
+                        #                 x_diff = abs(anchor2[0] - anchor1[0])
+                        #                 y_diff = abs(anchor2[1] - anchor1[1])
+                        #                 radius_normalized = ((x_diff ** 2 + y_diff ** 2) ** 0.5) / 2
+
+                        #                 # Convert to pixels
+                        #                 border_radius_px = radius_normalized * min(WIDTH_PX, HEIGHT_PX)
+
+                        #                 # Apply scale
+                        #                 scale_factor = 2
+                        #                 border_radius_px_corrected = border_radius_px * scale_factor
+                        #                 print(f"Corrected Border Radius: {border_radius_px_corrected:.2f}px")
+                        #                 break
+
+
+
+                    if pp.origination:
+                        for shapeBtn in pp.origination:
+                            if 'RoundedRectangle' in str(shapeBtn):
+                                radius_e = broder_radius_get(shapeBtn, pp)
+                                radius_e = float(radius_e.replace('px', '').split()[0])
+                                radius_e = radius_e / 16
+                            else:
+                                radius_e = 0    
                     else:
-                        print("backgroundColor has no color.") 
-
-
-                html_content = ['<!DOCTYPE html>',
-                                '<html lang="en">',
-                                '<head>',
-                                '<meta charset="UTF-8" />',
-                                '<meta name="viewport" content="width=device-width, initial-scale=1.0" />',
-                                f'<meta name="ad.size" content="width={width_meta},height={height_meta}" />',
-                                '<meta http-equiv="X-UA-Compatible" content="ie=edge" />',
-                                f'<title>{file_name_t}</title>',
-                                '<link rel="preconnect" href="https://fonts.googleapis.com" />',
-                                '<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin />',
-                                f'<link href="https://fonts.googleapis.com/css2?family=Lato:ital,wght@0,100;0,300;0,400;0,700;0,900;1,100;1,300;1,400;1,700;1,900&display=swap" rel="stylesheet">',
-                                '<link rel="stylesheet" href="https://digital.mediaferry.com/animation.css">',
-                                '<link rel="stylesheet" href="./css/style.css" />',
-                                '</head>',
-                                '<body>',
-                                '<div class="container" id="sd_bgcolor_Main-Background">',
-                                '<a href="javascript:window.open(window.trackingUrl + window.clickTag)"></a>',
-                                '<a class="clicktru" target="_blank" href="#"></a>',
-                                # '<div class="contentSection">'
-                        ]
-                content_html_app = []
-                css_content = [
-                    '''* {
-                        margin: 0px;
-                        padding: 0px;
-                        box-sizing: border-box;
-                    }''',
-                    '''
-                    :root {
-                        --width: %(width_meta)spx;
-                        --height: %(height_meta)spx;
-                    }
-                    '''% {"width_meta": width_meta, "height_meta": height_meta},
-                    '''
-                    .container {
-                        width: %(width_meta)spx;
-                        height: %(height_meta)spx;
-                        position: relative;
-                        overflow: hidden;
-                        border: 1px solid #7a8599;
-                        background-color: rgb%(color)s;
-                    }
-                    '''% {"width_meta": width_meta, "height_meta": height_meta, "color": color},
-                    '''   .clicktru {
-                        z-index:9999; width:100%; height:100%; position:absolute;
-                    }''',
-                    '''
-                        a{
-                            text-decoration:none;
-                    } ''',
-                    '''
-                        #sd_btn_Click-Through-URL:empty{display:none;} 
-                    '''
-                    ]
-
-            for layer in psd:
-                process_layer(layer, html_content, css_content, content_html_app)
-
-            html_content.extend(outerSection.get("shapes", []))
-            html_content.extend(outerSection.get("logo", []))
-            content_html_app.extend(sequenceOrder_layer.get("mainHeading", []))
-            content_html_app.extend(sequenceOrder_layer.get("subHeading", []))
-            content_html_app.extend(sequenceOrder_layer.get("offer", []))
-            content_html_app.extend(sequenceOrder_layer.get("contactWrap", []))
-            content_html_app.extend(sequenceOrder_layer.get("cta", []))
-
-            html_content.append('<div class="contentSection">')
-            html_content.extend(content_html_app)
-            html_content.append('</div>')
-
-            html_content.extend(outerSection.get("mainImages", []))
-
-            for keyClearOuter in outerSection:
-                outerSection[keyClearOuter].clear()
-            for keyClear in sequenceOrder_layer:
-                sequenceOrder_layer[keyClear].clear()
-
-            html_content.append('''
-                </div>
-                <script>
-                    function getQueryStringValue(key) {
-                        return decodeURIComponent(window.location.search.replace(new RegExp("^(?:.*[&\\?]" + escape(key).replace(/[\\.\\+\\*]/g, "\\\\$&") + "(?:\\=([^&]*))?)?.*$", "i"), "$1"));
-                    }
-
-                    var clickTag = document.getElementById("sd_btn_Click-Through-URL").getAttribute("href");
-                    var trackingUrl = getQueryStringValue("trackurl");
-                    var resURL = trackingUrl + clickTag;
-
-                    var elements = document.getElementsByClassName("clicktru");
-
-                    for (var i = 0; i < elements.length; i++) {
-                        elements[i].setAttribute("href", resURL);
-                    }
-                </script>
-            </body>
-            </html>
-            ''')
-
-
-            with open(f'{output_dir}/index.html', 'w') as f:
-                f.write("\n".join(html_content))
-
-            with open(f'{output_dir}/css/style.css', 'w') as f:
-                f.write("\n".join(css_content))
-
-            print("HTML and CSS files generated.")
-
-            # except Exception as e:
-            #     print(f"Error processing file '{file_name}': {e}")    
-                        
-            # Write HTML to a file in the output directory
-            # html_path = os.path.join(output_dir, f"{file_name_t}.html")
-            # with open(html_path, 'w') as f:
-            #     f.write("\n".join(html_content))
+                        radius_e = 0                
 
-        # Create a zip file with all HTML files
-        output_zip_path = os.path.join(temp_dir, "converted_html.zip")
-        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as output_zip:
-            for html_file in os.listdir(output_dir):
-                html_file_path = os.path.join(output_dir, html_file)
-                output_zip.write(html_file_path, html_file)
 
-        # Read the zip file content to return it
-        with open(output_zip_path, 'rb') as f:
-            zip_content = f.read()
+                    
+                    if (width_psd, height_psd) in need_valid_sizes:
+                        width_contain = width_psd - 1
+                        max_width_add = float(width_contain * 0.8)
+                    else: 
+                        max_width_add = width + 2
+                        width_contain =  None
+
+                    cta = document.add("cta", section="cta", classes=["cta"], animation=("fadeIn", 5))
+                    button = document.add("button", parent=cta, tag="a", classes=["button"],
+                                          id="sd_btn_Click-Through-URL", text=text_content,
+                                          attrs={"target": "_blank", "href": "http://www.ekcs.co"})
+                    ctaColor = get_better_color(layer)
+                    cta_style = {}
+                    if width_contain is not None:
+                        cta_style["width"] = f"{width_contain}px"
+                    else:
+                        cta_style["width"] = "auto"
+
+                    cta_style["display"] = "flex"
+                    cta_style["position"] = "absolute"
+                    if width_contain is not None:
+                        cta_style["left"] = "0px"
+                    else:    
+                        cta_style["left"] = f"{x1 - xe2}px"
+                    cta_style["top"] = f"{y1 - ye2}px"
+                    if width_contain is not None:
+                        cta_style["justify-content"] = "center"
+                    else:    
+                        cta_style["text-align"] = "center"
+                    document.style(cta, [".cta"], cta_style, bbox=(x1, y1, width, height))
+                    document.style(button, [".button"], {
+                        "min-width": f"{width}px",
+                        "max-width": f"{max_width_add:.2f}px",
+                        "max-height": f"{height - 2}px",
+                        "font-size": f"{font_sized}px",
+                        "font-family": f"'{family}', serif",
+                        "font-weight": f"{weight_value}",
+                        "font-style": f"{type_font}",
+                        "cursor": "pointer",
+                        "color": f"rgb{rgb_color}",
+                        "display": "inline-flex",
+                        "align-items": "center",
+                        "justify-content": "center",
+                        "background-color": f"rgb{ctaColor}",
+                        "padding": "0.5em 0.65em 0.51em",
+                        "text-align": "center",
+                        "line-height": f"{line_height_em}em",
+                        "border-radius": f"{radius_e:.2f}em",
+                    })
+                
+                # if "contactWrap" in layer.name:
+                #     if "contactArea" in pp.name or 'contactBackground' in pp:
+                #         continue
+                #     content_html_app.append(f'<div class="contactWrap animate_fadeIn delay_0s"><div class="contactText" id="sd_txta-text">')
+                #     content_html_app.append(f'{text_content}')
+                #     content_html_app.append('</div></div>')
+                #     print(f"gettting {pp}")
+                #     if pp.kind == 'type':
+                #         wws, hhs = get_text_layer_dimensions(pp)
+                #         print(f"sTexts: {pp} Width: {wws}px, Height: {hhs}px")
+                #     css_content.append(f"""
+                #     .contactWrap {{
+                #         width: {width}px;
+                #         height: {height}px;
+                #         position: absolute;
+                #         left: {x1 - xe2}px;
+                #         top: {y1 - ye2}px;
+                #         font-family: {fontf}', serif;
+                #         font-weight: {fontGetWeight};
+                #         font-size: {font_sized}px;
+                #         color: rgb{rgb_color};
+                #         line-height: {line_height_em}em;
+                #         text-align: {text_align};
+                #     }}
+
+                #                 """)
+
+                # if hasattr(pp, 'layers') and pp.layers:
+                #     process_layer(pp, html_content, css_content)
+            # for child_layer in layer:
+            #     process_layer(child_layer, html_content, css_content)
+                
+            #     if hasattr(child_layer, 'text') and child_layer.text:
+            #         text_content = child_layer.text
+            #         print(f"Text content found: {text_content}")
+        else:
+            logger.warning(f"Skipping unsupported layer: {layer.name}")
+
+
+    def snapshot_images():
+        return {entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in os.scandir(images_dir) if entry.is_file()}
+
+    def process_layer_incremental(layer):
+        """Run process_layer, or replay its cached output if the layer is unchanged."""
+        targets = {"fonts": fonts.usage}
+        state = {name: globals()[name] for name in LAYER_STATE_GLOBALS if name in globals()}
+        context = {"name": file_name_t, "size": [width_psd, height_psd], "state": state,
+                   "debug_images": DEBUG_IMAGES, "encode": encoder.settings(),
+                   "clip_path_ellipse": CLIP_PATH_ELLIPSE_MODE}
+        fingerprint = layer_cache.fingerprint(layer, context)
+
+        fragment = layer_cache.load(fingerprint, images_dir, encoder)
+        if fragment is not None:
+            with timings.span("replay"):
+                document.replay(fragment["document"])
+                for target, items in fragment["appended"].items():
+                    targets[target].extend(items)
+                globals().update(fragment["state"])
+                extracted_values.update(fragment["extracted"])
+            return
+
+        lengths = {target: len(items) for target, items in targets.items()}
+        mark = len(document.journal)
+        degraded_before = memory.degraded
+        extracted_before = dict(extracted_values)
+        images_before = snapshot_images()
+        with timings.span("process_layer"):
+            process_layer(LayerView(layer, composites))
+        encoder.wait()
+
+        images_after = snapshot_images()
+        fragment = {
+            "document": document.since(mark),
+            "appended": {target: items[lengths[target]:] for target, items in targets.items()
+                         if len(items) > lengths[target]},
+            "state": {name: globals()[name] for name in LAYER_STATE_GLOBALS
+                      if name in globals() and (name not in state or globals()[name] != state[name])},
+            "extracted": {key: value for key, value in extracted_values.items()
+                          if extracted_before.get(key) != value},
+            "images": sorted(name for name, stat in images_after.items() if images_before.get(name) != stat),
+        }
+        fragment["sources"] = encoder.lossy_sources(fragment["images"])
+        if memory.degraded == degraded_before:
+            layer_cache.save(fingerprint, fragment, images_dir, encoder)
+
+    for layer in psd:
+        with timings.span("layer", layer=layer.name, kind=layer.kind):
+            process_layer_incremental(layer)
+        if memory.enabled:
+            composites.clear()
+    if layer_cache.enabled:
+        layer_cache.evict()
+    logger.info(f"Images for {file_name_t}: {encoder.close()}")
+
+    with timings.span("fonts"):
+        font_faces, missing_fonts = fonts.build()
+    document.font_faces = parse_css("".join(font_faces))
+    document.hosted_fonts = bool(missing_fonts)
+
+    with timings.span("serialize"):
+        index_html = banner_html(document, compact=OPTIMIZE_OUTPUT)
+        style_css = banner_css(document, compact=OPTIMIZE_OUTPUT)
+        manifest = banner_manifest(document)
+    if OPTIMIZE_OUTPUT:
+        logger.info(f"Optimized output for {file_name_t}: index.html {len(banner_html(document).encode())} -> "
+                    f"{len(index_html.encode())} bytes, style.css {len(banner_css(document).encode())} -> "
+                    f"{len(style_css.encode())} bytes")
+
+    with timings.span("write_html"):
+        with open(f'{output_dir}/index.html', 'w') as f:
+            f.write(index_html)
+
+        with open(f'{output_dir}/css/style.css', 'w') as f:
+            f.write(style_css)
+
+        with open(f'{output_dir}/manifest.json', 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    logger.info("HTML and CSS files generated.")
+    logger.info(f"Composite cache for {file_name_t}: {composites.stats()}")
+    composites.clear()
+    return output_dir
+
+
+def _profile_entries(profiler):
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_ENTRIES]
+    return [{"function": f"{path}:{line}({function})", "calls": calls,
+             "self_seconds": round(self_seconds, 6), "cumulative_seconds": round(cumulative, 6)}
+            for (path, line, function), (_, calls, self_seconds, cumulative, _) in rows]
+
+
+def _memory_entries():
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP_ENTRIES]
+    return {"current_bytes": current, "peak_bytes": peak,
+            "top": [{"location": str(stat.traceback), "bytes": stat.size, "count": stat.count} for stat in top]}
+
+
+def _convert_psd_file_isolated(zip_path, member, profile=()):
+    """Worker entry point: never raises, so one bad PSD can't sink the batch.
+
+    Returns (output_dir, error, report), the report holding the PSD's timing
+    spans plus cProfile/tracemalloc results for the requested ``profile`` modes.
+    """
+    global timings
+    timings = Timings()
+    profiler = cProfile.Profile() if "cprofile" in profile else None
+    if "tracemalloc" in profile:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        output_dir, error = convert_psd_file(zip_path, member), None
+    except Exception as e:
+        output_dir, error = None, f"{type(e).__name__}: {e}"
+    finally:
+        if profiler:
+            profiler.disable()
+
+    report = timings.report()
+    if profiler:
+        report["cprofile"] = _profile_entries(profiler)
+    if "tracemalloc" in profile:
+        report["tracemalloc"] = _memory_entries()
+        tracemalloc.stop()
+    return output_dir, error, report
+
+
+def convert_psd_files(zip_path, members, workers=1, profile=()):
+    """Convert PSD entries of the upload, in a process pool when workers > 1.
+
+    Yields (member, output_dir, error, report) in input order, each as soon
+    as it and everything before it has finished.
+    """
+    if workers <= 1 or len(members) <= 1:
+        for member in members:
+            yield (member, *_convert_psd_file_isolated(zip_path, member, profile))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(members))) as pool:
+        futures = [pool.submit(_convert_psd_file_isolated, zip_path, member, profile) for member in members]
+        for member, future in zip(members, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. BrokenProcessPool)
+                result = None, f"{type(e).__name__}: {e}", None
+            yield (member, *result)
+
+
+def add_output_tree(output_zip, output_dir):
+    """Add a banner's output/<name>/ tree to the zip under <name>/.
+
+    Files are copied in chunks, and JPEG/PNG data is stored rather than deflated
+    again, so memory stays bounded by zipfile's copy buffer. UNPACKAGED_FILES
+    at the top of the tree are left out.
+    """
+    output_root = os.path.dirname(output_dir)
+    for root, dirs, files in os.walk(output_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if root == output_dir and name in UNPACKAGED_FILES:
+                continue
+            file_path = os.path.join(root, name)
+            compress_type = zipfile.ZIP_STORED if os.path.splitext(name)[1].lower() in ZIP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            output_zip.write(file_path, os.path.relpath(file_path, output_root), compress_type=compress_type)
+
+
+def default_convert_workers(pool_size=1):
+    """PSD_CONVERT_WORKERS, or the CPUs split between ``pool_size`` concurrent conversions."""
+    if "PSD_CONVERT_WORKERS" in os.environ:
+        return int(os.environ["PSD_CONVERT_WORKERS"])
+    return max(1, (os.cpu_count() or 1) // pool_size)
+
+
+def convert_psd_to_html(zip_path, workers=None, output=None, timings_path=None, profile=()):
+    """Convert every PSD in the uploaded zip and write the result zip to ``output``.
+
+    ``output`` is a binary stream (it need not be seekable, e.g. stdout). Each
+    banner is appended and flushed as soon as it is converted. Without a
+    stream the zip is built in memory and returned as bytes. With
+    ``timings_path`` a JSON report of per-banner stage timings (and any
+    ``profile`` results) is written there.
+    """
+    if output is None:
+        buffer = io.BytesIO()
+        convert_psd_to_html(zip_path, workers, buffer, timings_path, profile)
+        return buffer.getvalue()
+
+    if workers is None:
+        workers = default_convert_workers()
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        psd_members = list_psd_members(zip_ref)
+    if not psd_members:
+        raise ConversionError("No PSD files found in the zip")
+
+    converted = 0
+    started = time.perf_counter()
+    run_timings = Timings()
+    banners = []
+    try:
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as output_zip:
+            for member, output_dir, error, report in convert_psd_files(zip_path, psd_members, workers, profile):
+                banners.append({"member": member, "output_dir": output_dir, "error": error, **(report or {})})
+                if error:
+                    logger.error(f"Failed to convert {member}: {error}")
+                    continue
+                try:
+                    with run_timings.span("zip", member=member):
+                        add_output_tree(output_zip, output_dir)
+                        output.flush()
+                finally:
+                    publish_output_tree(output_dir)
+                converted += 1
+    finally:
+        if timings_path:
+            write_timing_report(timings_path, {"zip_path": zip_path, "workers": workers,
+                                               "seconds": round(time.perf_counter() - started, 6),
+                                               **run_timings.report(), "banners": banners})
+    if not converted:
+        raise ConversionError("None of the PSD files could be converted")
+
+
+def write_timing_report(path, report):
+    try:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+    except OSError as e:
+        logger.warning(f"Could not write timing report {path}: {e}")
+
+
+def _rpc_convert(params):
+    timings_path = params.get("timings_path", f"{params['output_path']}.timings.json")
+    with open(params["output_path"], "wb") as f:
+        workers = params.get("workers") or default_convert_workers(WORKER_POOL_SIZE)
+        convert_psd_to_html(params["zip_path"], workers, f, timings_path,
+                            tuple(params.get("profile", PROFILE_MODES)))
+        size = f.tell()
+    return {"output_path": params["output_path"], "bytes": size, "timings_path": timings_path}
+
+
+RPC_METHODS = {
+    "ping": lambda params: "pong",
+    "convert": _rpc_convert,
+}
+
+
+def serve_worker():
+    """Answer newline-delimited JSON-RPC requests on stdin until it closes.
+
+    The modules above stay imported between requests, so a warm worker only
+    pays for the conversion itself. Stdout is reserved for responses: the
+    original descriptor is kept for RPC and fd 1 is pointed at stderr, so
+    nothing written by the converter or its pool processes can corrupt it.
+    """
+    sys.stdout.flush()
+    rpc_out = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            method = RPC_METHODS.get(request.get("method"))
+            if method is None:
+                response = {"error": {"code": -32601, "message": f"Unknown method: {request.get('method')}"}}
+            else:
+                response = {"result": method(request.get("params") or {})}
+        except Exception as e:
+            response = {"error": {"code": -32000, "message": f"{type(e).__name__}: {e}"}}
+        rpc_out.write(json.dumps({"jsonrpc": "2.0", "id": request_id, **response}) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a zip of PSD banners into HTML/CSS.")
+    parser.add_argument("zip_path", nargs="?", help="uploaded zip containing .psd files")
+    parser.add_argument("-o", "--output", default="-",
+                        help="where to write the result zip; '-' (default) streams it to stdout")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="PSDs converted in parallel (default: PSD_CONVERT_WORKERS or CPU count)")
+    parser.add_argument("--worker", action="store_true",
+                        help="serve JSON-RPC conversion requests on stdin/stdout")
+    parser.add_argument("--timings", metavar="PATH",
+                        help="write the JSON timing report here (default: <output>.timings.json)")
+    parser.add_argument("--profile", action="append", choices=("cprofile", "tracemalloc"),
+                        default=list(PROFILE_MODES), help="add cProfile or tracemalloc results to the report")
+    parser.add_argument("--max-rss", type=int, metavar="BYTES",
+                        help="memory-bounded mode: keep each conversion under this RSS (default: PSD_MAX_RSS_BYTES)")
+    parser.add_argument("--log-level", default=os.environ.get("PSD_LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+
+    # Logs always go to stderr; stdout carries nothing but the zip (or RPC).
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper(),
+                        format="%(asctime)s %(levelname)s [%(processName)s] %(message)s")
+
+    if args.max_rss is not None:
+        # Through the environment so pool processes pick it up as well.
+        os.environ[MemoryBudget.env] = str(args.max_rss)
+    if args.worker:
+        serve_worker()
+        return 0
+    if not args.zip_path:
+        parser.error("Please provide a file path")
+
+    timings_path = args.timings
+    if timings_path is None and args.output != "-":
+        timings_path = f"{args.output}.timings.json"
+    profile = tuple(args.profile)
+    try:
+        if args.output == "-":
+            convert_psd_to_html(args.zip_path, args.workers, sys.stdout.buffer, timings_path, profile)
+        else:
+            with open(args.output, "wb") as f:
+                convert_psd_to_html(args.zip_path, args.workers, f, timings_path, profile)
+    except ConversionError as e:
+        logger.error(str(e))
+        return 1
+    return 0
 
-    # Return the binary zip content (Next.js will handle it)
-    return zip_content
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Error: Please provide a file path", file=sys.stderr)
-        sys.exit(1)
-    
-    file_path = sys.argv[1]
-    zip_content = convert_psd_to_html(file_path)
-    sys.stdout.buffer.write(zip_content)  # Output binary zip content to stdout
\ No newline at end of file
+    sys.exit(main())
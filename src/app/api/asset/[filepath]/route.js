@@ -8,15 +8,26 @@ export async function GET(request, { params }) {
     const decodedFilepath = decodeURIComponent(filepath);
     const filePath = path.join(process.cwd(), "output", decodedFilepath);
 
-    const content = await fs.readFile(filePath);
+    let content = await fs.readFile(filePath);
 
     const ext = path.extname(decodedFilepath).toLowerCase();
+    if (ext === ".css") {
+      // Stylesheets are served flat from /api/asset, so point their relative
+      // font urls back at this route.
+      const bannerDir = path.posix.dirname(path.posix.dirname(decodedFilepath));
+      content = content.toString("utf8").replace(
+        /url\('\.\.\/fonts\/([^']+)'\)/g,
+        (_, font) => `url('/api/asset/${encodeURIComponent(`${bannerDir}/fonts/${font}`)}')`
+      );
+    }
     const contentType = {
       ".css": "text/css",
       ".png": "image/png",
       ".jpg": "image/jpeg",
       ".jpeg": "image/jpeg",
       ".gif": "image/gif",
+      ".webp": "image/webp",
+      ".woff2": "font/woff2",
     }[ext] || "application/octet-stream";
 
     return new NextResponse(content, {
@@ -1,7 +1,8 @@
-import { exec } from "child-process-promise";
 import path from "path";
 import fs from "fs/promises";
+import { Readable } from "stream";
 import { NextResponse } from "next/server";
+import { getConvertWorkerPool } from "@/lib/convertWorkerPool";
 
 export async function POST(request) {
   try {
@@ -16,33 +17,34 @@ export async function POST(request) {
     const uploadDir = path.join(process.cwd(), "uploads");
     await fs.mkdir(uploadDir, { recursive: true });
     const filePath = path.join(uploadDir, file.name);
+    const outputPath = `${filePath}.converted.zip`;
     const fileBuffer = await file.arrayBuffer();
     await fs.writeFile(filePath, Buffer.from(fileBuffer));
 
-    // Run the Python script
-    const pythonScriptPath = path.join(process.cwd(), "scripts", "convert_psd.py");
-    const { stdout, stderr } = await exec(`python "${pythonScriptPath}" "${filePath}"`);
-
-    // Log stderr for debugging
-    if (stderr) {
-      console.error("Python script stderr:", stderr);
-      // Only throw an error if stdout is empty (indicating a failure)
-      if (!stdout) {
-        throw new Error(stderr);
-      }
+    // Hand the conversion to a warm Python worker; it writes the zip to outputPath
+    // and a timing report next to it
+    let zipFile, size;
+    try {
+      const result = await getConvertWorkerPool().convert(filePath, outputPath);
+      // The report is removed with the zip, so log its wall time here
+      const report = await fs.readFile(result.timings_path, "utf8").then(JSON.parse, () => null);
+      console.log(`Converted ${file.name} in ${report ? `${report.seconds}s` : "an untimed run"}`);
+
+      // Stream the zip from disk; the open handle keeps it readable after unlink
+      zipFile = await fs.open(outputPath);
+      ({ size } = await zipFile.stat());
+    } finally {
+      await fs.unlink(filePath);
+      // A failed conversion can leave a partial zip behind
+      await fs.rm(outputPath, { force: true });
+      await fs.rm(`${outputPath}.timings.json`, { force: true });
     }
 
-    // The stdout is the binary zip content
-    const zipBuffer = Buffer.from(stdout, 'binary');
-
-    // Clean up
-    await fs.unlink(filePath);
-
-    // Return the zip file as a response
-    return new NextResponse(zipBuffer, {
+    return new NextResponse(Readable.toWeb(zipFile.createReadStream()), {
       status: 200,
       headers: {
         "Content-Type": "application/zip",
+        "Content-Length": String(size),
         "Content-Disposition": "attachment; filename=converted_html.zip",
       },
     });
@@ -53,4 +55,4 @@ export async function POST(request) {
       { status: 500 }
     );
   }
-}
\ No newline at end of file
+}
@@ -18,7 +18,7 @@ export async function GET(request, { params }) {
     });
 
     // Rewrite image sources (keep existing logic since it works)
-    content = content.replace(/src="(\.\/)?([^"]+\.(png|jpg|jpeg|gif))"/g, (match, dot, p1) => {
+    content = content.replace(/src="(\.\/)?([^"]+\.(png|jpg|jpeg|gif|webp))"/g, (match, dot, p1) => {
       const fullPath = path.join(baseDir, p1).replace(/\\/g, "/"); // Normalize to forward slashes
       return `src="/api/asset/${encodeURIComponent(fullPath)}"`;
     });
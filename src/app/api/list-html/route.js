@@ -7,6 +7,8 @@ async function getHtmlFiles(dir) {
 
   const htmlFiles = [];
   for (const entry of entries) {
+    // Hidden directories hold banners that are still being converted.
+    if (entry.name.startsWith(".")) continue;
     const fullPath = path.join(dir, entry.name);
     if (entry.isDirectory()) {
       // Recursively get HTML files from subdirectories
@@ -0,0 +1,185 @@
+import { spawn } from "child_process";
+import path from "path";
+import readline from "readline";
+
+// Pool of long-lived `convert_psd.py --worker` processes. Each worker keeps
+// psd_tools, OpenCV, NumPy and PIL imported between requests and speaks
+// newline-delimited JSON-RPC over stdin/stdout; its logs arrive on stderr.
+const POOL_SIZE = Number(process.env.PSD_WORKER_POOL_SIZE || 2);
+const PYTHON = process.env.PSD_WORKER_PYTHON || "python";
+const CONVERT_TIMEOUT_MS = Number(process.env.PSD_CONVERT_TIMEOUT_MS || 10 * 60 * 1000);
+const HEALTH_CHECK_INTERVAL_MS = 30 * 1000;
+const HEALTH_CHECK_TIMEOUT_MS = 5 * 1000;
+const RESTART_DELAY_MS = 1000;
+const MAX_RESTART_DELAY_MS = 30 * 1000;
+// Consecutive restarts without an answer from the worker before it gives up.
+const MAX_RESTARTS = Number(process.env.PSD_WORKER_MAX_RESTARTS || 5);
+
+class ConvertWorker {
+  constructor(id, pool) {
+    this.id = id;
+    this.pool = pool;
+    this.nextRequestId = 1;
+    this.pending = new Map();
+    this.busy = false;
+    this.failed = false;
+    this.restarts = 0;
+    this.start();
+  }
+
+  start() {
+    const scriptPath = path.join(process.cwd(), "scripts", "convert_psd.py");
+    const proc = spawn(PYTHON, [scriptPath, "--worker"], {
+      cwd: process.cwd(),
+      // Each worker sizes its PSD process pool to its share of the CPUs.
+      env: { ...process.env, PSD_WORKER_POOL_SIZE: String(POOL_SIZE) },
+      stdio: ["pipe", "pipe", "pipe"],
+    });
+    this.proc = proc;
+    this.alive = true;
+
+    // Events of a replaced process must not touch its successor.
+    const onExit = (reason) => proc === this.proc && this.handleExit(reason);
+    readline.createInterface({ input: proc.stdout }).on("line", (line) => this.handleLine(line));
+    proc.stderr.on("data", (chunk) => process.stderr.write(`[convert-worker ${this.id}] ${chunk}`));
+    // Writing to a worker that just died fails with EPIPE; unhandled, it would crash the server.
+    proc.stdin.on("error", (error) => onExit(`stdin ${error.message}`));
+    proc.on("error", (error) => onExit(error.message));
+    proc.on("exit", (code, signal) => onExit(`exited with code ${code}, signal ${signal}`));
+  }
+
+  handleLine(line) {
+    let response;
+    try {
+      response = JSON.parse(line);
+    } catch {
+      console.error(`[convert-worker ${this.id}] unexpected output: ${line}`);
+      return;
+    }
+    this.restarts = 0;
+    const request = this.pending.get(response.id);
+    if (!request) return;
+    this.pending.delete(response.id);
+    clearTimeout(request.timer);
+    if (response.error) {
+      request.reject(new Error(response.error.message));
+    } else {
+      request.resolve(response.result);
+    }
+  }
+
+  handleExit(reason) {
+    if (!this.alive) return;
+    this.alive = false;
+    for (const request of this.pending.values()) {
+      clearTimeout(request.timer);
+      request.reject(new Error(`Conversion worker ${reason}`));
+    }
+    this.pending.clear();
+    this.proc.kill("SIGKILL");
+    if (this.restarts >= MAX_RESTARTS) {
+      console.error(`[convert-worker ${this.id}] ${reason}, giving up after ${this.restarts} restarts`);
+      this.failed = true;
+      this.pool.release(this);
+      return;
+    }
+    const delay = Math.min(RESTART_DELAY_MS * 2 ** this.restarts, MAX_RESTART_DELAY_MS);
+    this.restarts += 1;
+    console.error(`[convert-worker ${this.id}] ${reason}, restarting in ${delay} ms`);
+    setTimeout(() => {
+      this.start();
+      // Pick up requests that queued while this worker was down.
+      if (!this.busy) {
+        this.busy = true;
+        this.pool.release(this);
+      }
+    }, delay);
+  }
+
+  call(method, params, timeoutMs) {
+    if (!this.alive) {
+      return Promise.reject(new Error("Conversion worker is restarting"));
+    }
+    const id = this.nextRequestId++;
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Conversion worker timed out on ${method}`));
+        // A worker that stops answering is killed; the exit handler restarts it.
+        this.proc.kill("SIGKILL");
+      }, timeoutMs);
+      this.pending.set(id, { resolve, reject, timer });
+      this.proc.stdin.write(JSON.stringify({ jsonrpc: "2.0", id, method, params }) + "\n");
+    });
+  }
+}
+
+class ConvertWorkerPool {
+  constructor(size) {
+    this.workers = Array.from({ length: size }, (_, id) => new ConvertWorker(id, this));
+    this.queue = [];
+    this.healthTimer = setInterval(() => this.checkHealth(), HEALTH_CHECK_INTERVAL_MS);
+    this.healthTimer.unref();
+  }
+
+  async checkHealth() {
+    for (const worker of this.workers) {
+      if (worker.busy || !worker.alive) continue;
+      worker.busy = true;
+      try {
+        await worker.call("ping", {}, HEALTH_CHECK_TIMEOUT_MS);
+      } catch (error) {
+        console.error(`[convert-worker ${worker.id}] health check failed: ${error.message}`);
+      } finally {
+        this.release(worker);
+      }
+    }
+  }
+
+  acquire() {
+    const worker = this.workers.find((w) => !w.busy && w.alive);
+    if (worker) {
+      worker.busy = true;
+      return Promise.resolve(worker);
+    }
+    if (this.workers.every((w) => w.failed)) {
+      return Promise.reject(new Error("Conversion workers failed to start"));
+    }
+    return new Promise((resolve, reject) => this.queue.push({ resolve, reject }));
+  }
+
+  release(worker) {
+    if (!worker.alive) {
+      worker.busy = false;
+      if (this.workers.every((w) => w.failed)) {
+        for (const waiter of this.queue.splice(0)) {
+          waiter.reject(new Error("Conversion workers failed to start"));
+        }
+      }
+      return;
+    }
+    const next = this.queue.shift();
+    if (next) {
+      next.resolve(worker);
+    } else {
+      worker.busy = false;
+    }
+  }
+
+  async convert(zipPath, outputPath) {
+    const worker = await this.acquire();
+    try {
+      return await worker.call("convert", { zip_path: zipPath, output_path: outputPath }, CONVERT_TIMEOUT_MS);
+    } finally {
+      this.release(worker);
+    }
+  }
+}
+
+export function getConvertWorkerPool() {
+  // Survive Next.js hot reloads without leaking python processes.
+  if (!globalThis.__convertWorkerPool) {
+    globalThis.__convertWorkerPool = new ConvertWorkerPool(POOL_SIZE);
+  }
+  return globalThis.__convertWorkerPool;
+}
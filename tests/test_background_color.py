@@ -0,0 +1,85 @@
+"""Background colours read from fill records or pixel samples against the full composite mean."""
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from psd_tools import PSDImage
+from psd_tools.api.layers import PixelLayer
+from psd_tools.constants import Compression, Tag
+from psd_tools.psd.descriptor import Descriptor, DescriptorBlock, Double
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import convert_psd  # noqa: E402
+
+# Per channel, in 0-255 levels.
+TOLERANCE = 2
+
+
+def composite_mean(layer):
+    return np.asarray(layer.composite().convert("RGB"), dtype=np.float64).mean(axis=(0, 1))
+
+
+def reopen(psd, tmp_path):
+    """Save and reopen, so layers come back the way uploaded PSDs are read."""
+    path = tmp_path / "banner.psd"
+    psd.save(path)
+    return PSDImage.open(path)
+
+
+def photo(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    pixels = 255 * x * (1 - y) * np.array([1.0, 0.4, 0.1]) + 200 * y * np.array([0.1, 0.5, 1.0])
+    pixels = pixels + rng.normal(0, 20, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGBA")
+
+
+def test_solid_fill_color_matches_composite(tmp_path):
+    psd = PSDImage.new("RGB", (300, 250))
+    layer = PixelLayer.frompil(Image.new("RGBA", (300, 250), (12, 130, 240, 255)), psd, "bg")
+    psd.append(layer)
+    color = Descriptor(classID=b"RGBC")
+    for key, value in ((b"Rd  ", 12.0), (b"Grn ", 130.0), (b"Bl  ", 240.0)):
+        color[key] = Double(value)
+    fill = DescriptorBlock(classID=b"null")
+    fill[b"Clr "] = color
+    layer._record.tagged_blocks.set_data(Tag.SOLID_COLOR_SHEET_SETTING, fill)
+
+    layer = reopen(psd, tmp_path)[0]
+    assert layer.kind == "solidcolorfill"
+    assert np.allclose(convert_psd.solid_fill_color(layer), composite_mean(layer), atol=TOLERANCE)
+
+
+@pytest.mark.parametrize("compression", [Compression.RAW, Compression.RLE])
+@pytest.mark.parametrize("max_samples", [convert_psd.BACKGROUND_SAMPLE_PIXELS, 2000])
+def test_sampled_mean_color_matches_composite(tmp_path, compression, max_samples):
+    psd = PSDImage.new("RGB", (728, 300))
+    psd.append(PixelLayer.frompil(photo(700, 280), psd, "bg", top=10, left=14, compression=compression))
+
+    layer = reopen(psd, tmp_path)[0]
+    assert convert_psd.solid_fill_color(layer) is None
+    sampled = convert_psd.sampled_mean_color(layer, max_samples)
+    assert sampled is not None
+    assert np.allclose(sampled, composite_mean(layer), atol=TOLERANCE)
+
+
+def test_sampled_mean_color_counts_transparent_pixels_as_white(tmp_path):
+    image = Image.new("RGBA", (400, 300), (0, 0, 0, 0))
+    ImageDraw.Draw(image).ellipse((20, 20, 380, 280), fill=(200, 30, 60, 255))
+    psd = PSDImage.new("RGB", (400, 300))
+    psd.append(PixelLayer.frompil(image, psd, "shape 1"))
+
+    layer = reopen(psd, tmp_path)[0]
+    assert np.allclose(convert_psd.sampled_mean_color(layer), composite_mean(layer), atol=TOLERANCE)
+
+
+def test_sampled_mean_color_declines_partial_opacity(tmp_path):
+    psd = PSDImage.new("RGB", (300, 250))
+    psd.append(PixelLayer.frompil(photo(300, 250), psd, "bg"))
+    psd[0].opacity = 128
+
+    layer = reopen(psd, tmp_path)[0]
+    assert convert_psd.sampled_mean_color(layer) is None
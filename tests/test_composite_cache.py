@@ -0,0 +1,26 @@
+"""CompositeCache render counting."""
+import os
+import sys
+
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.api.layers import PixelLayer
+from psd_tools.constants import Compression
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import convert_psd  # noqa: E402
+
+
+def test_topil_region_fallback_counts_one_render(tmp_path):
+    # ZIP channels can't be decoded by row, so topil_region renders the whole layer.
+    psd = PSDImage.new("RGB", (120, 80))
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (120, 80), (10, 200, 30, 255)), psd, "hero",
+                                  compression=Compression.ZIP))
+    psd.save(tmp_path / "banner.psd")
+    layer = PSDImage.open(tmp_path / "banner.psd")[0]
+
+    cache = convert_psd.CompositeCache()
+    assert cache.topil_region(layer, (10, 10, 60, 40)).size == (50, 30)
+    assert cache.topil_region(layer, (0, 0, 30, 30)).size == (30, 30)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["max_renders_per_layer"] == 1
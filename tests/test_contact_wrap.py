@@ -0,0 +1,54 @@
+"""Contact lines of a contactWrap group, whichever side of contactArea they are stacked on."""
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.api.layers import Group, PixelLayer
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+from benchmark_convert import type_layer  # noqa: E402
+
+
+def build_contact_banner(path, text_above_area):
+    psd = PSDImage.new("RGB", (300, 250))
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (300, 250), (9, 9, 90, 255)), psd, "bg"))
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (280, 100), (0, 0, 0, 255)), psd, "contentArea", top=40, left=10))
+    contact = Group.new(psd, "contactWrap")
+
+    def add_lines():
+        # The top-most line is the phone number.
+        type_layer(contact, "mail", "hello@example.com", (20, 206, 200, 220), size=12)
+        type_layer(contact, "phone", "+1 555 0100", (20, 190, 200, 204), size=12)
+
+    # Later children are stacked higher.
+    if not text_above_area:
+        add_lines()
+    PixelLayer.frompil(Image.new("RGBA", (240, 40), (0, 200, 0, 255)), contact, "contactBackground", top=185, left=10)
+    PixelLayer.frompil(Image.new("RGBA", (202, 32), (0, 180, 0, 255)), contact, "contactArea", top=188, left=14)
+    if text_above_area:
+        add_lines()
+    psd.save(path)
+
+
+@pytest.mark.parametrize("text_above_area", [True, False])
+def test_contact_lines_render_inside_contact_wrap(tmp_path, text_above_area):
+    build_contact_banner(tmp_path / "Contact.psd", text_above_area)
+    with zipfile.ZipFile(tmp_path / "contact.zip", "w") as zip_ref:
+        zip_ref.write(tmp_path / "Contact.psd", "Contact.psd")
+    env = dict(os.environ, PSD_CACHE_MAX_BYTES="0", PSD_LAYER_CACHE_MAX_BYTES="0", PSD_OPTIMIZE_OUTPUT="0")
+    subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, "convert_psd.py"), "contact.zip", "-o", "out.zip"],
+                   cwd=tmp_path, env=env, check=True, capture_output=True)
+
+    banner = tmp_path / "output" / "Contact"
+    html = (banner / "index.html").read_text()
+    css = (banner / "css" / "style.css").read_text()
+    wrap = html[html.index('<div class="contactWrap"'):]
+    assert '<div class="tel" id="sd_txta-Tel">+1 555 0100</div>' in wrap
+    assert '<div class="email" id="sd_txta-Email">hello@example.com</div>' in wrap
+    # Both lines are as wide as the contactArea, less its 1px inset on each side.
+    assert css.count("width: 200px;") == 2
@@ -0,0 +1,41 @@
+"""The ad byte budget with the layer cache: a warm run must write the same images as a cold one."""
+import os
+import subprocess
+import sys
+import zipfile
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+import benchmark_convert  # noqa: E402
+
+# Small enough that the hero images overlap past it and close() has to re-encode them.
+BUDGET = 4000
+
+
+def convert(zip_path, workdir, layer_cache_dir):
+    os.makedirs(workdir)
+    env = dict(os.environ, PSD_AD_BYTE_BUDGET=str(BUDGET), PSD_CACHE_MAX_BYTES="0",
+               PSD_LAYER_CACHE_DIR=str(layer_cache_dir), PSD_LAYER_CACHE_MAX_BYTES=str(2**30))
+    subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, "convert_psd.py"), str(zip_path), "-o", "out.zip"],
+                   cwd=workdir, env=env, check=True, capture_output=True)
+    images_dir = os.path.join(workdir, "output", "Small", "images")
+    images = {}
+    for name in sorted(os.listdir(images_dir)):
+        with open(os.path.join(images_dir, name), "rb") as f:
+            images[name] = f.read()
+    return images
+
+
+def test_warm_run_fits_the_budget_with_the_same_bytes(tmp_path):
+    psd_path = tmp_path / "Small.psd"
+    benchmark_convert.build_banner_psd(psd_path, 300, 250)
+    zip_path = tmp_path / "small.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_ref:
+        zip_ref.write(psd_path, "Small.psd")
+
+    cold = convert(zip_path, tmp_path / "cold", tmp_path / "layers")
+    assert os.listdir(tmp_path / "layers"), "the cold run should fill the layer cache"
+    warm = convert(zip_path, tmp_path / "warm", tmp_path / "layers")
+
+    assert sum(len(data) for data in cold.values()) <= BUDGET
+    assert warm == cold